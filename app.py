@@ -1,15 +1,29 @@
-from flask import Flask, render_template, request, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, jsonify, g, before_render_template, template_rendered
+from datetime import datetime, timedelta, timezone
+import functools
 import os
 import json
 import logging
-from dateutil import parser, tz
-from icalendar import Calendar, Event
-import pytz
-import uuid
+import queue
+import time
+from werkzeug.http import is_resource_modified
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import compression
+import metrics
+import notifier
+import storage
+from log_queue import configure_logging
+from shift_index import MINUTES_PER_DAY, to_minutes, format_minutes
+from template_plan import MINUTES_PER_WEEK, TemplateCache
+from ics_writer import iter_calendar, calendar_etag
+from hours_rollup import week_of, week_monday, day_label
+from interval_index import overlapping_pairs
+from schedule_generator import generate_template
+
+# Configure logging: LOG_LEVEL (default INFO) sets the level; records are
+# formatted and written by a background thread unless LOG_QUEUE=0
+configure_logging(getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+                  queued=os.environ.get('LOG_QUEUE', '1') != '0')
 logger = logging.getLogger(__name__)
 
 # Template filter for getting initials
@@ -81,7 +95,7 @@ app.config['SECRET_KEY'] = os.urandom(24)
 app.jinja_env.filters['getInitials'] = get_initials
 
 # Data file paths
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(__file__), 'data'))
 CAREGIVERS_FILE = os.path.join(DATA_DIR, 'caregivers.json')
 SHIFTS_FILE = os.path.join(DATA_DIR, 'shifts.json')
 TEMPLATES_FILE = os.path.join(DATA_DIR, 'templates.json')
@@ -89,6 +103,53 @@ NOTE_TEMPLATES_FILE = os.path.join(DATA_DIR, 'note_templates.json')
 WEEK_STATES_FILE = os.path.join(DATA_DIR, 'week_states.json')
 LAST_TEMPLATE_FILE = os.path.join(DATA_DIR, 'last_template.json')
 AUDIT_EVENTS_FILE = os.path.join(DATA_DIR, 'audit_events.json')
+SHIFTS_JOURNAL_FILE = os.path.join(DATA_DIR, 'shifts.journal')
+SHIFT_CHANGES_FILE = os.path.join(DATA_DIR, 'shift_changes.json')
+SHIFT_CHANGES_JOURNAL_FILE = os.path.join(DATA_DIR, 'shift_changes.journal')
+AUDIT_LOG_DIR = os.path.join(DATA_DIR, 'audit')
+SQLITE_DB_FILE = os.path.join(DATA_DIR, 'scheduler.db')
+# JSON backend only: per-kind change counters (see storage.DataVersions)
+DATA_VERSIONS_FILE = os.path.join(DATA_DIR, 'versions.json')
+# Per-worker metric totals merged by /metrics (see metrics.py)
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+# One Unix socket per worker streaming /api/events (see notifier.py)
+EVENTS_DIR = os.path.join(DATA_DIR, 'events')
+
+# Request, template and storage metrics served at /metrics; METRICS=0 turns
+# recording off (e.g. to measure what it costs)
+METRICS_ENABLED = os.environ.get('METRICS', '1') != '0'
+
+# Data files are written as compact JSON; set DATA_JSON_INDENT (e.g. 2) for
+# indented files. Either form reads back the same.
+DATA_JSON_INDENT = int(os.environ['DATA_JSON_INDENT']) if os.environ.get('DATA_JSON_INDENT') else None
+
+# Responses of at least GZIP_MIN_BYTES are gzipped for clients that accept
+# it (see compression.py). Level 1 already shrinks shift lists by ~90% at a
+# fraction of the CPU of higher levels; GZIP_LEVEL=0 turns compression off
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 1))
+
+# Change notifications pushed at /api/events; EVENTS=0 turns them off.
+# Every open stream holds a worker thread (see gunicorn.conf.py), so each
+# worker serves at most EVENTS_MAX_STREAMS; a stream sends a comment every
+# EVENTS_HEARTBEAT_SECONDS, which finds disconnected clients, and ends after
+# EVENTS_MAX_SECONDS, after which the browser reconnects.
+EVENTS_ENABLED = os.environ.get('EVENTS', '1') != '0'
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 24))
+EVENTS_HEARTBEAT_SECONDS = 25
+EVENTS_MAX_SECONDS = 600
+# Kinds of data a stream can follow, and the ones it follows by default
+EVENT_KINDS = ('shifts', 'templates', 'caregivers', 'week_states')
+DEFAULT_EVENT_KINDS = ('shifts', 'templates', 'caregivers')
+
+# 'json' keeps data in the files above; 'sqlite' uses SQLITE_DB_FILE
+# (run `flask --app app migrate-sqlite` once to import the JSON files).
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+
+# JSON backend only: 'journal' appends single-shift changes to
+# SHIFTS_JOURNAL_FILE and compacts them into shifts.json periodically;
+# 'snapshot' rewrites shifts.json on every change.
+SHIFTS_PERSISTENCE = os.environ.get('SHIFTS_PERSISTENCE', 'journal')
 
 # Shift definitions
 SHIFT_DEFINITIONS = {
@@ -101,9 +162,22 @@ SHIFT_DEFINITIONS = {
     'B3': {'start': '18:00', 'end': '22:00'}
 }
 
+# Window covered by the per-caregiver calendar subscription feed
+ICS_FEED_PAST_DAYS = 30
+ICS_FEED_FUTURE_DAYS = 365
+
+# Longest span a template can be applied over in one request
+MAX_TEMPLATE_WEEKS = 52
+
+# Time budget of the template generator (POST /api/templates/generate), in ms
+GENERATOR_TIME_BUDGET_MS = 500
+GENERATOR_MAX_TIME_BUDGET_MS = 5000
+
 # Audit event types
 AUDIT_EVENT_TYPES = {
     'SHIFT_ADDED': 'Shift Added',
+    'SHIFTS_ADDED': 'Shifts Added',
+    'SHIFTS_REPLACED': 'Shifts Replaced',
     'SHIFT_MODIFIED': 'Shift Modified',
     'SHIFT_DELETED': 'Shift Deleted',
     'TEMPLATE_APPLIED': 'Template Applied', 
@@ -112,6 +186,16 @@ AUDIT_EVENT_TYPES = {
     'CAREGIVER_DELETED': 'Caregiver Deleted'
 }
 
+# Audit log pagination (/api/audit-events?limit=...)
+AUDIT_PAGE_SIZE = 100
+AUDIT_MAX_PAGE_SIZE = 1000
+
+# Shift pagination (/api/shifts?limit=...&after=...) and the fields a
+# client can select with /api/shifts?fields=...
+SHIFTS_PAGE_SIZE = 500
+SHIFTS_MAX_PAGE_SIZE = 5000
+SHIFT_FIELDS = ('id', 'caregiver_id', 'shift_type', 'start', 'end', 'caregiver_name', 'color')
+
 # Default note template
 DEFAULT_NOTE_TEMPLATE = {
     "id": "default",
@@ -156,165 +240,377 @@ DEFAULT_NOTE_TEMPLATE = {
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+def create_backend(name=STORAGE_BACKEND):
+    """Create the storage backend that load_*/save_* delegate to."""
+    if name == 'sqlite':
+        from sqlite_backend import SqliteBackend
+        return SqliteBackend(SQLITE_DB_FILE)
+    if name != 'json':
+        raise ValueError(f"Unknown storage backend: {name}")
+    return storage.JsonBackend(
+        caregivers_file=CAREGIVERS_FILE,
+        shifts_file=SHIFTS_FILE,
+        shifts_journal_file=SHIFTS_JOURNAL_FILE,
+        templates_file=TEMPLATES_FILE,
+        week_states_file=WEEK_STATES_FILE,
+        audit_log_dir=AUDIT_LOG_DIR,
+        legacy_audit_events_file=AUDIT_EVENTS_FILE,
+        journal=SHIFTS_PERSISTENCE == 'journal',
+        versions_file=DATA_VERSIONS_FILE,
+        indent=DATA_JSON_INDENT,
+        changes_file=SHIFT_CHANGES_FILE,
+        changes_journal_file=SHIFT_CHANGES_JOURNAL_FILE
+    )
+
+metrics.current = metrics.Metrics(METRICS_DIR, enabled=METRICS_ENABLED)
+notifier.current = notifier.Notifier(EVENTS_DIR, enabled=EVENTS_ENABLED, max_subscribers=EVENTS_MAX_STREAMS)
+
+backend = create_backend()
+if METRICS_ENABLED:
+    # Times every backend call; storage and audit_log report bytes themselves
+    backend = metrics.InstrumentedBackend(backend, metrics.current)
+
+# Compiled offset tables for apply_template, dropped whenever templates are saved
+compiled_templates = TemplateCache(SHIFT_DEFINITIONS, normalize_day_value)
+
+def versioned(*kinds):
+    """
+    Make a GET route conditional on the change counters of the given kinds
+    of data. Responses carry a strong ETag and Last-Modified built from the
+    counters, and a request whose If-None-Match matches gets a 304 before
+    the route loads or serializes anything.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            versions, modified = backend.data_version(*kinds)
+            etag = backend.name + '-' + '-'.join(f'{kind}.{version}' for kind, version in zip(kinds, versions))
+            # Only the ETag is compared: Last-Modified has one-second
+            # resolution and could hide two saves made within the same second.
+            # A gzipped copy was sent with the suffixed ETag (see compression.py)
+            matched = next((tag for tag in (etag, etag + compression.ETAG_SUFFIX)
+                            if not is_resource_modified(request.environ, etag=tag)), None)
+            if matched is not None:
+                response = app.response_class(status=304)
+                response.set_etag(matched)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+            if modified is not None:
+                response.last_modified = datetime.fromtimestamp(modified, timezone.utc)
+            # Cached copies must be revalidated, which is what the ETag is for
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def serialized(view):
+    """
+    Run a route that reads, modifies and writes data under the backend's
+    writer lock, so requests in other threads or gunicorn workers cannot
+    write in between (no lost updates, no duplicate ids, no check that is
+    stale by the time of the write). Reads never take the lock.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with backend.locked():
+            return view(*args, **kwargs)
+    return wrapper
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its latency, labelled by URL rule rather than path."""
+    started = g.pop('request_started', None)
+    if started is None or not METRICS_ENABLED:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.current.record_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Registered after record_request_metrics, so it runs first and the
+    # compression time is part of the measured latency
+    if GZIP_LEVEL:
+        compression.gzip_response(request, response, GZIP_MIN_BYTES, GZIP_LEVEL)
+    return response
+
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+def record_template_metrics(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        metrics.current.record_render(template.name or 'string', time.perf_counter() - started)
+
+if METRICS_ENABLED:
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template_metrics, app)
+
 def load_audit_events():
-    """Load audit events from the JSON file."""
+    """Load all audit events."""
     try:
-        if os.path.exists(AUDIT_EVENTS_FILE):
-            with open(AUDIT_EVENTS_FILE, 'r') as f:
-                return json.load(f)
-        return []
+        return backend.load_audit_events()
     except Exception as e:
         logger.error(f"Error loading audit events: {str(e)}")
         return []
 
 def save_audit_events(events):
-    """Save audit events to the JSON file."""
+    """Replace all audit events."""
     try:
-        with open(AUDIT_EVENTS_FILE, 'w') as f:
-            json.dump(events, f, indent=2)
+        backend.save_audit_events(events)
     except Exception as e:
         logger.error(f"Error saving audit events: {str(e)}")
 
 def create_audit_event(event_type, user="system", details=None):
     """Create and save a new audit event."""
     try:
-        events = load_audit_events()
-        new_event = {
-            "id": str(len(events) + 1),
-            "type": event_type,
-            "user": user,
-            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "details": details or {}
-        }
-        events.append(new_event)
-        save_audit_events(events)
-        return new_event
+        return backend.append_audit_event(event_type, user, details)
     except Exception as e:
         logger.error(f"Error creating audit event: {str(e)}")
         return None
 
 def load_caregivers():
-    if os.path.exists(CAREGIVERS_FILE):
-        with open(CAREGIVERS_FILE, 'r') as f:
-            caregivers = json.load(f)
-            # Ensure each caregiver has a color
-            for i, caregiver in enumerate(caregivers):
-                if 'color' not in caregiver:
-                    # Generate a color based on ID
-                    caregiver['color'] = f'#{"".join([hex((i+1)*30)[2:].zfill(2) for _ in range(3)])}'
-            save_caregivers(caregivers)  # Save the updated data
-            return caregivers
-    return []
+    return fill_caregiver_colors(backend.load_caregivers())
+
+def fill_caregiver_colors(caregivers):
+    """Give every caregiver without a color one based on its position. Returns the list."""
+    for i, caregiver in enumerate(caregivers):
+        if 'color' not in caregiver:
+            caregiver['color'] = f'#{"".join([hex((i+1)*30)[2:].zfill(2) for _ in range(3)])}'
+    return caregivers
 
 def save_caregivers(caregivers):
-    with open(CAREGIVERS_FILE, 'w') as f:
-        json.dump(caregivers, f, indent=2)
+    backend.save_caregivers(caregivers)
 
 def load_shifts():
     try:
-        logger.info("Loading shifts from file")
-        if os.path.exists(SHIFTS_FILE):
-            with open(SHIFTS_FILE, 'r') as f:
-                shifts = json.load(f)
-                logger.info(f"Successfully loaded {len(shifts)} shifts")
-                # Validate shift data
-                for shift in shifts:
-                    if not all(key in shift for key in ['id', 'caregiver_id', 'start', 'end', 'shift_type']):
-                        logger.warning(f"Invalid shift data found: {shift}")
-                return shifts
-        logger.info("No shifts file found, returning empty list")
-        return []
-    except json.JSONDecodeError as e:
-        logger.error(f"Error decoding shifts file: {str(e)}")
+        if backend.has('shifts'):
+            shifts = backend.all_shifts()
+            logger.debug("Loaded %d shifts", len(shifts))
+            # Validate shift data
+            for shift in shifts:
+                if not all(key in shift for key in ['id', 'caregiver_id', 'start', 'end', 'shift_type']):
+                    logger.warning(f"Invalid shift data found: {shift}")
+            return shifts
+        logger.info("No shifts saved yet, returning empty list")
         return []
     except Exception as e:
+        # Not turned into an empty list: a caller could save that back
         logger.error(f"Unexpected error loading shifts: {str(e)}", exc_info=True)
-        return []
+        raise
+
+def normalize_shift(shift):
+    """Validate a shift in place and store its times as 'YYYY-MM-DD HH:MM'."""
+    if not all(key in shift for key in ['id', 'caregiver_id', 'start', 'end', 'shift_type']):
+        raise ValueError(f"Invalid shift data: {shift}")
+    
+    # Validate shift times (stored as ordinal minutes, see shift_index)
+    try:
+        start = to_minutes(shift['start'])
+        end = to_minutes(shift['end'])
+        
+        # CRITICAL FIX: Do NOT automatically adjust dates - respect what UI sent
+        # Only adjust dates if they're different AND the end time is before the start time
+        start_date = start // MINUTES_PER_DAY
+        end_date = end // MINUTES_PER_DAY
+        
+        # Only adjust if end date is actually before start date
+        if end_date < start_date:
+            logger.warning(f"End date is before start date for shift {shift['id']} - adjusting")
+            end += MINUTES_PER_DAY
+        # For same-day shifts, check if we need to adjust for overnight
+        elif end_date == start_date and end <= start:
+            # Check if this is A1 shift specifically (00:01 - 08:00)
+            # A1 is treated as not crossing midnight despite its time values
+            if shift['shift_type'] == 'A1':
+                logger.debug("Preserving A1 shift on same day: %s", shift)
+            else:
+                # For other shifts that might cross midnight, add a day
+                logger.debug("Adjusting overnight shift: %s", shift)
+                end += MINUTES_PER_DAY
+        
+        shift['start'] = format_minutes(start)
+        shift['end'] = format_minutes(end)
+        
+    except (ValueError, TypeError) as e:
+        logger.error(f"Invalid shift times: {shift}")
+        raise ValueError(f"Invalid shift times: {str(e)}")
+    return shift
 
 def save_shifts(shifts):
+    """Replace every shift (a fresh snapshot in the JSON backend)."""
     try:
-        logger.info(f"Saving {len(shifts)} shifts to file")
         # Validate shifts before saving
         for shift in shifts:
-            if not all(key in shift for key in ['id', 'caregiver_id', 'start', 'end', 'shift_type']):
-                raise ValueError(f"Invalid shift data: {shift}")
-            
-            # Validate shift times
-            try:
-                start = parser.parse(shift['start'])
-                end = parser.parse(shift['end'])
-                
-                # CRITICAL FIX: Do NOT automatically adjust dates - respect what UI sent
-                # Only adjust dates if they're different AND the end time is before the start time
-                start_date = start.date()
-                end_date = end.date()
-                
-                # Only adjust if end date is actually before start date
-                if end_date < start_date:
-                    logger.warning(f"End date {end_date} is before start date {start_date} for shift {shift['id']} - adjusting")
-                    end += timedelta(days=1)
-                # For same-day shifts, check if we need to adjust for overnight
-                elif end_date == start_date and end <= start:
-                    # Check if this is A1 shift specifically (00:01 - 08:00)
-                    # A1 is treated as not crossing midnight despite its time values
-                    if shift['shift_type'] == 'A1':
-                        logger.info(f"Preserving A1 shift on same day: {shift}")
-                    else:
-                        # For other shifts that might cross midnight, add a day
-                        logger.info(f"Adjusting overnight shift: {shift}")
-                        end += timedelta(days=1)
-                
-                shift['start'] = start.strftime('%Y-%m-%d %H:%M')
-                shift['end'] = end.strftime('%Y-%m-%d %H:%M')
-                logger.info(f"Saved shift times: {shift['start']} to {shift['end']}")
-                
-            except (ValueError, TypeError) as e:
-                logger.error(f"Invalid shift times: {shift}")
-                raise ValueError(f"Invalid shift times: {str(e)}")
+            normalize_shift(shift)
+        backend.replace_shifts(shifts)
+        logger.info(f"Saved {len(shifts)} shifts to file")
+    except Exception as e:
+        logger.error(f"Error saving shifts: {str(e)}", exc_info=True)
+        raise
 
-        # Ensure data directory exists
-        os.makedirs(os.path.dirname(SHIFTS_FILE), exist_ok=True)
-        
-        with open(SHIFTS_FILE, 'w') as f:
-            json.dump(shifts, f, indent=2)
-        logger.info("Successfully saved shifts to file")
+def write_shifts(puts=(), deletes=()):
+    """
+    Persist individual shift changes: delete the given shift ids, then
+    insert or replace the given shifts. Costs O(changes), not O(all shifts).
+    """
+    try:
+        for shift in puts:
+            normalize_shift(shift)
+        backend.write_shifts(puts=puts, deletes=deletes)
+        logger.info(f"Saved {len(puts)} shift(s), deleted {len(deletes)}")
     except Exception as e:
         logger.error(f"Error saving shifts: {str(e)}", exc_info=True)
         raise
 
 def load_templates():
-    if os.path.exists(TEMPLATES_FILE):
-        with open(TEMPLATES_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return backend.load_templates()
 
 def save_templates(templates):
-    with open(TEMPLATES_FILE, 'w') as f:
-        json.dump(templates, f, indent=2)
+    backend.save_templates(templates)
+    compiled_templates.invalidate()
 
 def load_note_templates():
-    if os.path.exists(NOTE_TEMPLATES_FILE):
-        with open(NOTE_TEMPLATES_FILE, 'r') as f:
-            templates = json.load(f)
-            # Ensure default template exists
-            if not any(t['id'] == 'default' for t in templates):
-                templates.append(DEFAULT_NOTE_TEMPLATE)
-            return templates
+    templates = storage.read_json(NOTE_TEMPLATES_FILE)
+    if templates is not None:
+        # Ensure default template exists
+        if not any(t['id'] == 'default' for t in templates):
+            templates.append(DEFAULT_NOTE_TEMPLATE)
+        return templates
     return [DEFAULT_NOTE_TEMPLATE]
 
 def save_note_templates(templates):
-    with open(NOTE_TEMPLATES_FILE, 'w') as f:
-        json.dump(templates, f, indent=2)
+    storage.write_json(NOTE_TEMPLATES_FILE, templates, indent=DATA_JSON_INDENT)
 
 def calculate_hours(shifts, caregiver_id):
-    total_hours = 0
+    total_minutes = 0
     for shift in shifts:
         if shift['caregiver_id'] == caregiver_id:
-            start = parser.parse(shift['start'])
-            end = parser.parse(shift['end'])
-            duration = end - start
-            total_hours += duration.total_seconds() / 3600
-    return total_hours
+            total_minutes += to_minutes(shift['end']) - to_minutes(shift['start'])
+    return total_minutes / 60
+
+def parse_shift_time(value):
+    """
+    Parse a shift time sent by a client. ISO 8601 ('2025-06-02 10:00') is
+    parsed directly; anything else goes through dateutil, which is only
+    imported the first time such a value shows up.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        from dateutil import parser
+        return parser.parse(value)
+
+def request_flag(name):
+    """True if the query string turns the named flag on (?name=1/true/yes)."""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+def hours_violations(added=(), removed=(), caregivers=None):
+    """
+    Check caregivers' max_hours (a weekly limit) against a set of shift
+    changes. Only the caregiver-weeks the changes add time to are checked,
+    each with one lookup in the hours rollup, so the cost does not depend
+    on how many shifts are stored. Returns the weeks that would go over.
+    """
+    delta = {}
+    for sign, shifts in ((1, added), (-1, removed)):
+        for shift in shifts:
+            start = to_minutes(shift['start'])
+            key = (str(shift['caregiver_id']), week_of(start // MINUTES_PER_DAY))
+            delta[key] = delta.get(key, 0) + sign * (to_minutes(shift['end']) - start)
+    increased = sorted(key for key, minutes in delta.items() if minutes > 0)
+    if not increased:
+        return []
+    
+    if caregivers is None:
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+    worked = backend.week_minutes(increased)
+    violations = []
+    for caregiver_id, week in increased:
+        caregiver = caregivers.get(caregiver_id)
+        if not caregiver or not caregiver.get('max_hours'):
+            continue
+        total = worked[(caregiver_id, week)] + delta[(caregiver_id, week)]
+        if total > int(caregiver['max_hours']) * 60:
+            violations.append({
+                'caregiver_id': caregiver_id,
+                'name': caregiver['name'],
+                'week': day_label(week_monday(week)),
+                'hours': round(total / 60, 2),
+                'max_hours': caregiver['max_hours']
+            })
+    return violations
+
+def overlap_conflicts(added=(), removed=(), caregivers=None):
+    """
+    Double bookings a set of shift changes would create. Each added shift
+    is checked against its caregiver's stored shifts (ignoring removed
+    ones) through the interval index, O(log n) per shift, and against the
+    other added shifts with one sorted sweep per caregiver.
+    """
+    if caregivers is None:
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+    skip_ids = {str(s['id']) for s in removed}
+    pairs = []
+    added_by_caregiver = {}
+    for shift in added:
+        start, end = to_minutes(shift['start']), to_minutes(shift['end'])
+        added_by_caregiver.setdefault(str(shift['caregiver_id']), []).append((start, end, shift))
+        for other in backend.overlapping_shifts(shift['caregiver_id'], start, end):
+            if str(other['id']) not in skip_ids and str(other['id']) != str(shift.get('id')):
+                pairs.append((shift, other))
+    for entries in added_by_caregiver.values():
+        entries.sort(key=lambda entry: entry[:2])
+        pairs.extend(overlapping_pairs(entries))
+    return [conflict_entry(a, b, caregivers) for a, b in pairs]
+
+def conflict_entry(shift, other, caregivers):
+    """Report one overlap, earlier shift first."""
+    first, second = sorted((shift, other), key=lambda s: (to_minutes(s['start']), str(s['id'])))
+    caregiver = caregivers.get(str(first['caregiver_id']), {})
+    fields = ('id', 'shift_type', 'start', 'end')
+    return {
+        'caregiver_id': str(first['caregiver_id']),
+        'name': caregiver.get('name'),
+        'shift': {k: first.get(k) for k in fields},
+        'overlaps': {k: second.get(k) for k in fields}
+    }
+
+def check_shift_write(added=(), removed=(), caregivers=None):
+    """
+    Write-time checks for a set of shift changes: double bookings and
+    caregivers' max_hours. Returns (report, refusal): report holds the
+    'conflicts' and 'violations' found, refusal is a 409 response unless
+    the request accepts them with ?allow_overlap=1 / ?allow_overtime=1.
+    """
+    if caregivers is None:
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+    report = {
+        'conflicts': overlap_conflicts(added, removed, caregivers),
+        'violations': hours_violations(added, removed, caregivers)
+    }
+    problems = []
+    if report['conflicts'] and not request_flag('allow_overlap'):
+        problems.append('Double-booked: ' + ', '.join(
+            f"{c['name']} {c['shift']['start']} - {c['shift']['end']} / {c['overlaps']['start']} - {c['overlaps']['end']}"
+            for c in report['conflicts']))
+    if report['violations'] and not request_flag('allow_overtime'):
+        problems.append('Exceeds maximum hours: ' + ', '.join(
+            f"{v['name']} {v['hours']}h/{v['max_hours']}h (week of {v['week']})" for v in report['violations']))
+    if problems:
+        return report, (jsonify(dict(report, error='; '.join(problems))), 409)
+    return report, None
+
+def write_warnings(report):
+    """The non-empty parts of a check_shift_write report, to flag in a write's response."""
+    return {key: value for key, value in report.items() if value}
 
 def calculate_shift_times(date_str, shift_type):
     shift_def = SHIFT_DEFINITIONS[shift_type]
@@ -327,41 +623,69 @@ def calculate_shift_times(date_str, shift_type):
     
     return start_time, end_time
 
+# Set once init_data() has run in this process
+data_initialized = False
+
 def init_data():
+    """
+    Startup hook: create whatever data is missing, persist generated
+    caregiver colors and load the shift store so the first request does not
+    pay for it. Idempotent, and the writes hold the writer lock, so every
+    worker can run it. __main__ calls it before app.run(); under gunicorn
+    the hooks in gunicorn.conf.py do. Repeat calls in the same process
+    return immediately.
+    """
+    global data_initialized
+    if data_initialized:
+        return
+    started = datetime.now()
     try:
-        # Initialize with sample data if files don't exist
-        if not os.path.exists(CAREGIVERS_FILE):
-            sample_caregivers = [
-                {'id': i, 'name': f'Caregiver {i}', 'max_hours': 40, 'color': f'#{"".join([hex(i*30)[2:].zfill(2) for _ in range(3)])}'}
-                for i in range(1, 8)
-            ]
-            save_caregivers(sample_caregivers)
-            logger.info("Sample caregivers data created")
-
-        if not os.path.exists(SHIFTS_FILE):
-            save_shifts([])
-            logger.info("Shifts file created")
-
-        if not os.path.exists(TEMPLATES_FILE):
-            save_templates([])
-            logger.info("Templates file created")
-            
-        if not os.path.exists(NOTE_TEMPLATES_FILE):
-            save_note_templates([DEFAULT_NOTE_TEMPLATE])
-            logger.info("Note templates created")
-            
-        if not os.path.exists(AUDIT_EVENTS_FILE):
-            save_audit_events([])
-            logger.info("Audit events file created")
-            
-        if not os.path.exists(WEEK_STATES_FILE):
-            save_week_states({})
-            logger.info("Week states file created")
-
+        with backend.locked():
+            create_missing_data()
+        backend.preload()
+        data_initialized = True
+        logger.info(f"Data initialized in {(datetime.now() - started).total_seconds() * 1000:.1f} ms")
     except Exception as e:
         logger.error(f"Error initializing data: {str(e)}")
         raise
 
+def create_missing_data():
+    """Create the data that has not been saved yet (see init_data)."""
+    # Initialize with sample data if nothing has been saved yet
+    if not backend.has('caregivers'):
+        sample_caregivers = [
+            {'id': i, 'name': f'Caregiver {i}', 'max_hours': 40, 'color': f'#{"".join([hex(i*30)[2:].zfill(2) for _ in range(3)])}'}
+            for i in range(1, 8)
+        ]
+        save_caregivers(sample_caregivers)
+        logger.info("Sample caregivers data created")
+
+    if not backend.has('shifts'):
+        save_shifts([])
+        logger.info("Shifts file created")
+
+    if not backend.has('templates'):
+        save_templates([])
+        logger.info("Templates file created")
+        
+    if not os.path.exists(NOTE_TEMPLATES_FILE):
+        save_note_templates([DEFAULT_NOTE_TEMPLATE])
+        logger.info("Note templates created")
+        
+    if not backend.has('audit_events'):
+        save_audit_events([])
+        logger.info("Audit events file created")
+        
+    if not backend.has('week_states'):
+        save_week_states({})
+        logger.info("Week states file created")
+    
+    # Caregivers saved without a color get the one load_caregivers() would generate
+    caregivers = backend.load_caregivers()
+    if any('color' not in c for c in caregivers):
+        save_caregivers(fill_caregiver_colors(caregivers))
+        logger.info("Caregiver colors saved")
+
 # Routes
 @app.route('/')
 def index():
@@ -388,10 +712,11 @@ def schedule():
         return "An error occurred while loading the schedule", 500
 
 @app.route('/api/templates', methods=['POST'])
+@serialized
 def save_template():
     try:
         template_data = request.json
-        logger.info(f"Received template data: {json.dumps(template_data, indent=2)}")
+        logger.debug("Received template data: %s", template_data)
         
         templates = load_templates()
         
@@ -426,7 +751,7 @@ def save_template():
             # Update existing template instead of creating a new one
             existing_template['shifts'] = template_data['shifts']
             save_templates(templates)
-            logger.info(f"Updated existing template: {json.dumps(existing_template, indent=2)}")
+            logger.info(f"Updated existing template {existing_template['id']} ({len(existing_template['shifts'])} shifts)")
             return jsonify(existing_template)
             
         # Create new template with unique ID
@@ -434,13 +759,14 @@ def save_template():
         template_data['id'] = str(max_id + 1)
         templates.append(template_data)
         save_templates(templates)
-        logger.info(f"Saved new template: {json.dumps(template_data, indent=2)}")
+        logger.info(f"Saved new template {template_data['id']} ({len(template_data['shifts'])} shifts)")
         return jsonify(template_data)
     except Exception as e:
         logger.error(f"Error in save_template: {str(e)}")
         return jsonify({'error': 'An error occurred while saving template'}), 500
 
 @app.route('/api/templates', methods=['GET'])
+@versioned('templates')
 def get_templates():
     try:
         templates = load_templates()
@@ -452,6 +778,7 @@ def get_templates():
         return jsonify({'error': 'An error occurred while fetching templates'}), 500
 
 @app.route('/api/templates/<template_id>', methods=['DELETE'])
+@serialized
 def delete_template(template_id):
     try:
         templates = load_templates()
@@ -463,6 +790,7 @@ def delete_template(template_id):
         return jsonify({'error': 'An error occurred while deleting template'}), 500
 
 @app.route('/api/templates/<int:template_id>', methods=['GET'])
+@versioned('templates', 'caregivers')
 def get_template(template_id):
     try:
         templates = load_templates()
@@ -483,7 +811,55 @@ def get_template(template_id):
         logger.error(f"Error getting template {template_id}: {str(e)}")
         return jsonify({'error': 'Failed to get template'}), 500
 
+@app.route('/api/templates/generate', methods=['POST'])
+def generate_schedule_template():
+    """
+    Generate a template that meets a coverage requirement. The body has
+    coverage ({shift type: count, or seven daily counts from Monday}),
+    optionally caregiver_ids (defaults to every caregiver) and
+    time_budget_ms. Nothing is saved: the result can be reviewed and then
+    posted to /api/templates.
+    """
+    try:
+        data = request.json or {}
+        if 'coverage' not in data:
+            return jsonify({'error': 'Missing coverage'}), 400
+        
+        caregivers = load_caregivers()
+        if 'caregiver_ids' in data:
+            wanted = {str(cid) for cid in data['caregiver_ids']}
+            caregivers = [c for c in caregivers if str(c['id']) in wanted]
+        if not caregivers:
+            return jsonify({'error': 'No caregivers to schedule'}), 400
+        
+        try:
+            budget = min(int(data.get('time_budget_ms', GENERATOR_TIME_BUDGET_MS)), GENERATOR_MAX_TIME_BUDGET_MS)
+            started = datetime.now()
+            result = generate_template(data['coverage'], caregivers, SHIFT_DEFINITIONS, time_budget=budget / 1000)
+            elapsed = datetime.now() - started
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        hours = [{
+            'caregiver_id': str(c['id']),
+            'name': c['name'],
+            'hours': round(result['minutes'][str(c['id'])] / 60, 2),
+            'max_hours': c.get('max_hours')
+        } for c in caregivers]
+        logger.info(f"Generated template: {len(result['shifts'])} shifts, "
+                    f"{sum(u['missing'] for u in result['unfilled'])} unfilled, {elapsed.total_seconds() * 1000:.1f} ms")
+        return jsonify({
+            'shifts': result['shifts'],
+            'unfilled': result['unfilled'],
+            'hours': hours,
+            'elapsed_ms': round(elapsed.total_seconds() * 1000, 1)
+        })
+    except Exception as e:
+        logger.error(f"Error in generate_schedule_template: {str(e)}")
+        return jsonify({'error': 'An error occurred while generating the template'}), 500
+
 @app.route('/api/caregivers', methods=['GET'])
+@versioned('caregivers')
 def get_caregivers():
     try:
         caregivers = load_caregivers()
@@ -493,6 +869,7 @@ def get_caregivers():
         return jsonify({'error': 'An error occurred while fetching caregivers'}), 500
 
 @app.route('/api/caregivers', methods=['POST'])
+@serialized
 def add_caregiver():
     try:
         caregiver_data = request.json
@@ -527,6 +904,7 @@ def add_caregiver():
         return jsonify({'error': 'An error occurred while adding caregiver'}), 500
 
 @app.route('/api/caregivers/<int:caregiver_id>', methods=['PUT'])
+@serialized
 def update_caregiver(caregiver_id):
     try:
         caregiver_data = request.json
@@ -559,10 +937,10 @@ def update_caregiver(caregiver_id):
         return jsonify({'error': 'An error occurred while updating caregiver'}), 500
 
 @app.route('/api/caregivers/<int:caregiver_id>', methods=['DELETE'])
+@serialized
 def delete_caregiver(caregiver_id):
     try:
         caregivers = load_caregivers()
-        shifts = load_shifts()
         templates = load_templates()
         
         # Remove caregiver from list
@@ -570,8 +948,7 @@ def delete_caregiver(caregiver_id):
         save_caregivers(caregivers)
         
         # Remove caregiver's shifts
-        shifts = [s for s in shifts if int(s['caregiver_id']) != caregiver_id]
-        save_shifts(shifts)
+        write_shifts(deletes=backend.shift_ids_for_caregiver(caregiver_id))
         
         # Remove caregiver from templates
         for template in templates:
@@ -583,6 +960,93 @@ def delete_caregiver(caregiver_id):
         logger.error(f"Error in delete_caregiver: {str(e)}")
         return jsonify({'error': 'An error occurred while deleting caregiver'}), 500
 
+@app.route('/api/hours', methods=['GET'])
+@versioned('shifts', 'caregivers')
+def get_hours():
+    """
+    Worked hours per caregiver, from the maintained rollup (no shift scan).
+    
+    start, end: YYYY-MM-DD, required. With by=week (the default) the range
+    is widened to whole ISO weeks and hours are keyed by each week's Monday;
+    with by=day they are keyed by date. caregiver_id limits the result to
+    one caregiver.
+    """
+    try:
+        try:
+            first_day = datetime.strptime(request.args['start'], '%Y-%m-%d').toordinal()
+            last_day = datetime.strptime(request.args['end'], '%Y-%m-%d').toordinal()
+        except KeyError:
+            return jsonify({'error': 'Missing date range parameters'}), 400
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        if last_day < first_day:
+            return jsonify({'error': 'End date is before start date'}), 400
+        
+        by = request.args.get('by', 'week')
+        if by == 'week':
+            first, last = week_of(first_day), week_of(last_day)
+            totals = backend.hours_by_week(first, last)
+            labels = {week: day_label(week_monday(week)) for week in range(first, last + 1)}
+        elif by == 'day':
+            totals = backend.hours_by_day(first_day, last_day)
+            labels = {day: day_label(day) for day in range(first_day, last_day + 1)}
+        else:
+            return jsonify({'error': 'by must be week or day'}), 400
+        
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+        caregiver_ids = list(caregivers) + [cid for cid in totals if cid not in caregivers]
+        if 'caregiver_id' in request.args:
+            caregiver_ids = [cid for cid in caregiver_ids if cid == request.args['caregiver_id']]
+        
+        result = []
+        for caregiver_id in caregiver_ids:
+            caregiver = caregivers.get(caregiver_id, {})
+            minutes = totals.get(caregiver_id, {})
+            result.append({
+                'caregiver_id': caregiver_id,
+                'name': caregiver.get('name'),
+                'max_hours': caregiver.get('max_hours'),
+                'hours': {labels[key]: round(value / 60, 2) for key, value in sorted(minutes.items())},
+                'total': round(sum(minutes.values()) / 60, 2)
+            })
+        
+        return jsonify({'by': by, 'periods': list(labels.values()), 'caregivers': result})
+    except Exception as e:
+        logger.error(f"Error in get_hours: {str(e)}")
+        return jsonify({'error': 'An error occurred while calculating hours'}), 500
+
+@app.route('/api/conflicts', methods=['GET'])
+@versioned('shifts', 'caregivers')
+def get_conflicts():
+    """
+    Every double booking (two overlapping shifts of one caregiver) whose
+    later shift starts between start and end (YYYY-MM-DD, inclusive).
+    caregiver_id limits the report to one caregiver.
+    """
+    try:
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        
+        if not start_date or not end_date:
+            return jsonify({'error': 'Missing date range parameters'}), 400
+        
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d')
+            end = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+        conflicts = [conflict_entry(a, b, caregivers) for a, b in backend.shift_conflicts(start, end)]
+        if 'caregiver_id' in request.args:
+            conflicts = [c for c in conflicts if c['caregiver_id'] == request.args['caregiver_id']]
+        conflicts.sort(key=lambda c: (c['overlaps']['start'], c['caregiver_id'], c['shift']['start']))
+        
+        return jsonify({'count': len(conflicts), 'conflicts': conflicts})
+    except Exception as e:
+        logger.error(f"Error in get_conflicts: {str(e)}")
+        return jsonify({'error': 'An error occurred while checking for conflicts'}), 500
+
 @app.route('/weekly')
 def weekly():
     try:
@@ -623,7 +1087,16 @@ def weekly_views():
         return "An error occurred", 500
 
 @app.route('/api/shifts', methods=['GET'])
+@versioned('shifts', 'caregivers')
 def get_shifts():
+    """
+    Shifts starting within start..end (or start + days), ordered by start.
+    
+    fields: comma-separated subset of SHIFT_FIELDS to return per shift.
+    limit/after: cursor pagination; the response becomes {shifts, after},
+    where after is the cursor of the next page or null on the last one.
+    Without either, the whole range is returned as a plain list.
+    """
     start_date = request.args.get('start')
     end_date = request.args.get('end')
     days = request.args.get('days')
@@ -636,53 +1109,199 @@ def get_shifts():
     if not start_date or not end_date:
         return jsonify({'error': 'Missing date range parameters'}), 400
     
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [f for f in fields.split(',') if f]
+        unknown = [f for f in fields if f not in SHIFT_FIELDS]
+        if unknown or not fields:
+            return jsonify({'error': f'Unknown fields: {", ".join(unknown)}. Valid fields are: {", ".join(SHIFT_FIELDS)}'}), 400
+    
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    paged = limit is not None or after is not None
+    if paged:
+        try:
+            limit = int(limit) if limit is not None else SHIFTS_PAGE_SIZE
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if limit < 1 or limit > SHIFTS_MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {SHIFTS_MAX_PAGE_SIZE}'}), 400
+        if after is not None:
+            after = decode_shift_cursor(after)
+            if after is None:
+                return jsonify({'error': 'Invalid cursor'}), 400
+    
     try:
         start = datetime.strptime(start_date, '%Y-%m-%d')
         end = datetime.strptime(end_date, '%Y-%m-%d')
         end = end.replace(hour=23, minute=59, second=59)
         
-        logger.info(f"Loading shifts from {start} to {end}")
-        
-        shifts = load_shifts()
         filtered_shifts = []
-        
-        caregivers = {str(c['id']): c for c in load_caregivers()}
-        
+        a1_count = 0
+        
+        # Caregiver details are only looked up when a requested field needs them
+        enrich = fields is None or 'caregiver_name' in fields or 'color' in fields
+        caregivers = {str(c['id']): c for c in load_caregivers()} if enrich else {}
+        
+        # A1 (overnight) shifts are included by their start date. The range
+        # runs from 00:00 on the start day to 23:59:59 on the end day, so a
+        # start-time lookup covers both A1 and regular shifts.
+        if paged:
+            shifts, last = backend.shifts_page(start, end, limit, after)
+        else:
+            shifts = backend.shifts_in_range(start, end)
         for shift in shifts:
-            shift_start = parser.parse(shift['start'])
-            shift_end = parser.parse(shift['end'])
-            
-            # Calculate if this shift should be shown in the date range
-            # Special handling for A1 (overnight) shifts:
-            # Include an A1 shift if its start date is between start and end
-            is_a1_shift = shift['shift_type'] == 'A1'
-            
-            # For A1 shifts, always use the start date to determine inclusion
-            # For other shifts, use standard date range check
-            if is_a1_shift:
-                logger.info(f"Processing A1 shift: {shift}")
-                shift_date = shift_start.date()
-                is_in_range = start.date() <= shift_date <= end.date()
-                
-                if is_in_range:
-                    logger.info(f"Including A1 shift based on start date: {shift_date}")
-            else:
-                is_in_range = start <= shift_start <= end
-            
-            if is_in_range:
-                # Add caregiver details
+            if shift['shift_type'] == 'A1':
+                a1_count += 1
+            # Add caregiver details
+            caregiver = caregivers.get(str(shift['caregiver_id']))
+            if caregiver:
+                shift['caregiver_name'] = caregiver['name']
+                shift['color'] = caregiver['color']
+            if fields is not None:
+                shift = {f: shift[f] for f in fields if f in shift}
+            filtered_shifts.append(shift)
+        
+        logger.info(f"Returning {len(filtered_shifts)} shifts ({a1_count} A1) from {start_date} to {end_date}")
+        if paged:
+            return jsonify({'shifts': filtered_shifts, 'after': encode_shift_cursor(last) if last else None})
+        return jsonify(filtered_shifts)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+
+def encode_shift_cursor(key):
+    """
+    Cursor for the page after the shift with this (start minutes, id) key.
+    Cursors name a position rather than a shift, so they stay valid when
+    that shift is deleted.
+    """
+    return f'{key[0]}-{key[1]}'
+
+def decode_shift_cursor(cursor):
+    """The (start minutes, id) key of a cursor, or None if it is malformed."""
+    minutes, _, shift_id = cursor.partition('-')
+    if not minutes.isdigit() or not shift_id:
+        return None
+    return int(minutes), shift_id
+
+@app.route('/api/shifts/changes', methods=['GET'])
+@versioned('shifts', 'caregivers')
+def get_shift_changes():
+    """
+    Delta sync: the shifts inserted and updated and the ids of those
+    deleted since version `since`, as {version, inserted, updated, deleted}.
+    Pass the returned version as `since` next time. Without since, only the
+    current version is returned; read it before loading /api/shifts so no
+    write falls in between. 410 means the changes since that version are
+    no longer kept and the shifts have to be reloaded.
+    """
+    since = request.args.get('since')
+    if since is not None:
+        if not since.isdigit():
+            return jsonify({'error': 'since must be a non-negative integer'}), 400
+        since = int(since)
+    
+    try:
+        changes = backend.shift_changes_since(since)
+        if changes is None:
+            return jsonify({'error': f'Changes since version {since} are not available; reload the shifts'}), 410
+        
+        # Same caregiver details as GET /api/shifts
+        changed = changes['inserted'] + changes['updated']
+        if changed:
+            caregivers = {str(c['id']): c for c in load_caregivers()}
+            for shift in changed:
                 caregiver = caregivers.get(str(shift['caregiver_id']))
                 if caregiver:
                     shift['caregiver_name'] = caregiver['name']
                     shift['color'] = caregiver['color']
-                filtered_shifts.append(shift)
         
-        logger.info(f"Returning {len(filtered_shifts)} shifts")
-        return jsonify(filtered_shifts)
-    except ValueError:
-        return jsonify({'error': 'Invalid date format'}), 400
+        logger.info(f"Returning shift changes since {since} up to {changes['version']}: "
+                    f"{len(changes['inserted'])} inserted, {len(changes['updated'])} updated, "
+                    f"{len(changes['deleted'])} deleted")
+        return jsonify(changes)
+    except Exception as e:
+        logger.error(f"Error loading shift changes: {str(e)}", exc_info=True)
+        return jsonify({'error': 'An error occurred while loading shift changes'}), 500
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events for writes to the kinds of data in `kinds`
+    (comma-separated subset of EVENT_KINDS, default shifts, templates and
+    caregivers). The stream opens with a `versions` event holding the
+    current change counters, then sends a `change` event with the new
+    counters of the kinds each committed write touched, e.g.
+    {"shifts": 13}. A client that reconnects compares the `versions` event
+    with what it last saw to catch writes made while it was away.
+    """
+    if not EVENTS_ENABLED:
+        return jsonify({'error': 'Change events are disabled'}), 404
+    
+    kinds = request.args.get('kinds')
+    kinds = [k for k in kinds.split(',') if k] if kinds is not None else list(DEFAULT_EVENT_KINDS)
+    unknown = [k for k in kinds if k not in EVENT_KINDS]
+    if unknown or not kinds:
+        return jsonify({'error': f'Unknown kinds: {", ".join(unknown)}. Valid kinds are: {", ".join(EVENT_KINDS)}'}), 400
+    
+    # Subscribed before the counters are read, so no write falls in between
+    events = notifier.current.subscribe()
+    if events is None:
+        # A 503 would make EventSource give up for good; an empty stream
+        # with a retry interval has it try again in a minute instead
+        logger.warning(f"Refusing event stream: {EVENTS_MAX_STREAMS} streams already open in this worker")
+        return app.response_class('retry: 60000\n\n', mimetype='text/event-stream')
+    try:
+        versions = dict(zip(kinds, backend.data_version(*kinds)[0]))
+    except Exception as e:
+        notifier.current.unsubscribe(events)
+        logger.error(f"Error opening event stream: {str(e)}")
+        return jsonify({'error': 'An error occurred while opening the event stream'}), 500
+    
+    def generate():
+        try:
+            yield sse_message('versions', versions)
+            deadline = time.monotonic() + EVENTS_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    changed = events.get(timeout=EVENTS_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if changed is None:
+                    # The worker is stopping; the browser reconnects to another one
+                    return
+                # A burst of writes becomes one event with the latest counters
+                # (messages are shared between streams, so merge into a copy)
+                changed = dict(changed)
+                while True:
+                    try:
+                        more = events.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is None:
+                        return
+                    for kind, version in more.items():
+                        changed[kind] = max(version, changed.get(kind, version))
+                fresh = {k: v for k, v in changed.items() if k in versions and v > versions[k]}
+                if fresh:
+                    versions.update(fresh)
+                    yield sse_message('change', fresh)
+        finally:
+            notifier.current.unsubscribe(events)
+    
+    logger.debug("Opened event stream for %s", kinds)
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stops nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def sse_message(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
 
 @app.route('/api/shifts', methods=['DELETE'])
+@serialized
 def delete_shifts():
     try:
         start_date = request.args.get('start')
@@ -695,15 +1314,7 @@ def delete_shifts():
         end = datetime.strptime(end_date, '%Y-%m-%d')
         end = end.replace(hour=23, minute=59, second=59)
         
-        shifts = load_shifts()
-        remaining_shifts = []
-        
-        for shift in shifts:
-            shift_start = parser.parse(shift['start'])
-            if not (start <= shift_start <= end):
-                remaining_shifts.append(shift)
-        
-        save_shifts(remaining_shifts)
+        write_shifts(deletes=[s['id'] for s in backend.shifts_in_range(start, end)])
         return jsonify({'success': True})
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
@@ -711,7 +1322,107 @@ def delete_shifts():
         logger.error(f"Error deleting shifts: {str(e)}")
         return jsonify({'error': 'An error occurred while deleting shifts'}), 500
 
+def diff_shift_range(existing, new_shifts):
+    """
+    Match new shifts to identical existing ones (same caregiver, type, start
+    and end). Returns (new shifts without a match, existing shifts without one).
+    """
+    existing_by_key = {}
+    for shift in existing:
+        key = (str(shift['caregiver_id']), shift['shift_type'], shift['start'], shift['end'])
+        existing_by_key.setdefault(key, []).append(shift)
+    added = []
+    for shift in new_shifts:
+        matches = existing_by_key.get((str(shift['caregiver_id']), shift['shift_type'], shift['start'], shift['end']))
+        if matches:
+            matches.pop()
+        else:
+            added.append(shift)
+    return added, [s for matches in existing_by_key.values() for s in matches]
+
+@app.route('/api/shifts', methods=['PUT'])
+@serialized
+def replace_shifts_in_range():
+    """
+    Atomically replace the shifts starting between start and end (inclusive
+    dates) with the supplied list (a JSON array, or {"shifts": [...]}, in the
+    shape POST /api/shifts takes).
+    
+    Existing shifts identical to a supplied one (same caregiver, type, start
+    and end) are kept with their ids; the rest are removed and the new ones
+    added, all in one write. If any supplied shift is invalid nothing is
+    changed and the per-item errors are returned.
+    """
+    try:
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        
+        if not start_date or not end_date:
+            return jsonify({'error': 'Missing date range parameters'}), 400
+        
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d')
+            end = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        
+        data = request.get_json(silent=True)
+        items = data.get('shifts') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of shifts'}), 400
+        
+        # Validate everything up front; ids are assigned when the range is swapped
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+        new_shifts = []
+        errors = []
+        for index, shift_data in enumerate(items):
+            try:
+                shift = normalize_shift(build_shift(shift_data, caregivers, ''))
+                if not start <= datetime.strptime(shift['start'], '%Y-%m-%d %H:%M') <= end:
+                    raise ValueError(f'Shift starts outside {start_date} - {end_date}: {shift["start"]}')
+                new_shifts.append(shift)
+            except ValueError as e:
+                errors.append({'index': index, 'status': 'error', 'error': str(e)})
+        if errors:
+            return jsonify({'error': f'{len(errors)} invalid shift(s); nothing was changed', 'results': errors}), 400
+        
+        added, removed = diff_shift_range(backend.shifts_in_range(start, end), new_shifts)
+        report, refusal = check_shift_write(added=added, removed=removed, caregivers=caregivers)
+        if request_flag('dry_run'):
+            return jsonify(dict(report, dry_run=True, added=len(added), removed=len(removed),
+                                unchanged=len(new_shifts) - len(added)))
+        if refusal:
+            return refusal
+        
+        def plan(existing, next_id):
+            # The route holds the writer lock, so existing is what was diffed above
+            for offset, shift in enumerate(added):
+                shift['id'] = str(next_id + offset)
+            return added, [s['id'] for s in removed]
+        
+        puts, deletes = backend.replace_shift_range(start, end, plan)
+        summary = {
+            'added': len(puts),
+            'removed': len(deletes),
+            'unchanged': len(new_shifts) - len(puts)
+        }
+        logger.info(f"Replaced shifts {start_date} - {end_date}: {summary}")
+        
+        if puts or deletes:
+            create_audit_event(
+                AUDIT_EVENT_TYPES['SHIFTS_REPLACED'],
+                details=dict(summary, start_date=start_date, end_date=end_date,
+                             added_ids=[s['id'] for s in puts], removed_ids=deletes)
+            )
+        
+        return jsonify(dict(summary, **write_warnings(report)))
+        
+    except Exception as e:
+        logger.error(f"Error replacing shifts: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Failed to replace shifts: {str(e)}'}), 500
+
 @app.route('/api/templates/<int:template_id>/apply', methods=['POST'])
+@serialized
 def apply_template(template_id):
     try:
         data = request.json
@@ -721,72 +1432,36 @@ def apply_template(template_id):
         start_date = data['start_date']
         num_weeks = int(data.get('num_weeks', 1))
         
-        if num_weeks < 1 or num_weeks > 12:
-            return jsonify({'error': 'Number of weeks must be between 1 and 12'}), 400
+        if num_weeks < 1 or num_weeks > MAX_TEMPLATE_WEEKS:
+            return jsonify({'error': f'Number of weeks must be between 1 and {MAX_TEMPLATE_WEEKS}'}), 400
             
         # Load template
         templates = load_templates()
         template = next((t for t in templates if int(t['id']) == template_id), None)
         if not template:
             return jsonify({'error': 'Template not found'}), 404
-            
-        # Convert start_date to datetime
-        week_start = datetime.strptime(start_date, '%Y-%m-%d')
         
-        # Load existing shifts
-        shifts = load_shifts()
+        # Week start and end of the range as ordinal minutes
+        week_start = to_minutes(datetime.strptime(start_date, '%Y-%m-%d'))
+        week_end = week_start + num_weeks * MINUTES_PER_WEEK
         
-        # Calculate end date
-        end_date = week_start + timedelta(weeks=num_weeks)
+        # Existing shifts in the date range are replaced
+        replaced = backend.shifts_in_range(week_start, week_end)
+        replaced_ids = [s['id'] for s in replaced]
         
-        # Remove existing shifts in the date range
-        shifts = [s for s in shifts if not (
-            week_start <= parser.parse(s['start']) <= end_date
-        )]
+        # Generate new shifts from the compiled template (already in stored
+        # form, so they skip normalize_shift)
+        new_shifts = compiled_templates.get(template).expand(week_start, num_weeks, backend.max_shift_id() + 1)
         
-        # Generate new shifts from template
-        new_shifts = []
-        max_id = max([int(s['id']) for s in shifts]) if shifts else 0
-        shift_id = max_id + 1
-        
-        for week in range(num_weeks):
-            current_week_start = week_start + timedelta(weeks=week)
-            
-            for template_shift in template['shifts']:
-                # Get the day number (0 = Monday, 6 = Sunday)
-                template_day = normalize_day_value(template_shift['day'])
-                
-                # Calculate the date for this shift
-                shift_date = current_week_start + timedelta(days=template_day)
-                
-                # Get shift times from definitions
-                shift_def = SHIFT_DEFINITIONS[template_shift['shift_type']]
-                
-                # Create shift start and end times
-                shift_start = datetime.strptime(f"{shift_date.date()} {shift_def['start']}", "%Y-%m-%d %H:%M")
-                shift_end = datetime.strptime(f"{shift_date.date()} {shift_def['end']}", "%Y-%m-%d %H:%M")
-                
-                # Handle shifts that cross midnight
-                if shift_def['end'] <= shift_def['start']:
-                    shift_end += timedelta(days=1)
-                
-                # Create new shift
-                new_shift = {
-                    'id': str(shift_id),
-                    'caregiver_id': template_shift['caregiver_id'],
-                    'shift_type': template_shift['shift_type'],
-                    'start': shift_start.strftime('%Y-%m-%d %H:%M'),
-                    'end': shift_end.strftime('%Y-%m-%d %H:%M')
-                }
-                
-                new_shifts.append(new_shift)
-                shift_id += 1
-        
-        # Add new shifts to existing ones
-        shifts.extend(new_shifts)
+        report, refusal = check_shift_write(added=new_shifts, removed=replaced)
+        if request_flag('dry_run'):
+            return jsonify(dict(report, dry_run=True, shifts_added=len(new_shifts), shifts_replaced=len(replaced_ids)))
+        if refusal:
+            return refusal
         
         # Save updated shifts
-        save_shifts(shifts)
+        backend.write_shifts(puts=new_shifts, deletes=replaced_ids)
+        logger.info(f"Applied template {template_id}: {len(new_shifts)} shifts added, {len(replaced_ids)} replaced")
         
         # Create audit event
         create_audit_event(
@@ -800,7 +1475,7 @@ def apply_template(template_id):
             }
         )
         
-        return jsonify({'message': f'Template applied successfully for {num_weeks} weeks'})
+        return jsonify(dict(write_warnings(report), message=f'Template applied successfully for {num_weeks} weeks'))
         
     except ValueError as e:
         logger.error(f"Value error in apply_template: {str(e)}")
@@ -810,24 +1485,16 @@ def apply_template(template_id):
         return jsonify({'error': 'An error occurred while applying the template'}), 500
 
 def load_week_states():
-    if os.path.exists(WEEK_STATES_FILE):
-        with open(WEEK_STATES_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return backend.load_week_states()
 
 def save_week_states(states):
-    with open(WEEK_STATES_FILE, 'w') as f:
-        json.dump(states, f, indent=2)
+    backend.save_week_states(states)
 
 def load_last_template():
-    if os.path.exists(LAST_TEMPLATE_FILE):
-        with open(LAST_TEMPLATE_FILE, 'r') as f:
-            return json.load(f)
-    return None
+    return storage.read_json(LAST_TEMPLATE_FILE)
 
 def save_last_template(template_info):
-    with open(LAST_TEMPLATE_FILE, 'w') as f:
-        json.dump(template_info, f, indent=2)
+    storage.write_json(LAST_TEMPLATE_FILE, template_info, indent=DATA_JSON_INDENT)
 
 @app.route('/api/week-state', methods=['GET'])
 def get_week_state():
@@ -842,9 +1509,9 @@ def get_week_state():
         except ValueError:
             return jsonify({'error': 'Invalid date format'}), 400
             
-        states = load_week_states()
+        week_state = backend.get_week_state(week_start)
         return jsonify({
-            'week_state': states.get(week_start, {}),
+            'week_state': week_state if week_state is not None else {},
             'last_template': load_last_template()
         })
     except Exception as e:
@@ -852,6 +1519,7 @@ def get_week_state():
         return jsonify({'error': 'Failed to get week state'}), 500
 
 @app.route('/api/week-state', methods=['POST'])
+@serialized
 def save_week_state():
     try:
         data = request.json
@@ -868,12 +1536,10 @@ def save_week_state():
         if 'shifts' in data and not isinstance(data['shifts'], list):
             return jsonify({'error': 'Shifts must be an array'}), 400
             
-        states = load_week_states()
-        states[data['week_start']] = {
+        backend.set_week_state(data['week_start'], {
             'shifts': data.get('shifts', []),
             'template': data.get('template')
-        }
-        save_week_states(states)
+        })
         
         # Save last template if provided
         if data.get('template'):
@@ -885,6 +1551,7 @@ def save_week_state():
         return jsonify({'error': 'Failed to save week state'}), 500
 
 @app.route('/api/week-state', methods=['DELETE'])
+@serialized
 def clear_week_state():
     try:
         week_start = request.args.get('week_start')
@@ -897,10 +1564,7 @@ def clear_week_state():
         except ValueError:
             return jsonify({'error': 'Invalid date format'}), 400
             
-        states = load_week_states()
-        if week_start in states:
-            del states[week_start]
-            save_week_states(states)
+        backend.delete_week_state(week_start)
             
         return jsonify({'success': True})
     except Exception as e:
@@ -910,14 +1574,8 @@ def clear_week_state():
 @app.route('/api/shifts/<shift_id>', methods=['GET'])
 def get_shift(shift_id):
     try:
-        # Load existing shifts
-        shifts = load_shifts()
-        
-        # Convert shift_id to string for comparison
-        shift_id_str = str(shift_id)
-        
         # Find the shift
-        shift = next((s for s in shifts if str(s.get('id')) == shift_id_str), None)
+        shift = backend.get_shift(shift_id)
         
         if shift is None:
             return jsonify({'error': 'Shift not found'}), 404
@@ -935,10 +1593,11 @@ def get_shift(shift_id):
         return jsonify({'error': 'Failed to get shift'}), 500
 
 @app.route('/api/shifts/<shift_id>', methods=['PUT'])
+@serialized
 def update_shift(shift_id):
     try:
         shift_data = request.json
-        logger.info(f"Updating shift {shift_id} with data: {shift_data}")
+        logger.debug("Updating shift %s with data: %s", shift_id, shift_data)
         
         # Validate required fields
         required_fields = ['caregiver_id', 'shift_type', 'start', 'end']
@@ -950,20 +1609,14 @@ def update_shift(shift_id):
         if shift_data['shift_type'] not in SHIFT_DEFINITIONS:
             return jsonify({'error': f'Invalid shift type: {shift_data["shift_type"]}'}), 400
             
-        # Load existing shifts
-        shifts = load_shifts()
-        
         # Convert shift_id to string for comparison
         shift_id_str = str(shift_id)
         
         # Find the shift to update
-        shift_index = next((i for i, shift in enumerate(shifts) if str(shift['id']) == shift_id_str), None)
+        old_shift = backend.get_shift(shift_id_str)
         
-        if shift_index is None:
+        if old_shift is None:
             return jsonify({'error': 'Shift not found'}), 404
-        
-        # Store old shift for audit log
-        old_shift = dict(shifts[shift_index])
             
         # Get caregiver
         caregivers = load_caregivers()
@@ -973,8 +1626,8 @@ def update_shift(shift_id):
             
         # Parse and validate dates
         try:
-            start_time = parser.parse(shift_data['start'])
-            end_time = parser.parse(shift_data['end'])
+            start_time = parse_shift_time(shift_data['start'])
+            end_time = parse_shift_time(shift_data['end'])
             
             # Format times consistently
             shift_data['start'] = start_time.strftime('%Y-%m-%d %H:%M')
@@ -991,10 +1644,10 @@ def update_shift(shift_id):
             elif end_date == start_date and end_time <= start_time:
                 # Special handling for A1 shift - it should not cross midnight
                 if shift_data['shift_type'] == 'A1':
-                    logger.info(f"Preserving A1 shift on same day: {shift_data}")
+                    logger.debug("Preserving A1 shift on same day: %s", shift_data)
                 else:
                     # For other shifts that truly cross midnight, add a day to end time
-                    logger.info(f"Adjusting overnight shift: {shift_data}")
+                    logger.debug("Adjusting overnight shift: %s", shift_data)
                     end_time += timedelta(days=1)
             
             shift_data['end'] = end_time.strftime('%Y-%m-%d %H:%M')
@@ -1003,7 +1656,7 @@ def update_shift(shift_id):
             return jsonify({'error': f'Invalid date format: {str(e)}'}), 400
             
         # Update shift
-        shifts[shift_index] = {
+        updated_shift = {
             'id': shift_id_str,
             'caregiver_id': str(shift_data['caregiver_id']),
             'shift_type': shift_data['shift_type'],
@@ -1012,12 +1665,18 @@ def update_shift(shift_id):
         }
         
         # Add caregiver details for response
-        shifts[shift_index]['caregiver_name'] = caregiver['name']
-        shifts[shift_index]['color'] = caregiver['color']
+        updated_shift['caregiver_name'] = caregiver['name']
+        updated_shift['color'] = caregiver['color']
         
-        # Save updated shifts
-        save_shifts(shifts)
-        logger.info(f"Successfully updated shift: {shifts[shift_index]}")
+        report, refusal = check_shift_write(added=[updated_shift], removed=[old_shift])
+        if request_flag('dry_run'):
+            return jsonify(dict(report, dry_run=True, shift=updated_shift))
+        if refusal:
+            return refusal
+        
+        # Save updated shift
+        write_shifts(puts=[updated_shift])
+        logger.info(f"Updated shift {shift_id}")
         
         # Create audit event
         create_audit_event(
@@ -1025,36 +1684,31 @@ def update_shift(shift_id):
             details={
                 'shift_id': shift_id_str,
                 'old_shift': old_shift,
-                'new_shift': shifts[shift_index]
+                'new_shift': updated_shift
             }
         )
         
-        return jsonify(shifts[shift_index])
+        return jsonify(dict(updated_shift, **write_warnings(report)))
         
     except Exception as e:
         logger.error(f"Error updating shift {shift_id}: {str(e)}", exc_info=True)
         return jsonify({'error': f'Failed to update shift: {str(e)}'}), 500
 
 @app.route('/api/shifts/<shift_id>', methods=['DELETE'])
+@serialized
 def delete_shift(shift_id):
     try:
-        # Load existing shifts
-        shifts = load_shifts()
-        
         # Convert shift_id to string for comparison
         shift_id_str = str(shift_id)
         
         # Find the shift to delete
-        shift_index = next((i for i, shift in enumerate(shifts) if str(shift.get('id')) == shift_id_str), None)
+        deleted_shift = backend.get_shift(shift_id_str)
         
-        if shift_index is None:
+        if deleted_shift is None:
             return jsonify({'error': 'Shift not found'}), 404
             
         # Remove the shift
-        deleted_shift = shifts.pop(shift_index)
-        
-        # Save updated shifts
-        save_shifts(shifts)
+        write_shifts(deletes=[shift_id_str])
         
         # Create audit event
         create_audit_event(
@@ -1074,6 +1728,18 @@ def delete_shift(shift_id):
         app.logger.error(f"Error deleting shift {shift_id}: {str(e)}")
         return jsonify({'error': 'Failed to delete shift'}), 500
 
+def ics_response(shift_times, caregivers, disposition):
+    """
+    Stream shift_times as an .ics file. Carries a weak ETag over the
+    calendar contents, so an If-None-Match from a polling client gets a 304.
+    """
+    response = app.response_class(iter_calendar(shift_times, caregivers))
+    response.headers['Content-Type'] = 'text/calendar'
+    response.headers['Content-Disposition'] = disposition
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(calendar_etag(shift_times, caregivers), weak=True)
+    return response.make_conditional(request)
+
 @app.route('/api/shifts/download-ics', methods=['GET'])
 def download_ics():
     try:
@@ -1082,162 +1748,217 @@ def download_ics():
         
         if not start_date or not end_date:
             return jsonify({'error': 'Missing date range parameters'}), 400
-            
-        # Create calendar
-        cal = Calendar()
-        cal.add('prodid', '-//Caregiver Scheduler//EN')
-        cal.add('version', '2.0')
-        cal.add('calscale', 'GREGORIAN')
-        cal.add('method', 'PUBLISH')
-        
-        # Get shifts for the date range
-        shifts = load_shifts()
+        
         caregivers = {str(c['id']): c for c in load_caregivers()}
         
         start = datetime.strptime(start_date, '%Y-%m-%d')
         end = datetime.strptime(end_date, '%Y-%m-%d')
         end = end.replace(hour=23, minute=59, second=59)
         
-        # Filter shifts and create events
-        for shift in shifts:
-            shift_start = parser.parse(shift['start'])
-            if start <= shift_start <= end:
-                event = Event()
-                
-                # Get caregiver details
-                caregiver = caregivers.get(str(shift['caregiver_id']))
-                caregiver_name = caregiver['name'] if caregiver else 'Unknown Caregiver'
-                
-                # Set event properties
-                event.add('summary', f"{caregiver_name} - {shift['shift_type']} Shift")
-                event.add('dtstart', shift_start)
-                event.add('dtend', parser.parse(shift['end']))
-                event.add('dtstamp', datetime.now(pytz.UTC))
-                event.add('uid', f"{shift['id']}@caregiverscheduler")
-                
-                if caregiver:
-                    event.add('description', f"Caregiver: {caregiver_name}\nShift Type: {shift['shift_type']}")
-                    event.add('categories', ['Caregiver Shift'])
-                    
-                cal.add_component(event)
+        return ics_response(backend.shift_times_in_range(start, end), caregivers,
+                            'attachment; filename=schedule.ics')
         
-        # Generate ICS file content
-        ics_content = cal.to_ical()
+    except Exception as e:
+        logger.error(f"Error generating ICS file: {str(e)}")
+        return jsonify({'error': 'Failed to generate ICS file'}), 500
+
+@app.route('/api/caregivers/<caregiver_id>/shifts.ics', methods=['GET'])
+def caregiver_ics_feed(caregiver_id):
+    """
+    Calendar subscription feed of one caregiver's shifts. Covers
+    ICS_FEED_PAST_DAYS back to ICS_FEED_FUTURE_DAYS ahead unless start/end
+    (YYYY-MM-DD) are given.
+    """
+    try:
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+        if caregiver_id not in caregivers:
+            return jsonify({'error': 'Caregiver not found'}), 404
         
-        # Create response with ICS file
-        response = app.make_response(ics_content)
-        response.headers['Content-Type'] = 'text/calendar'
-        response.headers['Content-Disposition'] = 'attachment; filename=schedule.ics'
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            start = (datetime.strptime(request.args['start'], '%Y-%m-%d') if 'start' in request.args
+                     else today - timedelta(days=ICS_FEED_PAST_DAYS))
+            end = (datetime.strptime(request.args['end'], '%Y-%m-%d') if 'end' in request.args
+                   else today + timedelta(days=ICS_FEED_FUTURE_DAYS))
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        end = end.replace(hour=23, minute=59, second=59)
         
-        return response
+        return ics_response(backend.shift_times_in_range(start, end, caregiver_id=caregiver_id), caregivers,
+                            f'inline; filename=caregiver-{caregiver_id}.ics')
         
     except Exception as e:
-        logger.error(f"Error generating ICS file: {str(e)}")
-        return jsonify({'error': 'Failed to generate ICS file'}), 500
+        logger.error(f"Error generating ICS feed for caregiver {caregiver_id}: {str(e)}")
+        return jsonify({'error': 'Failed to generate ICS feed'}), 500
+
+def build_shift(shift_data, caregivers_by_id, shift_id):
+    """
+    Validate client shift data against a {caregiver id: caregiver} map and
+    return the shift to store. Raises ValueError with a client-facing message.
+    """
+    if not isinstance(shift_data, dict):
+        raise ValueError('Shift must be an object')
+    
+    # Validate required fields
+    required_fields = ['caregiver_id', 'shift_type', 'start', 'end']
+    missing = [f for f in required_fields if f not in shift_data]
+    if missing:
+        raise ValueError(f'Missing required fields: {", ".join(missing)}')
+        
+    # Validate shift type
+    if shift_data['shift_type'] not in SHIFT_DEFINITIONS:
+        raise ValueError(f'Invalid shift type: {shift_data["shift_type"]}')
+        
+    # Find caregiver by ID (not by name)
+    caregiver = caregivers_by_id.get(str(shift_data['caregiver_id']))
+    if not caregiver:
+        raise ValueError(f'Caregiver not found with ID: {shift_data["caregiver_id"]}')
+        
+    # Parse and validate dates
+    try:
+        start_time = parse_shift_time(shift_data['start'])
+        end_time = parse_shift_time(shift_data['end'])
+    except (ValueError, TypeError, OverflowError) as e:
+        raise ValueError(f'Invalid date format: {str(e)}')
+    
+    # CRITICAL FIX: Use the same rules as save_shifts
+    # Only adjust dates if they're different AND the end time is before the start time
+    start_date = start_time.date()
+    end_date = end_time.date()
+    
+    # Only adjust if end date is actually before start date
+    if end_date < start_date:
+        logger.warning(f"End date {end_date} is before start date {start_date} - adjusting")
+        end_time += timedelta(days=1)
+    # For same-day shifts, check if we need to adjust for overnight
+    # (A1 is special - it should not cross midnight)
+    elif end_date == start_date and end_time <= start_time and shift_data['shift_type'] != 'A1':
+        end_time += timedelta(days=1)
+    
+    return {
+        'id': str(shift_id),
+        'caregiver_id': str(caregiver['id']),
+        'shift_type': shift_data['shift_type'],
+        'start': start_time.strftime('%Y-%m-%d %H:%M'),
+        'end': end_time.strftime('%Y-%m-%d %H:%M'),
+        # Caregiver details for the response
+        'caregiver_name': caregiver['name'],
+        'color': caregiver['color']
+    }
 
 @app.route('/api/shifts', methods=['POST'])
+@serialized
 def add_shift():
     try:
         shift_data = request.json
-        logger.info(f"Received shift data: {shift_data}")
+        logger.debug("Received shift data: %s", shift_data)
         
-        # Validate required fields
-        required_fields = ['caregiver_id', 'shift_type', 'start', 'end']
-        if not all(field in shift_data for field in required_fields):
-            missing = [f for f in required_fields if f not in shift_data]
-            return jsonify({'error': f'Missing required fields: {", ".join(missing)}'}), 400
-            
-        # Validate shift type
-        if shift_data['shift_type'] not in SHIFT_DEFINITIONS:
-            return jsonify({'error': f'Invalid shift type: {shift_data["shift_type"]}'}), 400
-            
-        # Find caregiver by ID (not by name)
-        caregivers = load_caregivers()
-        caregiver = next((c for c in caregivers if str(c['id']) == str(shift_data['caregiver_id'])), None)
-        if not caregiver:
-            return jsonify({'error': f'Caregiver not found with ID: {shift_data["caregiver_id"]}'}), 400
-            
-        # Parse and validate dates
+        caregivers = {str(c['id']): c for c in load_caregivers()}
         try:
-            start_time = parser.parse(shift_data['start'])
-            end_time = parser.parse(shift_data['end'])
-            
-            # Format times consistently
-            shift_data['start'] = start_time.strftime('%Y-%m-%d %H:%M')
-            
-            # CRITICAL FIX: Use the same rules as save_shifts
-            # Only adjust dates if they're different AND the end time is before the start time
-            start_date = start_time.date()
-            end_date = end_time.date()
-            
-            # Log original dates
-            logger.info(f"Original dates for shift {shift_data['shift_type']}: {start_date} to {end_date}")
-            
-            # Only adjust if end date is actually before start date
-            if end_date < start_date:
-                logger.warning(f"End date {end_date} is before start date {start_date} - adjusting")
-                end_time += timedelta(days=1)
-            # For same-day shifts, check if we need to adjust for overnight
-            elif end_date == start_date and end_time <= start_time:
-                # Special handling for A1 shift - it should not cross midnight
-                if shift_data['shift_type'] == 'A1':
-                    logger.info(f"Preserving A1 shift on same day: {shift_data}")
-                else:
-                    # For other shifts that truly cross midnight, add a day to end time
-                    logger.info(f"Adjusting overnight shift: {shift_data}")
-                    end_time += timedelta(days=1)
-            
-            shift_data['end'] = end_time.strftime('%Y-%m-%d %H:%M')
-            logger.info(f"Final shift times: {shift_data['start']} to {shift_data['end']}")
-            
+            new_shift = build_shift(shift_data, caregivers, backend.max_shift_id() + 1)
         except ValueError as e:
-            return jsonify({'error': f'Invalid date format: {str(e)}'}), 400
-            
-        # Load existing shifts
-        shifts = load_shifts()
+            return jsonify({'error': str(e)}), 400
         
-        # Generate new ID
-        new_id = str(max([int(s['id']) for s in shifts]) + 1) if shifts else '1'
+        report, refusal = check_shift_write(added=[new_shift], caregivers=caregivers)
+        if request_flag('dry_run'):
+            return jsonify(dict(report, dry_run=True, shift=new_shift))
+        if refusal:
+            return refusal
         
-        # Create new shift
-        new_shift = {
-            'id': new_id,
-            'caregiver_id': str(caregiver['id']),
-            'shift_type': shift_data['shift_type'],
-            'start': shift_data['start'],
-            'end': shift_data['end']
-        }
-        
-        # Add caregiver details for response
-        new_shift['caregiver_name'] = caregiver['name']
-        new_shift['color'] = caregiver['color']
-        
-        # Add to shifts list
-        shifts.append(new_shift)
-        
-        # Save updated shifts - will go through save_shifts with same logic
-        save_shifts(shifts)
-        logger.info(f"Successfully saved shift: {new_shift}")
+        # Save the new shift - goes through normalize_shift like save_shifts
+        write_shifts(puts=[new_shift])
+        logger.info(f"Added shift {new_shift['id']}")
         
         # Create audit event
         create_audit_event(
             AUDIT_EVENT_TYPES['SHIFT_ADDED'],
             details={
-                'shift_id': new_id,
+                'shift_id': new_shift['id'],
                 'shift_type': new_shift['shift_type'],
                 'caregiver_id': new_shift['caregiver_id'],
-                'caregiver_name': caregiver['name'],
+                'caregiver_name': new_shift['caregiver_name'],
                 'start': new_shift['start'],
                 'end': new_shift['end']
             }
         )
         
-        return jsonify(new_shift), 201
+        return jsonify(dict(new_shift, **write_warnings(report))), 201
         
     except Exception as e:
         logger.error(f"Error adding shift: {str(e)}", exc_info=True)
         return jsonify({'error': f'Failed to add shift: {str(e)}'}), 500
 
+@app.route('/api/shifts/batch', methods=['POST'])
+@serialized
+def add_shifts_batch():
+    """
+    Create many shifts in one request.
+    
+    Accepts a JSON array of shifts (or {"shifts": [...]}) in the same shape
+    as POST /api/shifts. Valid shifts are saved with a single write and one
+    aggregated audit event; invalid ones are reported per item. Responds
+    201 when every shift was created, 207 when only some were and 400 when
+    none were.
+    """
+    try:
+        data = request.get_json(silent=True)
+        items = data.get('shifts') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of shifts'}), 400
+        
+        caregivers = {str(c['id']): c for c in load_caregivers()}
+        next_id = backend.max_shift_id() + 1
+        
+        results = []
+        new_shifts = []
+        for index, shift_data in enumerate(items):
+            try:
+                new_shift = build_shift(shift_data, caregivers, next_id)
+            except ValueError as e:
+                results.append({'index': index, 'status': 'error', 'error': str(e)})
+                continue
+            next_id += 1
+            new_shifts.append(new_shift)
+            results.append({'index': index, 'status': 'created', 'shift': new_shift})
+        
+        # Checked for the batch as a whole: its shifts add up and may overlap each other
+        report, refusal = check_shift_write(added=new_shifts, caregivers=caregivers)
+        if request_flag('dry_run'):
+            for result in results:
+                if result['status'] == 'created':
+                    result['status'] = 'valid'
+            return jsonify(dict(report, dry_run=True, valid=len(new_shifts), failed=len(items) - len(new_shifts),
+                                results=results))
+        if refusal:
+            return refusal
+        
+        if new_shifts:
+            write_shifts(puts=new_shifts)
+            create_audit_event(
+                AUDIT_EVENT_TYPES['SHIFTS_ADDED'],
+                details={
+                    'count': len(new_shifts),
+                    'shift_ids': [s['id'] for s in new_shifts],
+                    'start': min(s['start'] for s in new_shifts),
+                    'end': max(s['end'] for s in new_shifts)
+                }
+            )
+        
+        failed = len(items) - len(new_shifts)
+        logger.info(f"Batch add: {len(new_shifts)} shifts created, {failed} failed")
+        
+        if not failed:
+            status = 201
+        elif new_shifts:
+            status = 207
+        else:
+            status = 400
+        return jsonify(dict(write_warnings(report), created=len(new_shifts), failed=failed, results=results)), status
+        
+    except Exception as e:
+        logger.error(f"Error adding shifts: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Failed to add shifts: {str(e)}'}), 500
+
 @app.route('/monthly')
 def monthly():
     try:
@@ -1283,35 +2004,33 @@ def get_audit_events():
         end_date = request.args.get('end')
         event_type = request.args.get('type')
         
-        events = load_audit_events()
-        filtered_events = []
+        limit = request.args.get('limit')
+        before = request.args.get('before')
+        after = request.args.get('after')
         
-        # Apply filters if provided
-        for event in events:
-            # Check date range if provided
-            if start_date or end_date:
-                event_date = datetime.strptime(event['timestamp'], '%Y-%m-%d %H:%M:%S')
-                
-                if start_date:
-                    start = datetime.strptime(start_date, '%Y-%m-%d')
-                    if event_date < start:
-                        continue
-                        
-                if end_date:
-                    end = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-                    if event_date > end:
-                        continue
-            
-            # Check event type if provided
-            if event_type and event['type'] != event_type:
-                continue
-                
-            filtered_events.append(event)
+        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        end = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59) if end_date else None
         
-        # Sort by timestamp descending (newest first)
-        filtered_events.sort(key=lambda x: x['timestamp'], reverse=True)
+        # Without limit/before/after, return the whole filtered list as before
+        if limit is None and before is None and after is None:
+            # Filtered and sorted newest first by the backend
+            filtered_events = backend.query_audit_events(start, end, event_type)
+            return jsonify(filtered_events)
         
-        return jsonify(filtered_events)
+        # Cursor pagination: {events, before, after}
+        try:
+            limit = int(limit) if limit is not None else AUDIT_PAGE_SIZE
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if limit < 1 or limit > AUDIT_MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit must be between 1 and {AUDIT_MAX_PAGE_SIZE}'}), 400
+        if before is not None and after is not None:
+            return jsonify({'error': 'Use either before or after, not both'}), 400
+        try:
+            page = backend.query_audit_page(start, end, event_type, limit, before, after)
+        except (KeyError, ValueError):
+            return jsonify({'error': 'Unknown cursor'}), 400
+        return jsonify(page)
     except Exception as e:
         logger.error(f"Error getting audit events: {str(e)}")
         return jsonify({'error': 'Failed to get audit events'}), 500
@@ -1324,6 +2043,27 @@ def audit_view():
         logger.error(f"Error in audit route: {str(e)}")
         return "An error occurred", 500
 
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics, summed over all workers, plus record counts."""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    try:
+        gauges = [('scheduler_data_records', (('kind', kind),), count)
+                  for kind, count in backend.record_counts().items()]
+        return app.response_class(metrics.current.exposition(gauges), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}")
+        return jsonify({'error': 'Failed to render metrics'}), 500
+
+@app.cli.command('migrate-sqlite')
+def migrate_sqlite():
+    """Copy the JSON files in data/ into the SQLite database."""
+    from sqlite_backend import SqliteBackend
+    SqliteBackend(SQLITE_DB_FILE).migrate_from(create_backend('json'))
+    print(f"Migrated {DATA_DIR} into {SQLITE_DB_FILE}")
+
 if __name__ == '__main__':
     init_data()
+    metrics.current.reset()
     app.run(debug=True, host='0.0.0.0') 
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+Append-only, segmented audit log.
+
+Audit events are stored as JSON Lines in a directory of segment files
+named audit-<YYYY-MM>-<first id>.jsonl. Writing an event is one O(1)
+append to the newest segment; a new segment is started when the month
+changes or the current one passes max_segment_bytes. Event ids are a
+monotonic sequence shared by all workers (appends hold an flock on
+<directory>.lock and read the last id from the tail of the newest
+segment).
+
+A rewrite (the one-time import of the legacy audit_events.json, or a
+restore) builds the new segments in a sibling directory and renames it
+into place, so a failure part way leaves the old log untouched. A
+rewritten directory holds an .imported marker; the legacy file is
+imported until the marker or some segments exist.
+
+Events keep the shape the API has always returned:
+{"id": "12", "type": ..., "user": ..., "timestamp": "%Y-%m-%d %H:%M:%S", "details": {...}}
+
+Reads are served from an in-memory index ordered by (timestamp, id), with
+one secondary index per event type. The index is built once per process
+and kept current by reading only the bytes appended to segments since the
+last query, so a time-range or newest-page query is a bisect plus a slice
+no matter how much history the log holds. Queries hold the in-process
+lock while they slice the index, which another thread may be extending.
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+SEGMENT_PATTERN = re.compile(r'^audit-(\d{4}-\d{2})-(\d+)\.jsonl$')
+# How far back from the end of a segment to look for the last complete line
+TAIL_BYTES = 64 * 1024
+IMPORTED_MARKER = '.imported'
+
+
+class AuditLog:
+    def __init__(self, directory, legacy_file=None, max_segment_bytes=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.legacy_file = legacy_file
+        self.max_segment_bytes = max_segment_bytes
+        self._thread_lock = threading.Lock()
+        # (segment path, size) the cached last id was read at
+        self._last = (None, None, 0)
+        self._reset_index()
+
+    def exists(self):
+        return os.path.isdir(self.directory) or bool(self.legacy_file and os.path.exists(self.legacy_file))
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.directory)), exist_ok=True)
+        with self._thread_lock:
+            with open(self.directory + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ensure(self):
+        """Create the log directory, importing the legacy audit_events.json once."""
+        marker = os.path.join(self.directory, IMPORTED_MARKER)
+        if os.path.exists(marker):
+            return
+        with self._locked():
+            if os.path.exists(marker):
+                return
+            if self.segments():
+                # Imported before the marker existed
+                open(marker, 'a').close()
+                return
+            events = []
+            if self.legacy_file and os.path.exists(self.legacy_file):
+                # Raises on a corrupt file, and the import is retried on the next call
+                with open(self.legacy_file, 'r') as f:
+                    events = json.load(f)
+            self._rewrite(events)
+            if events:
+                logger.info(f"Imported {len(events)} audit events from {self.legacy_file}")
+
+    def segments(self):
+        """Return (first_id, month, path) for every segment, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append((int(match.group(2)), match.group(1), os.path.join(self.directory, name)))
+        segments.sort()
+        return segments
+
+    def _segment_path(self, month, first_id, directory=None):
+        return os.path.join(directory or self.directory, f'audit-{month}-{first_id:010d}.jsonl')
+
+    def _last_id(self, segments):
+        """Id of the newest event, read from the tail of the newest segment."""
+        if not segments:
+            return 0
+        first_id, _, path = segments[-1]
+        size = os.path.getsize(path)
+        if self._last[0] == path and self._last[1] == size:
+            return self._last[2]
+        last_id = first_id - 1
+        with open(path, 'rb') as f:
+            f.seek(max(0, size - TAIL_BYTES))
+            lines = f.read().split(b'\n')
+        for line in reversed(lines):
+            if line.strip():
+                try:
+                    last_id = int(json.loads(line)['id'])
+                    break
+                except ValueError:
+                    continue
+        self._last = (path, size, last_id)
+        return last_id
+
+    def append(self, event_type, user="system", details=None):
+        """Append one event and return it."""
+        self._ensure()
+        with self._locked():
+            segments = self.segments()
+            event_id = self._last_id(segments) + 1
+            now = datetime.now()
+            month = now.strftime('%Y-%m')
+            if (not segments or segments[-1][1] != month
+                    or os.path.getsize(segments[-1][2]) >= self.max_segment_bytes):
+                path = self._segment_path(month, event_id)
+            else:
+                path = segments[-1][2]
+            event = {
+                "id": str(event_id),
+                "type": event_type,
+                "user": user,
+                "timestamp": now.strftime(TIMESTAMP_FORMAT),
+                "details": details or {}
+            }
+            data = (json.dumps(event, separators=(',', ':')) + '\n').encode()
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            metrics.record_io('audit', written=len(data))
+            self._last = (path, size, event_id)
+            return event
+
+    def _reset_index(self):
+        # segment path -> bytes already indexed
+        self._offsets = {}
+        # (timestamp, id) keys and events in ascending order, overall and per type
+        self._index = ([], [])
+        self._type_index = {}
+        self._keys_by_id = {}
+
+    def _add_to_index(self, event):
+        key = (event['timestamp'], int(event['id']))
+        self._keys_by_id[event['id']] = key
+        for keys, events in (self._index, self._type_index.setdefault(event['type'], ([], []))):
+            if not keys or key > keys[-1]:
+                keys.append(key)
+                events.append(event)
+            else:
+                # Out-of-order timestamp (clock change); keep the index sorted
+                pos = bisect_right(keys, key)
+                keys.insert(pos, key)
+                events.insert(pos, event)
+
+    def _sync(self):
+        """Index events appended since the last call."""
+        self._ensure()
+        with self._thread_lock:
+            segments = self.segments()
+            paths = {path for _, _, path in segments}
+            if any(path not in paths or os.path.getsize(path) < offset
+                   for path, offset in self._offsets.items()):
+                # The log was rewritten; start over
+                self._reset_index()
+            for _, _, path in segments:
+                offset = self._offsets.get(path, 0)
+                if os.path.getsize(path) == offset:
+                    continue
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+                metrics.record_io('audit', read=len(data))
+                # Only index complete lines; a partially written one is picked up next time
+                end = data.rfind(b'\n') + 1
+                for line in data[:end].splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        self._add_to_index(json.loads(line))
+                    except (ValueError, KeyError):
+                        logger.error(f"Skipping corrupt audit entry in {path}: {line[:200]!r}")
+                self._offsets[path] = offset + end
+
+    def read_all(self):
+        """Every event, oldest first (shared, read-only)."""
+        self._sync()
+        with self._thread_lock:
+            return list(self._index[1])
+
+    def count(self):
+        """Number of events in the log."""
+        self._sync()
+        return len(self._index[0])
+
+    def _bounds(self, keys, start, end):
+        lo = bisect_left(keys, (start.strftime(TIMESTAMP_FORMAT), -1)) if start else 0
+        hi = bisect_right(keys, (end.strftime(TIMESTAMP_FORMAT), float('inf'))) if end else len(keys)
+        return lo, hi
+
+    def query(self, start=None, end=None, event_type=None):
+        """Events with start <= timestamp <= end (datetimes) and the given type, newest first."""
+        self._sync()
+        with self._thread_lock:
+            keys, events = self._type_index.get(event_type, ([], [])) if event_type else self._index
+            lo, hi = self._bounds(keys, start, end)
+            return events[lo:hi][::-1]
+
+    def query_page(self, start=None, end=None, event_type=None, limit=100, before=None, after=None):
+        """
+        One page of query() results, newest first.
+
+        before: return the newest `limit` events older than the event with this id.
+        after: return the oldest `limit` events newer than the event with this id.
+        Returns {'events': [...], 'before': cursor for the next older page or None,
+        'after': cursor for polling newer events}.
+        """
+        self._sync()
+        with self._thread_lock:
+            keys, events = self._type_index.get(event_type, ([], [])) if event_type else self._index
+            lo, hi = self._bounds(keys, start, end)
+            if before is not None:
+                key = self._keys_by_id.get(str(before))
+                if key is None:
+                    raise KeyError(f"Unknown audit cursor: {before}")
+                hi = min(hi, bisect_left(keys, key))
+            if after is not None:
+                key = self._keys_by_id.get(str(after))
+                if key is None:
+                    raise KeyError(f"Unknown audit cursor: {after}")
+                lo = max(lo, bisect_right(keys, key))
+                page_lo, page_hi = lo, min(hi, lo + limit)
+            else:
+                page_lo, page_hi = max(lo, hi - limit), hi
+            page = events[page_lo:page_hi][::-1]
+        return {
+            'events': page,
+            'before': page[-1]['id'] if page and page_lo > lo else None,
+            'after': page[0]['id'] if page else (str(after) if after is not None else None)
+        }
+
+    def replace_all(self, events):
+        """Rewrite the whole log (used when importing or restoring events)."""
+        with self._locked():
+            self._rewrite(events)
+
+    def _rewrite(self, events):
+        """Replace the segments with events, atomically. Called with the lock held."""
+        staging = self.directory + '.new'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        try:
+            self._write_segments(staging, events)
+            open(os.path.join(staging, IMPORTED_MARKER), 'w').close()
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        previous = self.directory + '.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.isdir(self.directory):
+            os.rename(self.directory, previous)
+        os.rename(staging, self.directory)
+        shutil.rmtree(previous, ignore_errors=True)
+        self._last = (None, None, 0)
+        self._reset_index()
+
+    def _write_segments(self, directory, events):
+        last_id = 0
+        handle = None
+        month = None
+        try:
+            for event in events:
+                # Legacy ids came from len(events) + 1 and may repeat; keep them monotonic
+                event_id = int(event['id']) if str(event.get('id', '')).isdigit() else 0
+                event_id = event_id if event_id > last_id else last_id + 1
+                event = dict(event, id=str(event_id))
+                event_month = event['timestamp'][:7]
+                if handle is None or event_month != month or handle.tell() >= self.max_segment_bytes:
+                    if handle is not None:
+                        handle.close()
+                    handle = open(self._segment_path(event_month, event_id, directory), 'w')
+                    month = event_month
+                handle.write(json.dumps(event, separators=(',', ':')) + '\n')
+                last_id = event_id
+        finally:
+            if handle is not None:
+                handle.close()
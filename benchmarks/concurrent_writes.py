@@ -0,0 +1,225 @@
+"""
+Hammer POST /api/shifts from several processes at once and check that no
+update is lost.
+
+    python benchmarks/concurrent_writes.py [--processes 8] [--requests 200] [--threads 2] [--backend json]
+
+Each writer process imports the app against the same temporary data
+directory (as gunicorn workers would share data/) and adds shifts through
+the Flask test client; a reader process keeps querying the shifts in the
+meantime. At the end every shift a writer was told it created must be
+stored, under a distinct id, and the reader must never have seen an
+error or the shift count go backwards.
+
+Then the same runs inside one process, as in a threaded (gthread) worker:
+writer threads add and delete shifts while reader threads query ranges,
+conflicts and hours and render /schedule, all sharing one shift store.
+Readers must never fail. Prints throughput and exits with status 1 on any
+lost update or failed read.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import DEFAULT_START, make_caregivers  # noqa: E402
+
+RANGE_START = DEFAULT_START.isoformat()
+RANGE_END = (DEFAULT_START + timedelta(days=3650)).isoformat()
+
+
+def import_app(data_dir, backend):
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['STORAGE_BACKEND'] = backend
+    import logging
+    logging.disable(logging.CRITICAL)
+    import app
+    return app
+
+
+def writer(worker, requests, data_dir, backend, start_event, results):
+    client = import_app(data_dir, backend).app.test_client()
+    begin = datetime.combine(DEFAULT_START, datetime.min.time())
+    created, failures = [], 0
+    start_event.wait()
+    for i in range(requests):
+        # Every request gets its own hour, so no shift overlaps another;
+        # allow_overtime because all of them may land on few caregivers
+        start = begin + timedelta(hours=worker * requests + i)
+        response = client.post('/api/shifts?allow_overtime=1', json={
+            'caregiver_id': str(1 + (worker + i) % 10),
+            'shift_type': 'G',
+            'start': start.strftime('%Y-%m-%d %H:%M'),
+            'end': (start + timedelta(minutes=50)).strftime('%Y-%m-%d %H:%M')
+        })
+        if response.status_code == 201:
+            created.append((response.get_json()['id'], response.get_json()['start']))
+        else:
+            failures += 1
+    results.put(('writer', created, failures))
+
+
+def reader(data_dir, backend, start_event, stop_event, results):
+    client = import_app(data_dir, backend).app.test_client()
+    start_event.wait()
+    reads, errors, regressions, last = 0, 0, 0, 0
+    while not stop_event.is_set():
+        response = client.get(f'/api/shifts?start={RANGE_START}&end={RANGE_END}')
+        reads += 1
+        if response.status_code != 200:
+            errors += 1
+            continue
+        count = len(response.get_json())
+        if count < last:
+            regressions += 1
+        last = count
+    results.put(('reader', reads, errors, regressions))
+
+
+def threaded(app, threads, requests):
+    """
+    Writer and reader threads on one app; returns (writes/s, created,
+    failed writes, reads, failed reads).
+    """
+    # Switch threads far more often than the default 5 ms, so a reader
+    # that is not isolated from the writers gets caught midway
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    backend = app.backend
+    # Past the hours the writer processes used
+    begin = datetime.combine(DEFAULT_START + timedelta(days=3000), datetime.min.time())
+    span = (begin, begin + timedelta(hours=threads * requests))
+    created, write_errors, read_errors = [], [], []
+    reads = [0]
+    stop_event = threading.Event()
+
+    def write(worker):
+        client = app.app.test_client()
+        for i in range(requests):
+            start = begin + timedelta(hours=worker * requests + i)
+            response = client.post('/api/shifts?allow_overtime=1', json={
+                'caregiver_id': str(1 + (worker + i) % 10),
+                'shift_type': 'G',
+                'start': start.strftime('%Y-%m-%d %H:%M'),
+                'end': (start + timedelta(minutes=50)).strftime('%Y-%m-%d %H:%M')
+            })
+            if response.status_code != 201:
+                write_errors.append(response.status_code)
+                continue
+            shift = response.get_json()
+            # Every third one is deleted again, so the store shrinks too
+            if i % 3 == 2:
+                if client.delete(f"/api/shifts/{shift['id']}").status_code != 200:
+                    write_errors.append('delete')
+            else:
+                created.append((shift['id'], shift['start']))
+
+    def read(worker):
+        client = app.app.test_client()
+        while not stop_event.is_set():
+            try:
+                backend.all_shifts()
+                backend.shifts_in_range(*span)
+                backend.shift_conflicts(*span)
+                backend.hours_by_week(0, 10 ** 6)
+                if worker == 0 and client.get('/schedule').status_code != 200:
+                    read_errors.append('/schedule')
+            except Exception as e:
+                read_errors.append(repr(e))
+            reads[0] += 1
+
+    writers = [threading.Thread(target=write, args=(i,)) for i in range(threads)]
+    readers = [threading.Thread(target=read, args=(i,)) for i in range(3)]
+    try:
+        began = time.perf_counter()
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        stop_event.set()
+        for thread in readers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    stored = {str(s['id']): s for s in backend.all_shifts()}
+    lost = [(shift_id, start) for shift_id, start in created
+            if shift_id not in stored or stored[shift_id]['start'] != start]
+    if read_errors:
+        print(f"  first failed read: {read_errors[0]}")
+    return threads * requests / elapsed, len(created), len(write_errors) + len(lost), reads[0], len(read_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='shifts added per process')
+    parser.add_argument('--threads', type=int, default=2, help='writer threads in the one-process run')
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    app = import_app(data_dir, args.backend)
+    seeded = app.backend
+    seeded.save_caregivers(make_caregivers(10))
+    seeded.replace_shifts([])
+
+    context = multiprocessing.get_context('spawn')
+    start_event, stop_event = context.Event(), context.Event()
+    results = context.Queue()
+    writers = [context.Process(target=writer, args=(i, args.requests, data_dir, args.backend, start_event, results))
+               for i in range(args.processes)]
+    watcher = context.Process(target=reader, args=(data_dir, args.backend, start_event, stop_event, results))
+    try:
+        for process in writers + [watcher]:
+            process.start()
+        # Let every process finish importing the app before the clock starts
+        time.sleep(3)
+        began = time.perf_counter()
+        start_event.set()
+        outcomes = [results.get(timeout=600) for _ in writers]
+        elapsed = time.perf_counter() - began
+        stop_event.set()
+        outcomes.append(results.get(timeout=60))
+        for process in writers + [watcher]:
+            process.join()
+
+        created = [item for outcome in outcomes if outcome[0] == 'writer' for item in outcome[1]]
+        failures = sum(outcome[2] for outcome in outcomes if outcome[0] == 'writer')
+        _, reads, read_errors, regressions = next(o for o in outcomes if o[0] == 'reader')
+
+        stored = {str(s['id']): s for s in seeded.all_shifts()}
+        duplicate_ids = len(created) - len({shift_id for shift_id, _ in created})
+        lost = [(shift_id, start) for shift_id, start in created
+                if shift_id not in stored or stored[shift_id]['start'] != start]
+
+        thread_rate, thread_created, thread_failures, thread_reads, thread_read_errors = threaded(
+            app, args.threads, args.requests)
+    finally:
+        shutil.rmtree(data_dir)
+
+    total = args.processes * args.requests
+    print(f"{args.processes} processes x {args.requests} add_shift requests ({args.backend} backend)")
+    print(f"  {total / elapsed:.0f} writes/s over {elapsed:.2f} s, {failures} failed")
+    print(f"  {len(created)} created, {len(stored)} stored, {duplicate_ids} duplicate ids, {len(lost)} lost")
+    print(f"  reader: {reads} queries, {read_errors} errors, {regressions} times the count went backwards")
+    print(f"{args.threads} writer threads x {args.requests} add_shift requests, 3 reader threads, one process")
+    print(f"  {thread_rate:.0f} writes/s, {thread_created} kept, {thread_failures} failed or lost")
+    print(f"  readers: {thread_reads} queries, {thread_read_errors} errors")
+    if (failures or duplicate_ids or lost or len(stored) != total or read_errors or regressions
+            or thread_failures or thread_read_errors):
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Endpoint latency and memory on synthetic datasets of increasing size.
+
+    python benchmarks/endpoints.py [--sizes small,medium,large] [--backend json|sqlite|both]
+                                   [--repeat 50] [--output results.json] [--compare earlier.json]
+
+For every dataset size (see synthetic.SIZES) a data directory is generated
+and a fresh process imports the app against it, then drives the Flask test
+client through the shift, ICS, template and audit APIs and the page
+routes. Per endpoint it reports the first call (cold caches) and the p50,
+p90, p99 and max of the following calls; per process it reports the
+startup time and peak RSS. Results are saved as JSON (by default under
+benchmarks/results/) along with the commit and Python version, and
+--compare prints the change in p50/p99 against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+PAGES = ['/', '/schedule', '/weekly', '/weekly_viewer', '/weekly_views', '/monthly', '/hourly', '/calendar', '/audit']
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(first, samples, errors):
+    samples = sorted(samples)
+    return {
+        'first_ms': round(first, 3),
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p90_ms': round(percentile(samples, 0.90), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'max_ms': round(samples[-1], 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'requests': len(samples) + 1,
+        'errors': errors
+    }
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_endpoints(data_dir, backend_name, repeat, weeks):
+    """Child process: import the app against data_dir and time every endpoint."""
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['STORAGE_BACKEND'] = backend_name
+    import logging
+    logging.disable(logging.CRITICAL)
+    began = time.perf_counter()
+    import app
+    from synthetic import DEFAULT_START
+    app.init_data()
+    startup_ms = (time.perf_counter() - began) * 1000
+    rss_after_startup = peak_rss_kb()
+
+    client = app.app.test_client()
+    rng = random.Random(0)
+    template_ids = [t['id'] for t in app.load_templates()]
+
+    def day(offset_days=0):
+        return (DEFAULT_START + timedelta(weeks=rng.randrange(weeks), days=offset_days)).isoformat()
+
+    def shifts_range(days):
+        start = DEFAULT_START + timedelta(weeks=rng.randrange(weeks))
+        return f'start={start.isoformat()}&end={(start + timedelta(days=days - 1)).isoformat()}'
+
+    cases = [
+        ('GET /api/shifts (week)', repeat, lambda: client.get(f'/api/shifts?{shifts_range(7)}')),
+        ('GET /api/shifts (28 days)', repeat, lambda: client.get(f'/api/shifts?{shifts_range(28)}')),
+        ('GET /api/shifts/download-ics (28 days)', repeat,
+         lambda: client.get(f'/api/shifts/download-ics?{shifts_range(28)}')),
+        ('POST /api/templates/<id>/apply (1 week)', max(5, repeat // 5),
+         lambda: client.post(f'/api/templates/{rng.choice(template_ids)}/apply?allow_overlap=1&allow_overtime=1',
+                             json={'start_date': day(), 'num_weeks': 1})),
+        ('GET /api/audit-events (page of 100)', repeat, lambda: client.get('/api/audit-events?limit=100')),
+        ('GET /api/audit-events (type, 30 days)', repeat,
+         lambda: client.get(f'/api/audit-events?type=Shift%20Deleted&start={day()}&end={day(29)}')),
+    ]
+    cases += [(f'GET {page}', max(5, repeat // 5), lambda page=page: client.get(page)) for page in PAGES]
+
+    endpoints = {}
+    for name, count, call in cases:
+        timings, errors = [], 0
+        for _ in range(count + 1):
+            begin = time.perf_counter()
+            response = call()
+            response.get_data()
+            timings.append((time.perf_counter() - begin) * 1000)
+            if response.status_code != 200:
+                errors += 1
+        endpoints[name] = summarize(timings[0], timings[1:], errors)
+
+    return {
+        'startup_ms': round(startup_ms, 1),
+        'rss_after_startup_kb': rss_after_startup,
+        'peak_rss_kb': peak_rss_kb(),
+        'endpoints': endpoints
+    }
+
+
+def build_data_dir(dataset, backend_name):
+    from sqlite_backend import SqliteBackend
+    from storage_backends import json_backend
+    from synthetic import save_dataset
+
+    data_dir = tempfile.mkdtemp()
+    source = json_backend(data_dir)
+    save_dataset(source, dataset)
+    if backend_name == 'sqlite':
+        SqliteBackend(os.path.join(data_dir, 'scheduler.db')).migrate_from(source)
+    return data_dir
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    for size, by_backend in results['sizes'].items():
+        counts = by_backend['dataset']
+        print(f"\n{size}: {counts['caregivers']} caregivers, {counts['templates']} templates, "
+              f"{counts['shifts']} shifts, {counts['audit_events']} audit events")
+        for backend_name, run in by_backend.items():
+            if backend_name == 'dataset':
+                continue
+            print(f"  [{backend_name}] startup {run['startup_ms']:.0f} ms, "
+                  f"peak RSS {run['peak_rss_kb'] / 1024:.1f} MiB (after startup {run['rss_after_startup_kb'] / 1024:.1f} MiB)")
+            print(f"  {'endpoint':42}{'first':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+            for name, stats in run['endpoints'].items():
+                flag = f"  {stats['errors']} errors" if stats['errors'] else ''
+                print(f"  {name:42}{stats['first_ms']:9.2f}{stats['p50_ms']:9.2f}{stats['p90_ms']:9.2f}"
+                      f"{stats['p99_ms']:9.2f}{stats['max_ms']:9.2f}{flag}")
+
+
+def print_comparison(results, baseline):
+    print(f"\nchange against {baseline.get('commit') or 'baseline'} ({baseline.get('started')})")
+    print(f"  {'size/backend':16}{'endpoint':42}{'p50':>18}{'p99':>18}")
+    for size, by_backend in results['sizes'].items():
+        for backend_name, run in by_backend.items():
+            before = baseline.get('sizes', {}).get(size, {}).get(backend_name)
+            if backend_name == 'dataset' or not before:
+                continue
+            for name, stats in run['endpoints'].items():
+                old = before['endpoints'].get(name)
+                if not old:
+                    continue
+                changes = [f"{old[key]:.2f} -> {stats[key]:.2f}" for key in ('p50_ms', 'p99_ms')]
+                print(f"  {size + '/' + backend_name:16}{name:42}{changes[0]:>18}{changes[1]:>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='small,medium', help='comma-separated names from synthetic.SIZES')
+    parser.add_argument('--backend', choices=['json', 'sqlite', 'both'], default='json')
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per API endpoint')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/endpoints-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--child', nargs=3, metavar=('DATA_DIR', 'BACKEND', 'WEEKS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        data_dir, backend_name, weeks = args.child
+        print(json.dumps(run_endpoints(data_dir, backend_name, args.repeat, int(weeks))))
+        return
+
+    from app import AUDIT_EVENT_TYPES, SHIFT_DEFINITIONS
+    from synthetic import SIZES, make_dataset
+
+    backends = ['json', 'sqlite'] if args.backend == 'both' else [args.backend]
+    results = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'sizes': {}
+    }
+    for size in args.sizes.split(','):
+        params = SIZES[size]
+        dataset = make_dataset(SHIFT_DEFINITIONS, list(AUDIT_EVENT_TYPES.values()), **params)
+        by_backend = results['sizes'][size] = {
+            'dataset': dict({kind: len(items) for kind, items in dataset.items()}, years=params['years'])
+        }
+        for backend_name in backends:
+            print(f"{size} / {backend_name} ...", file=sys.stderr)
+            data_dir = build_data_dir(dataset, backend_name)
+            try:
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--repeat', str(args.repeat),
+                     '--child', data_dir, backend_name, str(params['years'] * 52)],
+                    cwd=ROOT, capture_output=True, text=True, check=True)
+            finally:
+                shutil.rmtree(data_dir)
+            by_backend[backend_name] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"endpoints-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nsaved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
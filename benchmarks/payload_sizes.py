@@ -0,0 +1,123 @@
+"""
+Bytes on disk and on the wire for a year of synthetic shifts.
+
+    python benchmarks/payload_sizes.py [--caregivers 30] [--weeks 52] [--per-slot 3] [--repeat 20]
+
+Disk: writes the data files with indent=2 (the old format) and compact
+(the default now) and prints their sizes and the median time to write
+and parse shifts.json. Wire: serves the compact files through the Flask
+test client and prints, per endpoint, the body size without and with
+Accept-Encoding: gzip and the median request time of each, so the cost
+of compressing shows next to the bytes it saves. Responses under
+GZIP_MIN_BYTES stay uncompressed, as they would in production.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_FILES = ['caregivers.json', 'templates.json', 'shifts.json']
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - begin) * 1000)
+    return statistics.median(samples)
+
+
+def write_files(directory, indent, caregivers, templates, shifts, repeat):
+    """Save the dataset with this indent; returns (sizes, write ms, parse ms) for shifts.json."""
+    import storage
+    from storage_backends import json_backend
+
+    backend = json_backend(directory)
+    backend.indent = indent
+    backend.shifts.indent = indent
+    backend.save_caregivers(caregivers)
+    backend.save_templates(templates)
+    write_ms = median_ms(lambda: backend.replace_shifts(shifts), repeat)
+    path = os.path.join(directory, 'shifts.json')
+
+    def parse():
+        with open(path) as f:
+            json.load(f)
+
+    parse_ms = median_ms(parse, repeat)
+    storage.invalidate()
+    return {name: os.path.getsize(os.path.join(directory, name)) for name in DATA_FILES}, write_ms, parse_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--caregivers', type=int, default=30)
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--per-slot', type=int, default=3, help='caregivers per shift slot')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    indented_dir, compact_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    # The app must see the compact data directory when it is imported
+    os.environ['DATA_DIR'] = compact_dir
+    import logging
+    logging.disable(logging.CRITICAL)
+    import app
+    from synthetic import DEFAULT_START, make_caregivers, make_shifts, make_templates
+
+    caregivers = make_caregivers(args.caregivers)
+    shifts = make_shifts(caregivers, app.SHIFT_DEFINITIONS, args.weeks, per_slot=args.per_slot)
+    templates = make_templates(20, caregivers, app.SHIFT_DEFINITIONS)
+    try:
+        before = write_files(indented_dir, 2, caregivers, templates, shifts, max(3, args.repeat // 4))
+        after = write_files(compact_dir, None, caregivers, templates, shifts, max(3, args.repeat // 4))
+
+        print(f"{len(shifts)} shifts, {len(caregivers)} caregivers, {len(templates)} templates")
+        print(f"\n{'data file':20}{'indent=2':>12}{'compact':>12}{'saved':>8}")
+        for name in DATA_FILES:
+            old, new = before[0][name], after[0][name]
+            print(f"{name:20}{old:12,}{new:12,}{1 - new / old:8.0%}")
+        print(f"{'shifts.json write':20}{before[1]:10.1f}ms{after[1]:10.1f}ms")
+        print(f"{'shifts.json parse':20}{before[2]:10.1f}ms{after[2]:10.1f}ms")
+
+        app.init_data()
+        client = app.app.test_client()
+        start = DEFAULT_START
+
+        def shifts_query(days):
+            return f'/api/shifts?start={start.isoformat()}&end={(start + timedelta(days=days - 1)).isoformat()}'
+
+        cases = [
+            ('GET /api/caregivers', '/api/caregivers'),
+            ('GET /api/shifts (week)', shifts_query(7)),
+            ('GET /api/shifts (28 days)', shifts_query(28)),
+            ('GET /api/shifts (90 days)', shifts_query(90)),
+            ('GET /api/shifts (year)', shifts_query(364)),
+            ('GET /api/shifts/download-ics (year)',
+             f'/api/shifts/download-ics?start={start.isoformat()}&end={(start + timedelta(days=363)).isoformat()}'),
+            ('GET /schedule', '/schedule')
+        ]
+        print(f"\nresponses (GZIP_MIN_BYTES={app.GZIP_MIN_BYTES}, GZIP_LEVEL={app.GZIP_LEVEL})")
+        print(f"{'endpoint':38}{'identity':>12}{'gzip':>12}{'saved':>8}{'ms':>9}{'gzip ms':>9}")
+        for name, url in cases:
+            sizes, times = [], []
+            for headers in ({}, {'Accept-Encoding': 'gzip'}):
+                sizes.append(len(client.get(url, headers=headers).get_data()))
+                times.append(median_ms(lambda: client.get(url, headers=headers).get_data(), args.repeat))
+            print(f"{name:38}{sizes[0]:12,}{sizes[1]:12,}{1 - sizes[1] / sizes[0]:8.0%}{times[0]:9.2f}{times[1]:9.2f}")
+    finally:
+        shutil.rmtree(indented_dir)
+        shutil.rmtree(compact_dir)
+
+
+if __name__ == '__main__':
+    main()
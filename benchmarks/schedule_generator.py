@@ -0,0 +1,65 @@
+"""
+Time the template generator on generated rosters and coverage requirements.
+
+    python benchmarks/schedule_generator.py [--rosters 10,20,30,50] [--runs 20] [--budget-ms 500]
+
+For each roster size and coverage level, prints the median and worst
+solve time over seeded runs, how many shifts were required and left
+unfilled on average, and the spread of load (assigned hours / max_hours)
+across caregivers.
+Exits with status 1 if a median solve time goes over the budget.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import SHIFT_DEFINITIONS  # noqa: E402
+from schedule_generator import generate_template  # noqa: E402
+from synthetic import make_caregivers, make_coverage  # noqa: E402
+
+# (label, low, high): caregivers required per shift type per day
+COVERAGE_LEVELS = [('1 per slot', 1, 1), ('1-2 per slot', 1, 2), ('2-3 per slot', 2, 3)]
+
+
+def run(roster_size, low, high, runs, budget):
+    samples, required, unfilled, spreads = [], [], [], []
+    for seed in range(runs):
+        caregivers = make_caregivers(roster_size, seed=seed)
+        coverage = make_coverage(SHIFT_DEFINITIONS, low, high, seed=seed)
+        begin = time.perf_counter()
+        result = generate_template(coverage, caregivers, SHIFT_DEFINITIONS, time_budget=budget, seed=seed)
+        samples.append((time.perf_counter() - begin) * 1000)
+        required.append(sum(sum(daily) for daily in coverage.values()))
+        unfilled.append(sum(u['missing'] for u in result['unfilled']))
+        shares = [result['minutes'][str(c['id'])] / (c['max_hours'] * 60) for c in caregivers]
+        spreads.append(max(shares) - min(shares))
+    return (statistics.median(samples), max(samples), statistics.mean(required),
+            statistics.mean(unfilled), statistics.mean(spreads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rosters', default='10,20,30,50', help='comma-separated roster sizes')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=int, default=500)
+    args = parser.parse_args()
+
+    budget = args.budget_ms / 1000
+    slow = False
+    print(f"{'caregivers':>10}  {'coverage':14}{'median ms':>10}{'max ms':>10}{'required':>10}{'unfilled':>10}{'spread':>8}")
+    for roster_size in (int(n) for n in args.rosters.split(',')):
+        for label, low, high in COVERAGE_LEVELS:
+            median, worst, required, unfilled, spread = run(roster_size, low, high, args.runs, budget)
+            slow = slow or median > args.budget_ms
+            print(f"{roster_size:>10}  {label:14}{median:10.1f}{worst:10.1f}{required:10.1f}{unfilled:10.1f}{spread:8.2f}")
+    if slow:
+        print(f"\nmedian solve time over the {args.budget_ms} ms budget")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
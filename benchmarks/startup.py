@@ -0,0 +1,123 @@
+"""
+Measure worker cold start: importing app, running init_data and serving
+the first requests, each in a fresh interpreter like a newly spawned
+gunicorn worker.
+
+    python benchmarks/startup.py [--runs 10] [--weeks 52] [--max-import-ms N] [--imports 15]
+
+"empty" starts from an empty data directory (first boot, init_data creates
+everything); "existing" from a synthetic dataset. Prints the median of
+each phase. With --max-import-ms, exits with status 1 if the median
+import time is over it; --imports lists the slowest modules reported by
+python -X importtime.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import SHIFT_DEFINITIONS  # noqa: E402
+from synthetic import DEFAULT_START, make_caregivers, make_shifts  # noqa: E402
+
+CHILD = """
+import json, logging, sys, time
+began = time.perf_counter()
+logging.disable(logging.CRITICAL)
+import app
+imported = time.perf_counter()
+app.init_data()
+initialized = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/caregivers')
+client.get('/api/shifts?start={week}&end={week}')
+served = time.perf_counter()
+print(json.dumps({{
+    'import app': (imported - began) * 1000,
+    'init_data': (initialized - imported) * 1000,
+    'first requests': (served - initialized) * 1000,
+    'total': (served - began) * 1000
+}}))
+"""
+
+
+def start_worker(data_dir, args=()):
+    env = dict(os.environ, DATA_DIR=data_dir)
+    code = CHILD.format(week=DEFAULT_START.isoformat())
+    result = subprocess.run([sys.executable, *args, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return result
+
+
+def measure(make_data_dir, runs):
+    samples = {}
+    for _ in range(runs):
+        data_dir = make_data_dir()
+        try:
+            timings = json.loads(start_worker(data_dir).stdout.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(data_dir)
+        for phase, ms in timings.items():
+            samples.setdefault(phase, []).append(ms)
+    return {phase: statistics.median(values) for phase, values in samples.items()}
+
+
+def slowest_imports(data_dir, count):
+    """(cumulative ms, module) for the slowest imports, from python -X importtime."""
+    stderr = start_worker(data_dir, ['-X', 'importtime']).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--weeks', type=int, default=52, help='weeks of shifts in the existing dataset')
+    parser.add_argument('--max-import-ms', type=float)
+    parser.add_argument('--imports', type=int, default=0, help='list this many of the slowest imports')
+    args = parser.parse_args()
+
+    caregivers = make_caregivers(30)
+    shifts = make_shifts(caregivers, SHIFT_DEFINITIONS, args.weeks)
+
+    def existing():
+        data_dir = tempfile.mkdtemp()
+        for name, value in (('caregivers.json', caregivers), ('shifts.json', shifts)):
+            with open(os.path.join(data_dir, name), 'w') as f:
+                json.dump(value, f)
+        return data_dir
+
+    results = {'empty': measure(tempfile.mkdtemp, args.runs), 'existing': measure(existing, args.runs)}
+
+    print(f"{'phase (median ms)':20}{'empty':>10}{'existing':>10}")
+    for phase in results['empty']:
+        print(f"{phase:20}{results['empty'][phase]:10.1f}{results['existing'][phase]:10.1f}")
+
+    if args.imports:
+        data_dir = existing()
+        try:
+            print("\nslowest imports (cumulative ms)")
+            for ms, name in slowest_imports(data_dir, args.imports):
+                print(f"{ms:10.1f}  {name}")
+        finally:
+            shutil.rmtree(data_dir)
+
+    import_ms = max(results['empty']['import app'], results['existing']['import app'])
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"\nimporting app took {import_ms:.1f} ms, over the {args.max_import_ms} ms limit")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare the JSON and SQLite storage backends on the same synthetic dataset.
+
+    python benchmarks/storage_backends.py [--caregivers 30] [--weeks 52] [--audit-events 20000]
+
+Prints the median time per operation for each backend.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from sqlite_backend import SqliteBackend  # noqa: E402
+from app import AUDIT_EVENT_TYPES, SHIFT_DEFINITIONS  # noqa: E402
+from synthetic import DEFAULT_START, make_audit_events, make_caregivers, make_shifts, make_templates  # noqa: E402
+
+
+def json_backend(directory):
+    path = lambda name: os.path.join(directory, name)  # noqa: E731
+    return storage.JsonBackend(
+        caregivers_file=path('caregivers.json'),
+        shifts_file=path('shifts.json'),
+        shifts_journal_file=path('shifts.journal'),
+        templates_file=path('templates.json'),
+        week_states_file=path('week_states.json'),
+        audit_log_dir=path('audit')
+    )
+
+
+def timed(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        begin = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - begin) * 1000)
+    return statistics.median(samples)
+
+
+def run(make_backend, dataset, repeat):
+    caregivers, shifts, templates, events = dataset
+    backend = make_backend()
+    backend.save_caregivers(caregivers)
+    backend.save_templates(templates)
+    backend.save_audit_events(events)
+    backend.replace_shifts(shifts)
+    storage.invalidate()
+
+    week = datetime.combine(DEFAULT_START, datetime.min.time())
+    weeks = len(shifts) // (7 * len(SHIFT_DEFINITIONS) * 3)
+    next_id = int(shifts[-1]['id']) + 1
+    results = {}
+
+    def cold_week(i):
+        # A fresh backend, as in a newly started worker
+        storage.invalidate()
+        make_backend().shifts_in_range(week, week + timedelta(days=6, hours=23, minutes=59))
+
+    results['cold load + week query'] = timed(cold_week, max(1, repeat // 20))
+
+    def week_query(i):
+        start = week + timedelta(weeks=i % weeks)
+        backend.shifts_in_range(start, start + timedelta(days=6, hours=23, minutes=59))
+
+    results['week range query'] = timed(week_query, repeat)
+
+    def month_query(i):
+        start = week + timedelta(weeks=i % max(1, weeks - 4))
+        backend.shifts_in_range(start, start + timedelta(days=27, hours=23, minutes=59))
+
+    results['28-day range query'] = timed(month_query, repeat)
+
+    def add_shift(i):
+        shift = dict(shifts[i], id=str(next_id + i))
+        backend.write_shifts(puts=[shift])
+
+    results['add one shift'] = timed(add_shift, repeat)
+    results['delete one shift'] = timed(lambda i: backend.write_shifts(deletes=[str(next_id + i)]), repeat)
+    results['append audit event'] = timed(
+        lambda i: backend.append_audit_event(AUDIT_EVENT_TYPES['SHIFT_ADDED'], 'system', {'shift_id': str(i)}),
+        max(1, repeat // 4))
+    results['audit query (type, 30 days)'] = timed(
+        lambda i: backend.query_audit_events(week + timedelta(days=i % 300), week + timedelta(days=i % 300 + 30),
+                                             AUDIT_EVENT_TYPES['SHIFT_DELETED']),
+        max(1, repeat // 4))
+    results['load caregivers'] = timed(lambda i: backend.load_caregivers(), repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--caregivers', type=int, default=30)
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--audit-events', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    caregivers = make_caregivers(args.caregivers)
+    dataset = (caregivers,
+               make_shifts(caregivers, SHIFT_DEFINITIONS, args.weeks),
+               make_templates(10, caregivers, SHIFT_DEFINITIONS),
+               make_audit_events(args.audit_events, list(AUDIT_EVENT_TYPES.values())))
+    print(f"{args.caregivers} caregivers, {len(dataset[1])} shifts, {len(dataset[3])} audit events\n")
+
+    directory = tempfile.mkdtemp()
+    try:
+        results = {
+            'json': run(lambda: json_backend(os.path.join(directory, 'json')), dataset, args.repeat),
+            'sqlite': run(lambda: SqliteBackend(os.path.join(directory, 'sqlite', 'scheduler.db')), dataset, args.repeat)
+        }
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"{'operation (median ms)':32}{'json':>10}{'sqlite':>10}")
+    for operation in results['json']:
+        print(f"{operation:32}{results['json'][operation]:10.3f}{results['sqlite'][operation]:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
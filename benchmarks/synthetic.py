@@ -0,0 +1,121 @@
+"""
+Synthetic scheduler datasets for benchmarks.
+
+Everything is generated from a seeded random.Random so runs are
+reproducible and two backends can be fed exactly the same data.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+from shift_index import format_minutes, to_minutes
+
+DEFAULT_START = date(2025, 1, 6)  # a Monday
+
+
+def make_caregivers(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': i,
+            'name': f'Caregiver {i}',
+            'max_hours': rng.choice([24, 32, 40, 40, 40, 48]),
+            'color': f'#{rng.randrange(0x1000000):06x}'
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def make_shifts(caregivers, shift_definitions, weeks, per_slot=3, start=DEFAULT_START, seed=0):
+    """per_slot shifts for every shift type on every day, assigned at random."""
+    rng = random.Random(seed)
+    shifts = []
+    next_id = 1
+    for day in range(weeks * 7):
+        day_str = (start + timedelta(days=day)).isoformat()
+        for shift_type, definition in shift_definitions.items():
+            begin = to_minutes(f"{day_str} {definition['start']}")
+            end = to_minutes(f"{day_str} {definition['end']}")
+            if end <= begin:
+                end += 1440
+            for _ in range(per_slot):
+                caregiver = rng.choice(caregivers)
+                shifts.append({
+                    'id': str(next_id),
+                    'caregiver_id': str(caregiver['id']),
+                    'shift_type': shift_type,
+                    'start': format_minutes(begin),
+                    'end': format_minutes(end),
+                    'caregiver_name': caregiver['name'],
+                    'color': caregiver['color']
+                })
+                next_id += 1
+    return shifts
+
+
+def make_templates(count, caregivers, shift_definitions, per_slot=1, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': str(i),
+            'name': f'Template {i}',
+            'shifts': [
+                {'day': day, 'caregiver_id': str(rng.choice(caregivers)['id']), 'shift_type': shift_type}
+                for day in range(7) for shift_type in shift_definitions for _ in range(per_slot)
+            ]
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def make_coverage(shift_definitions, low=1, high=1, seed=0):
+    """Generator coverage: low..high caregivers for every shift type on every day."""
+    rng = random.Random(seed)
+    return {shift_type: [rng.randint(low, high) for _ in range(7)] for shift_type in shift_definitions}
+
+
+def make_audit_events(count, types, start=DEFAULT_START, days=365, seed=0):
+    """count events spread evenly over days, oldest first."""
+    rng = random.Random(seed)
+    begin = datetime.combine(start, datetime.min.time())
+    step = days * 86400 / max(count, 1)
+    return [
+        {
+            'id': str(i + 1),
+            'type': rng.choice(types),
+            'user': 'system',
+            'timestamp': (begin + timedelta(seconds=int(i * step))).strftime('%Y-%m-%d %H:%M:%S'),
+            'details': {'shift_id': str(rng.randrange(1, 10000)), 'shift_type': 'G', 'caregiver_id': '1'}
+        }
+        for i in range(count)
+    ]
+
+
+# Dataset sizes for the endpoint benchmarks: caregivers, templates, years of
+# applied shifts, caregivers per shift type per day, audit events
+SIZES = {
+    'small': {'caregivers': 10, 'templates': 5, 'years': 1, 'per_slot': 1, 'audit_events': 5000},
+    'medium': {'caregivers': 30, 'templates': 20, 'years': 2, 'per_slot': 2, 'audit_events': 50000},
+    'large': {'caregivers': 60, 'templates': 50, 'years': 5, 'per_slot': 3, 'audit_events': 250000}
+}
+
+
+def make_dataset(shift_definitions, event_types, caregivers=30, templates=20, years=2, per_slot=2,
+                 audit_events=50000, seed=0):
+    """Everything a data directory holds, as {'caregivers', 'templates', 'shifts', 'audit_events'}."""
+    roster = make_caregivers(caregivers, seed=seed)
+    weeks = years * 52
+    return {
+        'caregivers': roster,
+        'templates': make_templates(templates, roster, shift_definitions, seed=seed),
+        'shifts': make_shifts(roster, shift_definitions, weeks, per_slot=per_slot, seed=seed),
+        'audit_events': make_audit_events(audit_events, event_types, days=weeks * 7, seed=seed)
+    }
+
+
+def save_dataset(backend, dataset):
+    """Write a make_dataset() result through a storage backend."""
+    backend.save_caregivers(dataset['caregivers'])
+    backend.save_templates(dataset['templates'])
+    backend.replace_shifts(dataset['shifts'])
+    backend.save_audit_events(dataset['audit_events'])
+    backend.save_week_states({})
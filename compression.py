@@ -0,0 +1,66 @@
+"""
+gzip content encoding for API responses.
+
+gzip_response() compresses a response when the client sends
+Accept-Encoding: gzip, the body is a compressible type (JSON, text,
+calendars, JavaScript) and, for buffered bodies, at least min_size bytes;
+smaller bodies cost more CPU to compress than they save on the wire.
+Streamed bodies (the ICS feeds) are compressed chunk by chunk as they are
+generated, without buffering them.
+
+A gzipped body is a different representation of the resource, so a strong
+ETag gets ETAG_SUFFIX appended: a cache must not answer a client that
+cannot decode gzip with the compressed bytes. Weak ETags already compare
+equal across encodings and are left alone.
+"""
+import gzip
+import zlib
+
+ETAG_SUFFIX = '-gzip'
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+# Server-Sent Events must reach the client as each event is written, which
+# a deflate stream would hold back until its buffer fills
+UNCOMPRESSED_TYPES = ('text/event-stream',)
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.accept_encodings and request.accept_encodings['gzip'] > 0
+
+
+def _compressible(response):
+    mimetype = response.mimetype or ''
+    return (response.status_code == 200
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and mimetype.startswith(COMPRESSIBLE_TYPES)
+            and not mimetype.startswith(UNCOMPRESSED_TYPES))
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk if isinstance(chunk, bytes) else chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def gzip_response(request, response, min_size=1024, level=1):
+    """Compress response in place if the request and response allow it; returns it."""
+    response.vary.add('Accept-Encoding')
+    if not accepts_gzip(request) or not _compressible(response):
+        return response
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag + ETAG_SUFFIX)
+    return response
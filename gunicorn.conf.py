@@ -0,0 +1,52 @@
+# Picked up automatically by `gunicorn app:app` (see render.yaml).
+import os
+import signal
+
+# Import the app once in the master and fork workers from it, so boots and
+# respawns skip the imports and start with the shift store already loaded.
+# Storage handles the fork: SQLite connections are per process, JSON data
+# is stat-checked on every read and no lock is held across requests.
+preload_app = True
+
+# Threaded workers: every open /api/events stream holds a thread for its
+# lifetime, which a sync worker could only do by blocking every other
+# request. Keep threads above EVENTS_MAX_STREAMS so normal requests always
+# find a free one. Threads of a worker share its shift store and audit
+# index; readers hold the store's in-process lock while a writer thread
+# changes them (storage.JournaledStore.reading), and the threaded run of
+# benchmarks/concurrent_writes.py checks that readers never fail.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported; forked
+    # workers inherit the result. Metrics start from zero on every server
+    # start, and the master's own startup calls are not counted by a worker
+    from app import init_data, metrics
+    init_data()
+    metrics.current.reset()
+
+
+def post_worker_init(worker):
+    # init_data only does anything when the app was not preloaded (e.g.
+    # --reload); it is idempotent and takes the writer lock, so workers
+    # starting together do not race
+    from app import init_data, notifier
+    init_data()
+
+    # End open /api/events streams as soon as the worker is told to stop;
+    # otherwise shutdowns and redeploys wait graceful_timeout for them
+    handle_exit = worker.handle_exit
+
+    def stop(sig, frame):
+        notifier.current.close()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, stop)
+
+
+def worker_exit(server, worker):
+    # Removes the worker's notification socket (see notifier.py)
+    from app import notifier
+    notifier.current.close()
@@ -0,0 +1,91 @@
+"""
+Worked-hours rollup per caregiver per day and per ISO week.
+
+HoursRollup is a view of the shift store (see storage.JournaledStore):
+it is rebuilt once when the store loads and then adjusted by each
+put/delete, so totals are always current without rescanning shifts.
+
+A shift counts toward the day (and week) it starts on, the same rule the
+range queries use. Days are date ordinals and weeks are numbered from
+0001-01-01, which was a Monday, so ISO week arithmetic is integer
+division: week = (day - 1) // 7.
+"""
+from datetime import date
+
+from shift_index import MINUTES_PER_DAY, to_minutes
+
+
+def week_of(day):
+    """ISO week number (counted from 0001-01-01) of a date ordinal."""
+    return (day - 1) // 7
+
+
+def week_monday(week):
+    """Date ordinal of the Monday starting this week."""
+    return week * 7 + 1
+
+
+def day_label(day):
+    return date.fromordinal(day).isoformat()
+
+
+class HoursRollup:
+    def __init__(self, shifts=()):
+        self.reset(shifts)
+
+    def reset(self, shifts):
+        # caregiver id -> {day ordinal: minutes} / {week: minutes}
+        self._days = {}
+        self._weeks = {}
+        for shift in shifts:
+            self._add(shift, 1)
+
+    def put(self, old, new):
+        if old is not None:
+            self._add(old, -1)
+        self._add(new, 1)
+
+    def delete(self, old):
+        self._add(old, -1)
+
+    def _add(self, shift, sign):
+        start = to_minutes(shift['start'])
+        minutes = sign * (to_minutes(shift['end']) - start)
+        day = start // MINUTES_PER_DAY
+        caregiver_id = str(shift['caregiver_id'])
+        for totals, key in ((self._days, day), (self._weeks, week_of(day))):
+            by_key = totals.setdefault(caregiver_id, {})
+            value = by_key.get(key, 0) + minutes
+            if value:
+                by_key[key] = value
+            else:
+                del by_key[key]
+                if not by_key:
+                    del totals[caregiver_id]
+
+    def week_minutes(self, caregiver_id, week):
+        return self._weeks.get(str(caregiver_id), {}).get(week, 0)
+
+    def day_minutes(self, caregiver_id, day):
+        return self._days.get(str(caregiver_id), {}).get(day, 0)
+
+    def by_week(self, first_week, last_week):
+        """{caregiver id: {week: minutes}} for weeks in [first_week, last_week]."""
+        return self._slice(self._weeks, first_week, last_week)
+
+    def by_day(self, first_day, last_day):
+        """{caregiver id: {day ordinal: minutes}} for days in [first_day, last_day]."""
+        return self._slice(self._days, first_day, last_day)
+
+    def _slice(self, totals, first, last):
+        result = {}
+        span = last - first + 1
+        for caregiver_id, by_key in totals.items():
+            # Walk whichever side is smaller: the requested span or the caregiver's entries
+            if span < len(by_key):
+                values = {k: by_key[k] for k in range(first, last + 1) if k in by_key}
+            else:
+                values = {k: v for k, v in by_key.items() if first <= k <= last}
+            if values:
+                result[caregiver_id] = values
+        return result
@@ -0,0 +1,93 @@
+"""
+Streaming iCalendar (RFC 5545) writer for shift exports.
+
+iter_calendar() is a generator that yields the calendar header, then one
+VEVENT per shift as soon as it is formatted, then the footer, so a large
+export starts sending immediately and never holds the whole document in
+memory. Output matches what the icalendar package produced for the same
+events (CRLF line endings, lines folded at 75 octets).
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from shift_index import MINUTES_PER_DAY
+
+PRODID = '-//Caregiver Scheduler//EN'
+
+
+def escape_text(value):
+    """Escape a TEXT property value."""
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Encode one content line, folded to at most 75 octets per physical line."""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return data + b'\r\n'
+    parts = []
+    limit = 75
+    while len(data) > limit:
+        # Never split inside a multi-byte UTF-8 sequence
+        cut = limit
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    parts.append(data)
+    return b'\r\n '.join(parts) + b'\r\n'
+
+
+def format_local(minutes):
+    """Ordinal minutes as a floating DATE-TIME (YYYYMMDDTHHMMSS)."""
+    day, minute = divmod(minutes, MINUTES_PER_DAY)
+    return f"{datetime.fromordinal(day):%Y%m%d}T{minute // 60:02d}{minute % 60:02d}00"
+
+
+def iter_calendar(shift_times, caregivers, dtstamp=None):
+    """
+    Yield the calendar as bytes chunks.
+
+    shift_times: iterable of (start_minutes, end_minutes, shift)
+    caregivers: {caregiver id (str): caregiver}
+    dtstamp: UTC datetime stamped on every event (defaults to now)
+    """
+    stamp = (dtstamp or datetime.now(timezone.utc)).strftime('%Y%m%dT%H%M%SZ')
+    yield (b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n' + fold(f'PRODID:{PRODID}')
+           + b'CALSCALE:GREGORIAN\r\nMETHOD:PUBLISH\r\n')
+    for shift_start, shift_end, shift in shift_times:
+        caregiver = caregivers.get(str(shift['caregiver_id']))
+        caregiver_name = caregiver['name'] if caregiver else 'Unknown Caregiver'
+        summary = f"{caregiver_name} - {shift['shift_type']} Shift"
+        lines = [
+            'BEGIN:VEVENT',
+            f'SUMMARY:{escape_text(summary)}',
+            f'DTSTART:{format_local(shift_start)}',
+            f'DTEND:{format_local(shift_end)}',
+            f'DTSTAMP:{stamp}',
+            f"UID:{escape_text(str(shift['id']))}@caregiverscheduler"
+        ]
+        if caregiver:
+            lines.append('CATEGORIES:Caregiver Shift')
+            lines.append('DESCRIPTION:' + escape_text(f"Caregiver: {caregiver_name}\nShift Type: {shift['shift_type']}"))
+        lines.append('END:VEVENT')
+        yield b''.join(fold(line) for line in lines)
+    yield b'END:VCALENDAR\r\n'
+
+
+def calendar_etag(shift_times, caregivers):
+    """
+    Digest of everything iter_calendar() would write except DTSTAMP, for
+    use as a weak ETag.
+    """
+    digest = hashlib.sha1()
+    names = {}
+    for shift_start, shift_end, shift in shift_times:
+        caregiver_id = str(shift['caregiver_id'])
+        if caregiver_id not in names:
+            caregiver = caregivers.get(caregiver_id)
+            names[caregiver_id] = caregiver['name'] if caregiver else None
+        digest.update(f"{shift['id']}|{shift_start}|{shift_end}|{shift['shift_type']}|{caregiver_id}|{names[caregiver_id]}\n".encode())
+    return digest.hexdigest()
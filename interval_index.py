@@ -0,0 +1,97 @@
+"""
+Per-caregiver interval index for double-booking detection.
+
+Each caregiver's shifts are kept sorted by start time (ordinal minutes,
+see shift_index). The index also tracks the longest shift it has seen, so
+every shift overlapping [start, end) must start within
+[start - longest, end): two bisects bound the candidates and finding the
+overlaps of a new shift costs O(log n + k). Shifts are half-open, so one
+that ends exactly when another starts does not overlap it.
+"""
+from bisect import bisect_left, bisect_right
+
+from shift_index import to_minutes
+
+
+def overlapping_pairs(entries, min_start=None):
+    """
+    Overlapping pairs (earlier, later) among (start, end, shift) entries of
+    one caregiver sorted by start: a sweep that compares each shift only
+    with the ones starting before it ends. With min_start, only pairs whose
+    later shift starts at or after it are returned.
+    """
+    pairs = []
+    for i, (start, end, shift) in enumerate(entries):
+        for j in range(i + 1, len(entries)):
+            other_start, _, other = entries[j]
+            if other_start >= end:
+                break
+            if min_start is None or other_start >= min_start:
+                pairs.append((shift, other))
+    return pairs
+
+
+class CaregiverIntervalIndex:
+    """
+    View of the shift store grouped by caregiver. Registered with the
+    store's JournaledStore, which keeps it in sync through reset/put/delete.
+    """
+
+    def __init__(self, shifts=()):
+        self.reset(shifts)
+
+    def reset(self, shifts):
+        # caregiver id -> parallel lists of starts, ends and shifts, ordered by start
+        self._caregivers = {}
+        self.longest = 0
+        entries = sorted((to_minutes(s['start']), to_minutes(s['end']), str(s['id']), s) for s in shifts)
+        for start, end, _, shift in entries:
+            starts, ends, items = self._caregivers.setdefault(str(shift['caregiver_id']), ([], [], []))
+            starts.append(start)
+            ends.append(end)
+            items.append(shift)
+            self.longest = max(self.longest, end - start)
+
+    def put(self, old, new):
+        if old is not None:
+            self.delete(old)
+        start, end = to_minutes(new['start']), to_minutes(new['end'])
+        starts, ends, items = self._caregivers.setdefault(str(new['caregiver_id']), ([], [], []))
+        pos = bisect_right(starts, start)
+        starts.insert(pos, start)
+        ends.insert(pos, end)
+        items.insert(pos, new)
+        self.longest = max(self.longest, end - start)
+
+    def delete(self, old):
+        lists = self._caregivers.get(str(old['caregiver_id']))
+        if lists is None:
+            return
+        starts, ends, items = lists
+        start = to_minutes(old['start'])
+        for pos in range(bisect_left(starts, start), bisect_right(starts, start)):
+            if items[pos]['id'] == old['id']:
+                del starts[pos], ends[pos], items[pos]
+                return
+
+    def overlapping(self, caregiver_id, start, end):
+        """Shifts of this caregiver overlapping [start, end) (ordinal minutes)."""
+        lists = self._caregivers.get(str(caregiver_id))
+        if lists is None:
+            return []
+        starts, ends, items = lists
+        lo = bisect_right(starts, start - self.longest)
+        hi = bisect_left(starts, end)
+        return [items[i] for i in range(lo, hi) if ends[i] > start]
+
+    def conflicts(self, start, end):
+        """
+        Overlapping pairs (earlier, later) of the same caregiver's shifts
+        where the later one starts within [start, end] (ordinal minutes).
+        """
+        pairs = []
+        for starts, ends, items in self._caregivers.values():
+            lo = bisect_left(starts, start - self.longest)
+            hi = bisect_right(starts, end)
+            pairs.extend(overlapping_pairs(list(zip(starts[lo:hi], ends[lo:hi], items[lo:hi])), min_start=start))
+        return pairs
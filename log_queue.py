@@ -0,0 +1,96 @@
+"""
+Logging through a queue, so request threads never format or write records.
+
+configure_logging() gives the root logger a single QueueHandler; a
+QueueListener thread takes records off the queue, formats them (timestamps,
+tracebacks) and writes them to stderr. The calling thread only merges the
+message arguments (so a dict logged and then modified still logs what it
+held at the time) and enqueues the record.
+
+Threads do not survive fork(), and gunicorn forks workers from a master
+that has already imported the app (preload_app). The listener is stopped
+before every fork, which drains the queue, and started again in both the
+parent and the child, so every process has its own running listener.
+Records still queued at exit are written by an atexit hook.
+"""
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+
+class _LocalQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # The queue never leaves the process, so the record does not need to
+        # be made picklable; formatting is left to the listener thread
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+_listener = None
+_running = False
+
+
+def _start():
+    global _running
+    if _listener is not None and not _running:
+        _listener.start()
+        _running = True
+
+
+def _stop():
+    """Stop the listener; returns whether it was running."""
+    global _running
+    if not _running:
+        return False
+    # Drains the queue, then joins the thread
+    _listener.stop()
+    _running = False
+    return True
+
+
+_paused_for_fork = False
+
+
+def _before_fork():
+    global _paused_for_fork
+    _paused_for_fork = _stop()
+
+
+def _after_fork():
+    if _paused_for_fork:
+        _start()
+
+
+def configure_logging(level=logging.INFO, queued=True):
+    """
+    Log to stderr at level, through the listener thread when queued is
+    true. Like logging.basicConfig, does nothing if the root logger already
+    has handlers (e.g. the embedding program configured logging itself).
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    root.setLevel(level)
+
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    if not queued:
+        root.addHandler(output)
+        return
+
+    records = queue.SimpleQueue()
+    root.addHandler(_LocalQueueHandler(records))
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _start()
+
+
+atexit.register(_stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork, after_in_parent=_after_fork, after_in_child=_after_fork)
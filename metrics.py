@@ -0,0 +1,265 @@
+"""
+Request and storage metrics in Prometheus text format.
+
+Each process keeps counters and histograms in memory; recording a value is
+a dict update and a bisect under a lock, so instrumentation can stay on in
+production. Gunicorn workers are separate processes, so a background thread
+in every worker writes its totals to <directory>/worker-<pid>.json once per
+flush_interval when they changed, and /metrics renders the sum over all
+worker files (other workers' numbers are at most flush_interval old). Files
+of workers that have exited are kept, so counters never go backwards; they
+are cleared when the server starts (see reset()).
+
+Metric names:
+    scheduler_http_requests_total{route, method, status}        counter
+    scheduler_http_request_duration_seconds{route, method}       histogram
+    scheduler_template_render_duration_seconds{template}         histogram
+    scheduler_storage_call_duration_seconds{operation}           histogram
+    scheduler_storage_bytes_read_total{file}                     counter
+    scheduler_storage_bytes_written_total{file}                  counter
+    scheduler_data_records{kind}                                 gauge
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'scheduler_http_requests_total': ('counter', 'Requests handled, by route, method and status.'),
+    'scheduler_http_request_duration_seconds': ('histogram', 'Time to handle a request, by route and method.'),
+    'scheduler_template_render_duration_seconds': ('histogram', 'Time to render a Jinja template.'),
+    'scheduler_storage_call_duration_seconds': ('histogram', 'Time spent in a storage backend call, by operation.'),
+    'scheduler_storage_bytes_read_total': ('counter', 'Bytes read from data files, by file.'),
+    'scheduler_storage_bytes_written_total': ('counter', 'Bytes written to data files, by file.'),
+    'scheduler_data_records': ('gauge', 'Records currently stored, by kind of data.')
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> value; labels is a tuple of (key, value) pairs
+        self.counters = {}
+        # (name, labels) -> [count per bucket (last is +Inf), sum, count]
+        self.histograms = {}
+        # Bumped on every update, so a flush can tell whether anything changed
+        self.changes = 0
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.changes += 1
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            self.changes += 1
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            entry[0][bisect_left(BUCKETS, seconds)] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def snapshot(self):
+        """JSON-serializable copy of every value."""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(buckets), total, count]
+                               for (name, labels), (buckets, total, count) in self.histograms.items()]
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot() of another registry into this one."""
+        for name, labels, value in snapshot['counters']:
+            self.inc(name, tuple(tuple(pair) for pair in labels), value)
+        with self._lock:
+            for name, labels, buckets, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                entry = self.histograms.setdefault(key, [[0] * (len(BUCKETS) + 1), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+                entry[1] += total
+                entry[2] += count
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render(registry, gauges=()):
+    """
+    Prometheus text exposition (format 0.0.4) of a registry plus gauges,
+    given as (name, labels, value) tuples.
+    """
+    # name -> [(labels, lines)]; histogram lines stay in bucket order
+    series = {}
+    for (name, labels), value in registry.counters.items():
+        series.setdefault(name, []).append((labels, [f'{name}{_format_labels(labels)} {value}']))
+    for (name, labels), (buckets, total, count) in registry.histograms.items():
+        lines = []
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ('+Inf',), buckets):
+            cumulative += n
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total:.6f}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        series.setdefault(name, []).append((labels, lines))
+    for name, labels, value in gauges:
+        series.setdefault(name, []).append((labels, [f'{name}{_format_labels(labels)} {value}']))
+
+    out = []
+    for name in sorted(series):
+        kind, text = HELP.get(name, ('untyped', name))
+        out.append(f'# HELP {name} {text}')
+        out.append(f'# TYPE {name} {kind}')
+        for _, lines in sorted(series[name]):
+            out.extend(lines)
+    return '\n'.join(out) + '\n'
+
+
+class Metrics:
+    """This process's registry plus the worker files it shares with other processes."""
+
+    def __init__(self, directory, flush_interval=1.0, enabled=True):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.registry = Registry()
+        self._flushed_changes = 0
+        # pid the flush thread runs in; threads do not survive a fork
+        self._flusher_pid = None
+
+    def _worker_file(self):
+        return os.path.join(self.directory, f'worker-{os.getpid()}.json')
+
+    def _start_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self.registry.changes != self._flushed_changes:
+                try:
+                    self.flush()
+                except OSError as e:
+                    logger.error(f"Error writing metrics: {str(e)}")
+
+    def record_request(self, route, method, status, seconds):
+        if not self.enabled:
+            return
+        self._start_flusher()
+        self.registry.inc('scheduler_http_requests_total', (('route', route), ('method', method), ('status', str(status))))
+        self.registry.observe('scheduler_http_request_duration_seconds', (('route', route), ('method', method)), seconds)
+
+    def record_render(self, template, seconds):
+        if self.enabled:
+            self.registry.observe('scheduler_template_render_duration_seconds', (('template', template),), seconds)
+
+    def record_storage_call(self, operation, seconds):
+        if self.enabled:
+            self.registry.observe('scheduler_storage_call_duration_seconds', (('operation', operation),), seconds)
+
+    def record_io(self, file, read=0, written=0):
+        if not self.enabled:
+            return
+        if read:
+            self.registry.inc('scheduler_storage_bytes_read_total', (('file', file),), read)
+        if written:
+            self.registry.inc('scheduler_storage_bytes_written_total', (('file', file),), written)
+
+    def flush(self):
+        """Write this worker's totals to its file."""
+        # Written directly rather than with storage.atomic_write, whose
+        # bytes would otherwise be counted as storage I/O
+        self._flushed_changes = self.registry.changes
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.worker-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.registry.snapshot(), f)
+            os.replace(tmp_path, self._worker_file())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def reset(self):
+        """Forget every worker's totals (at server start)."""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith('worker-') and name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, name))
+        self.registry = Registry()
+        self._flushed_changes = 0
+
+    def exposition(self, gauges=()):
+        """Prometheus text for the sum over all workers, this one included."""
+        self.flush()
+        total = Registry()
+        for name in os.listdir(self.directory):
+            if not (name.startswith('worker-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    total.merge(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return render(total, gauges)
+
+
+class InstrumentedBackend:
+    """
+    Storage backend wrapper that times every method call as a
+    storage_call_duration_seconds observation named after the method.
+    Attributes that are not methods are passed through untouched.
+    """
+
+    # Returns the writer lock rather than doing storage work
+    UNTIMED = ('locked',)
+
+    def __init__(self, backend, metrics):
+        self._backend = backend
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        # Only called on the first lookup: the wrapper is then stored on
+        # the instance, where attribute lookup finds it directly
+        value = getattr(self._backend, name)
+        if not callable(value) or name.startswith('_') or name in self.UNTIMED:
+            return value
+        record = self._metrics.record_storage_call
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+
+        setattr(self, name, timed)
+        return timed
+
+
+# Process-wide instance, configured by app.py; storage reports I/O through it
+current = Metrics(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'metrics'), enabled=False)
+
+
+def record_io(file, read=0, written=0):
+    current.record_io(file, read, written)
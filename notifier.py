@@ -0,0 +1,159 @@
+"""
+Change notifications across worker processes, for the /api/events stream.
+
+Every process with subscribers binds a Unix datagram socket
+<directory>/<pid>.sock, read by one listener thread. A committed write
+publishes the new change counters of the kinds it wrote ({"shifts": 12})
+by sending one datagram to every socket in the directory, its own
+process's included, and each listener hands the message to its local
+subscribers' queues. There is no broker: the socket files are the
+registry, and the socket of a process that died without removing it is
+deleted by the first publish that finds nobody listening.
+
+Messages carry versions rather than deltas, so a later message for a kind
+supersedes an earlier one. A send waits at most SEND_TIMEOUT for room in
+a busy listener's queue and the message is dropped after that, rather
+than holding up the writer (which usually holds the writer lock).
+
+The listener thread is started on the first subscribe in each process
+(threads do not survive fork(), and gunicorn forks workers from a master
+that has already imported the app), so processes that only write, like
+the master or a migration script, never bind a socket. close() ends every
+subscription with a None message, so a stopping worker does not wait for
+its streams to time out.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+SEND_TIMEOUT = 0.1
+MAX_MESSAGE_BYTES = 4096
+
+
+class Notifier:
+    def __init__(self, directory, enabled=True, max_subscribers=None):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        # pid the listener runs in, and its socket
+        self._listener_pid = None
+        self._socket_path = None
+        self._closed = False
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.sock')
+
+    def _start_listener(self):
+        """Bind this process's socket and start reading it, once per process. Called with _lock held."""
+        if self._listener_pid == os.getpid():
+            return
+        self._listener_pid = os.getpid()
+        self._subscribers = set()
+        path = self._path(os.getpid())
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(path):
+                os.remove(path)
+            sock.bind(path)
+        except OSError as e:
+            sock.close()
+            logger.error(f"Cannot listen for change notifications on {path}: {str(e)}")
+            return
+        self._socket_path = path
+        threading.Thread(target=self._listen, args=(sock,), name='change-notifier', daemon=True).start()
+
+    def _listen(self, sock):
+        while True:
+            data = sock.recv(MAX_MESSAGE_BYTES)
+            try:
+                versions = json.loads(data)
+            except ValueError:
+                logger.error(f"Skipping malformed change notification: {data[:200]!r}")
+                continue
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for events in subscribers:
+                events.put(versions)
+
+    def subscribe(self):
+        """
+        A queue that receives a {kind: version} dict for every published
+        write, and None once the process is closing; None instead of a
+        queue if max_subscribers are already subscribed in this process or
+        it is closing. Pass the queue to unsubscribe() when done.
+        """
+        with self._lock:
+            self._start_listener()
+            if self._closed or (self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers):
+                return None
+            events = queue.SimpleQueue()
+            self._subscribers.add(events)
+            return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._subscribers.discard(events)
+
+    def publish(self, versions):
+        """Send {kind: version} to every listening process."""
+        if not self.enabled or not versions:
+            return
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith('.sock')]
+        except FileNotFoundError:
+            return
+        if not names:
+            return
+        data = json.dumps(versions, separators=(',', ':')).encode()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.settimeout(SEND_TIMEOUT)
+        try:
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    sock.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a process that exited without cleaning up
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                except OSError as e:
+                    logger.warning(f"Dropped change notification for {name}: {str(e)}")
+        finally:
+            sock.close()
+
+    def close(self):
+        """End this process's subscriptions and remove its socket (when the worker stops)."""
+        if self._listener_pid != os.getpid() or self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            events.put(None)
+        if self._socket_path:
+            try:
+                os.remove(self._socket_path)
+            except FileNotFoundError:
+                pass
+
+
+# Process-wide instance, configured by app.py; storage publishes through it
+current = Notifier(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'events'), enabled=False)
+
+
+def publish(versions):
+    current.publish(versions)
+
+
+atexit.register(lambda: current.close())
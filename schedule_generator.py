@@ -0,0 +1,204 @@
+"""
+Automatic weekly template generation.
+
+generate_template() fills a coverage requirement (how many caregivers each
+shift type needs on each day of the week) from a caregiver roster, never
+double-booking a caregiver and never going over a caregiver's max_hours
+(a weekly limit). Times are minutes from the start of the template week,
+as in template_plan, and the week wraps: a Sunday night shift conflicts
+with an overlapping Monday morning one.
+
+It works in three phases; the last two stop when the time budget runs out:
+
+1. Greedy: the longest slots are filled first, each by the feasible
+   caregiver whose share of their max_hours would be lowest afterwards.
+2. Repair: a slot left short is retried by moving one of a blocking
+   caregiver's shifts to someone else.
+3. Balance: shifts are moved from more to less loaded caregivers while that
+   lowers the sum of squared load shares, which evens out hours.
+
+Whatever cannot be filled is reported as unfilled rather than violating a
+constraint.
+"""
+import random
+import time
+
+from shift_index import MINUTES_PER_DAY
+from template_plan import MINUTES_PER_WEEK, shift_offsets
+
+DAYS_PER_WEEK = 7
+
+# Load share denominator for caregivers without a max_hours
+UNLIMITED_MINUTES = MINUTES_PER_WEEK
+
+
+def normalize_coverage(coverage, shift_definitions):
+    """
+    {shift type: [count per day, Monday first]} from a coverage request.
+    Each shift type maps to a single count (every day) or a list of seven
+    daily counts. Raises ValueError on bad input.
+    """
+    if not isinstance(coverage, dict):
+        raise ValueError('coverage must be an object keyed by shift type')
+    counts = {}
+    for shift_type, value in coverage.items():
+        if shift_type not in shift_definitions:
+            raise ValueError(f'Invalid shift type: {shift_type}')
+        daily = [value] * DAYS_PER_WEEK if not isinstance(value, list) else value
+        if len(daily) != DAYS_PER_WEEK:
+            raise ValueError(f'coverage for {shift_type} must have {DAYS_PER_WEEK} daily counts')
+        if not all(isinstance(n, int) and not isinstance(n, bool) and n >= 0 for n in daily):
+            raise ValueError(f'coverage for {shift_type} must be non-negative integers')
+        counts[shift_type] = daily
+    return counts
+
+
+class _Caregiver:
+    def __init__(self, caregiver, rank):
+        self.id = str(caregiver['id'])
+        self.rank = rank
+        max_hours = caregiver.get('max_hours')
+        self.limit = int(max_hours) * 60 if max_hours else None
+        self.share_of = self.limit or UNLIMITED_MINUTES
+        self.minutes = 0
+        # (start, end, slot) per assigned shift
+        self.shifts = []
+
+    def share(self, extra=0):
+        return (self.minutes + extra) / self.share_of
+
+    def fits(self, start, end, ignore=None):
+        """Whether [start, end) can be added (optionally after dropping the shift `ignore`)."""
+        minutes = self.minutes - (ignore[1] - ignore[0] if ignore else 0)
+        if self.limit is not None and minutes + end - start > self.limit:
+            return False
+        for entry in self.shifts:
+            if entry is ignore:
+                continue
+            # The template repeats weekly, so compare against last and next week too
+            for shift in (-MINUTES_PER_WEEK, 0, MINUTES_PER_WEEK):
+                if entry[0] + shift < end and start < entry[1] + shift:
+                    return False
+        return True
+
+    def add(self, entry):
+        self.shifts.append(entry)
+        self.minutes += entry[1] - entry[0]
+
+    def remove(self, entry):
+        self.shifts.remove(entry)
+        self.minutes -= entry[1] - entry[0]
+
+
+def generate_template(coverage, caregivers, shift_definitions, time_budget=0.5, seed=0):
+    """
+    Assign caregivers to the shifts a coverage requirement asks for.
+
+    coverage: {shift type: count or [count per day]}, see normalize_coverage
+    caregivers: caregiver records (id, max_hours)
+    time_budget: seconds; the repair and balance phases stop when it runs out
+    seed: tie-breaking between equally loaded caregivers
+
+    Returns {'shifts': template shifts (caregiver_id, day, shift_type),
+    'unfilled': [{day, shift_type, missing}], 'minutes': {caregiver id: minutes}}.
+    """
+    deadline = time.perf_counter() + time_budget
+    counts = normalize_coverage(coverage, shift_definitions)
+    offsets = shift_offsets(shift_definitions)
+    order = random.Random(seed).sample(range(len(caregivers)), len(caregivers))
+    roster = [_Caregiver(c, rank) for c, rank in zip(caregivers, order)]
+
+    slots = []
+    for shift_type, daily in counts.items():
+        start, end = offsets[shift_type]
+        for day, count in enumerate(daily):
+            if count:
+                base = day * MINUTES_PER_DAY
+                slots.append((base + start, base + end, (day, shift_type), count))
+    # Longest (hardest to place) slots first, then in week order
+    slots.sort(key=lambda s: (s[0] - s[1], s[0]))
+
+    missing = {}
+    for start, end, slot, count in slots:
+        for _ in range(count):
+            if not _assign(roster, start, end, slot):
+                missing[slot] = missing.get(slot, 0) + 1
+
+    for slot in list(missing):
+        start, end = _slot_times(slot, offsets)
+        while (missing[slot] and time.perf_counter() < deadline
+               and (_assign(roster, start, end, slot) or _repair(roster, start, end, slot))):
+            missing[slot] -= 1
+
+    while time.perf_counter() < deadline and _rebalance(roster):
+        pass
+
+    type_order = {name: i for i, name in enumerate(shift_definitions)}
+    shifts = sorted(
+        ({'caregiver_id': c.id, 'day': slot[0], 'shift_type': slot[1]} for c in roster for _, _, slot in c.shifts),
+        key=lambda s: (type_order[s['shift_type']], s['day'], s['caregiver_id'])
+    )
+    return {
+        'shifts': shifts,
+        'unfilled': [{'day': day, 'shift_type': shift_type, 'missing': n}
+                     for (day, shift_type), n in sorted(missing.items()) if n],
+        'minutes': {c.id: c.minutes for c in roster}
+    }
+
+
+def _slot_times(slot, offsets):
+    start, end = offsets[slot[1]]
+    base = slot[0] * MINUTES_PER_DAY
+    return base + start, base + end
+
+
+def _assign(roster, start, end, slot):
+    """Give the slot to the feasible caregiver left with the lowest load share."""
+    best = None
+    for caregiver in roster:
+        if caregiver.fits(start, end):
+            key = (caregiver.share(end - start), caregiver.rank)
+            if best is None or key < best[0]:
+                best = (key, caregiver)
+    if best is None:
+        return False
+    best[1].add((start, end, slot))
+    return True
+
+
+def _repair(roster, start, end, slot):
+    """
+    Fill a slot nobody can take directly: find a caregiver who could take it
+    after handing one of their shifts to someone else.
+    """
+    for caregiver in sorted(roster, key=lambda c: (c.share(), c.rank)):
+        for entry in list(caregiver.shifts):
+            if not caregiver.fits(start, end, ignore=entry):
+                continue
+            for other in roster:
+                if other is not caregiver and other.fits(entry[0], entry[1]):
+                    caregiver.remove(entry)
+                    other.add(entry)
+                    caregiver.add((start, end, slot))
+                    return True
+    return False
+
+
+def _rebalance(roster):
+    """Make one move that lowers the sum of squared load shares, if there is one."""
+    by_share = sorted(roster, key=lambda c: c.share(), reverse=True)
+    for donor in by_share:
+        for entry in donor.shifts:
+            minutes = entry[1] - entry[0]
+            before = donor.share() ** 2
+            after = donor.share(-minutes) ** 2
+            for receiver in reversed(by_share):
+                if receiver.share() >= donor.share():
+                    break
+                gain = before + receiver.share() ** 2 - after - receiver.share(minutes) ** 2
+                # Ignore float noise so the phase always terminates
+                if gain > 1e-9 and receiver.fits(entry[0], entry[1]):
+                    donor.remove(entry)
+                    receiver.add(entry)
+                    return True
+    return False
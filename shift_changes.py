@@ -0,0 +1,126 @@
+"""
+Change sequence over the shift store, for delta sync.
+
+Every write of shifts gets the next sequence number, and every shift it
+touches gets a change record stamped with it:
+
+    {"id": "42", "seq": 17, "created": 12}
+    {"id": "43", "seq": 17, "created": 9, "deleted": true}
+
+`created` is the sequence number of the write that created the shift
+(0 for shifts that predate change tracking), which is what tells an
+insert from an update. A deleted shift leaves a tombstone, so a client
+that last synced at sequence N can be told about every insert, update and
+delete since then with only the records whose seq is above N. A shift
+deleted and re-added within one write counts as updated.
+
+Only the latest record per shift is kept, so the live records never
+outnumber the shifts. Tombstones are dropped once they are more than
+CHANGE_RETENTION writes old; clients further behind than that get told to
+reload instead (see sync_floor).
+"""
+from bisect import bisect_left, bisect_right, insort
+
+# Changes are kept for this many writes; older tombstones are pruned
+CHANGE_RETENTION = 10000
+
+
+def sync_floor(version):
+    """The oldest sequence number a client can still sync from at this version."""
+    return max(0, version - CHANGE_RETENTION)
+
+
+def change_records(seq, puts, deletes, current, previous):
+    """
+    Change records for a write that deletes the given shift ids, then
+    inserts or replaces the given shifts. current(id) returns the stored
+    shift and previous(id) its last change record, both None if missing.
+    Deleting a shift that does not exist is not a change.
+    """
+    put_ids = {str(s['id']) for s in puts}
+    records = []
+    for key in map(str, deletes):
+        if key in put_ids or current(key) is None:
+            continue
+        change = previous(key)
+        records.append({'id': key, 'seq': seq, 'created': change['created'] if change else 0, 'deleted': True})
+    for shift in puts:
+        key = str(shift['id'])
+        change = previous(key)
+        if current(key) is None:
+            created = seq
+        else:
+            created = change['created'] if change and not change.get('deleted') else 0
+        records.append({'id': key, 'seq': seq, 'created': created})
+    return records
+
+
+def classify(since, version, rows):
+    """
+    Sort (change record, current shift or None) rows with seq above since
+    into the delta sync response: inserted and updated shifts and deleted
+    ids. Shifts created and deleted after since were never seen by the
+    client and are left out.
+    """
+    result = {'version': version, 'inserted': [], 'updated': [], 'deleted': []}
+    for change, shift in rows:
+        if change.get('deleted'):
+            if change['created'] <= since:
+                result['deleted'].append(change['id'])
+        elif shift is None:
+            # Deleted by a write whose change records are not stored yet
+            continue
+        elif change['created'] > since:
+            result['inserted'].append(shift)
+        else:
+            result['updated'].append(shift)
+    return result
+
+
+class ShiftChangeIndex:
+    """
+    View of the change records ordered by sequence number. Registered with
+    the records' JournaledStore, which keeps it in sync through
+    reset/put/delete.
+    """
+
+    def __init__(self, records=()):
+        self.reset(records)
+
+    def reset(self, records):
+        entries = sorted((r['seq'], r['id'], r) for r in records)
+        self._seqs = [e[0] for e in entries]
+        self._records = [e[2] for e in entries]
+        self._tombstones = [(e[0], e[1]) for e in entries if e[2].get('deleted')]
+        self.max_seq = self._seqs[-1] if entries else 0
+
+    def put(self, old, new):
+        if old is not None:
+            self.delete(old)
+        pos = bisect_right(self._seqs, new['seq'])
+        self._seqs.insert(pos, new['seq'])
+        self._records.insert(pos, new)
+        if new.get('deleted'):
+            insort(self._tombstones, (new['seq'], new['id']))
+        self.max_seq = max(self.max_seq, new['seq'])
+
+    def delete(self, old):
+        for pos in range(bisect_left(self._seqs, old['seq']), bisect_right(self._seqs, old['seq'])):
+            if self._records[pos]['id'] == old['id']:
+                del self._seqs[pos], self._records[pos]
+                break
+        if old.get('deleted'):
+            pos = bisect_left(self._tombstones, (old['seq'], old['id']))
+            if pos < len(self._tombstones) and self._tombstones[pos] == (old['seq'], old['id']):
+                del self._tombstones[pos]
+
+    def __len__(self):
+        return len(self._records)
+
+    def since(self, seq):
+        """Change records with a sequence number above seq, oldest first."""
+        return self._records[bisect_right(self._seqs, seq):]
+
+    def expired(self, floor):
+        """Ids of tombstones with a sequence number at or below floor."""
+        return [key for _, key in self._tombstones[:bisect_left(self._tombstones, (floor + 1,))]]
@@ -0,0 +1,135 @@
+"""
+Start-time index over the shift store.
+
+Shifts are kept sorted by start time so date-range queries are a pair of
+bisect lookups plus a slice, i.e. O(log n + k) instead of a parse-and-test
+walk over every shift.
+
+Start and end times are pre-parsed once, when the index is built, into
+integer minutes since 0001-01-01 ("ordinal minutes"). Comparisons and
+durations are then plain integer arithmetic.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+
+SHIFT_TIME_FORMAT = '%Y-%m-%d %H:%M'
+MINUTES_PER_DAY = 1440
+
+
+# Every view of the shift store (range index, hours rollup, interval
+# index) converts the same few thousand distinct time strings, so
+# conversions are memoised.
+@lru_cache(maxsize=1 << 16)
+def to_minutes(value):
+    """
+    Convert a stored shift time ('YYYY-MM-DD HH:MM') or a datetime to
+    ordinal minutes. Seconds are truncated. Other ISO 8601 strings are
+    accepted through datetime.fromisoformat; raises ValueError otherwise.
+    """
+    if isinstance(value, datetime):
+        return value.toordinal() * MINUTES_PER_DAY + value.hour * 60 + value.minute
+    if len(value) == 16 and value[4] == '-' and value[7] == '-' and value[10] == ' ' and value[13] == ':':
+        day = date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+        hour, minute = int(value[11:13]), int(value[14:16])
+        if hour > 23 or minute > 59:
+            raise ValueError(f"Invalid shift time: {value}")
+        return day.toordinal() * MINUTES_PER_DAY + hour * 60 + minute
+    return to_minutes(datetime.fromisoformat(value))
+
+
+def format_minutes(minutes):
+    """Format ordinal minutes as a stored shift time ('YYYY-MM-DD HH:MM')."""
+    day, minute = divmod(minutes, MINUTES_PER_DAY)
+    return f"{date.fromordinal(day).isoformat()} {minute // 60:02d}:{minute % 60:02d}"
+
+
+def ceil_minutes(value):
+    """Ordinal minutes of the first whole minute at or after value (datetime or minutes)."""
+    if isinstance(value, datetime) and (value.second or value.microsecond):
+        return to_minutes(value) + 1
+    return value if isinstance(value, int) else to_minutes(value)
+
+
+def floor_minutes(value):
+    """Ordinal minutes of the last whole minute at or before value (datetime or minutes)."""
+    return value if isinstance(value, int) else to_minutes(value)
+
+
+class ShiftIndex:
+    """
+    View of the shift store ordered by start time. Registered with the
+    store's JournaledStore, which keeps it in sync through reset/put/delete.
+    Also tracks the highest numeric shift id handed out so far.
+    """
+
+    def __init__(self, shifts=()):
+        self.reset(shifts)
+
+    def reset(self, shifts):
+        entries = sorted((to_minutes(s['start']), to_minutes(s['end']), i, s) for i, s in enumerate(shifts))
+        self._starts = [e[0] for e in entries]
+        self._ends = [e[1] for e in entries]
+        self._shifts = [e[3] for e in entries]
+        self.max_id = max((int(s['id']) for s in self._shifts if str(s['id']).isdigit()), default=0)
+
+    def put(self, old, new):
+        if old is not None:
+            self.delete(old)
+        start = to_minutes(new['start'])
+        pos = bisect_right(self._starts, start)
+        self._starts.insert(pos, start)
+        self._ends.insert(pos, to_minutes(new['end']))
+        self._shifts.insert(pos, new)
+        if str(new['id']).isdigit():
+            self.max_id = max(self.max_id, int(new['id']))
+
+    def delete(self, old):
+        start = to_minutes(old['start'])
+        for pos in range(bisect_left(self._starts, start), bisect_right(self._starts, start)):
+            if self._shifts[pos]['id'] == old['id']:
+                del self._starts[pos], self._ends[pos], self._shifts[pos]
+                return
+
+    def __len__(self):
+        return len(self._shifts)
+
+    def _bounds(self, start, end):
+        """Slice bounds for starts in [start, end]; accepts datetimes or ordinal minutes."""
+        return (bisect_left(self._starts, ceil_minutes(start)),
+                bisect_right(self._starts, floor_minutes(end)))
+
+    def range(self, start, end):
+        """Return shifts whose start is within [start, end], ordered by start."""
+        lo, hi = self._bounds(start, end)
+        return self._shifts[lo:hi]
+
+    def range_with_times(self, start, end):
+        """Yield (start_minutes, end_minutes, shift) for shifts starting within [start, end]."""
+        lo, hi = self._bounds(start, end)
+        return zip(self._starts[lo:hi], self._ends[lo:hi], self._shifts[lo:hi])
+
+    def page(self, start, end, limit, after=None):
+        """
+        Up to limit (start_minutes, shift) pairs for shifts starting within
+        [start, end], ordered by (start, id as a string), strictly after the
+        (start_minutes, id) key `after` if given. Only the shifts up to the
+        end of the page are visited, so paging through a wide range costs
+        O(log n + page) per page.
+        """
+        lo, hi = self._bounds(start, end)
+        if after is not None:
+            lo = max(lo, bisect_left(self._starts, after[0]))
+        page = []
+        pos = lo
+        while pos < hi and len(page) < limit:
+            # Shifts starting in the same minute are kept in insertion order; sort them by id
+            group_end = bisect_right(self._starts, self._starts[pos], pos, hi)
+            group = sorted((str(self._shifts[i]['id']), i) for i in range(pos, group_end))
+            for shift_id, i in group:
+                if after is None or (self._starts[i], shift_id) > after:
+                    page.append((self._starts[i], self._shifts[i]))
+                    if len(page) == limit:
+                        break
+            pos = group_end
+        return page
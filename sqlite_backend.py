@@ -0,0 +1,598 @@
+"""
+SQLite storage backend.
+
+Stores caregivers, shifts, templates, week states and audit events as
+tables in a single database file, with indexes on shift start time,
+shift caregiver and audit timestamp/type so the routes can run indexed
+range queries instead of filtering in Python. Triggers keep the worked
+hours rollup and the shift change records (see shift_changes.py) current. Exposes the same methods as
+storage.JsonBackend; select it with STORAGE_BACKEND=sqlite.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import notifier
+from hours_rollup import week_monday
+from shift_changes import CHANGE_RETENTION, classify, sync_floor
+from shift_index import ceil_minutes, floor_minutes, to_minutes
+from storage import FileLock
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS caregivers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    max_hours INTEGER,
+    color TEXT
+);
+CREATE TABLE IF NOT EXISTS shifts (
+    id TEXT PRIMARY KEY,
+    caregiver_id TEXT NOT NULL,
+    shift_type TEXT NOT NULL,
+    starts_at TEXT NOT NULL,
+    ends_at TEXT NOT NULL,
+    start_min INTEGER NOT NULL,
+    end_min INTEGER NOT NULL,
+    caregiver_name TEXT,
+    color TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_shifts_start ON shifts (start_min);
+CREATE INDEX IF NOT EXISTS idx_shifts_caregiver ON shifts (caregiver_id, start_min);
+CREATE TABLE IF NOT EXISTS templates (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS week_states (
+    week_start TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS audit_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    user TEXT,
+    timestamp TEXT NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_events (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_audit_type_timestamp ON audit_events (type, timestamp, id);
+-- Worked minutes per caregiver per day (date ordinal of the shift start),
+-- kept current by the triggers below; see hours_rollup.py
+CREATE TABLE IF NOT EXISTS hours_daily (
+    caregiver_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    minutes INTEGER NOT NULL,
+    PRIMARY KEY (caregiver_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_hours_day ON hours_daily (day);
+CREATE TRIGGER IF NOT EXISTS shifts_hours_insert AFTER INSERT ON shifts BEGIN
+    INSERT INTO hours_daily (caregiver_id, day, minutes)
+    VALUES (NEW.caregiver_id, NEW.start_min / 1440, NEW.end_min - NEW.start_min)
+    ON CONFLICT (caregiver_id, day) DO UPDATE SET minutes = minutes + excluded.minutes;
+END;
+CREATE TRIGGER IF NOT EXISTS shifts_hours_delete AFTER DELETE ON shifts BEGIN
+    UPDATE hours_daily SET minutes = minutes - (OLD.end_min - OLD.start_min)
+    WHERE caregiver_id = OLD.caregiver_id AND day = OLD.start_min / 1440;
+    DELETE FROM hours_daily WHERE caregiver_id = OLD.caregiver_id AND day = OLD.start_min / 1440 AND minutes = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS shifts_hours_update AFTER UPDATE ON shifts BEGIN
+    UPDATE hours_daily SET minutes = minutes - (OLD.end_min - OLD.start_min)
+    WHERE caregiver_id = OLD.caregiver_id AND day = OLD.start_min / 1440;
+    DELETE FROM hours_daily WHERE caregiver_id = OLD.caregiver_id AND day = OLD.start_min / 1440 AND minutes = 0;
+    INSERT INTO hours_daily (caregiver_id, day, minutes)
+    VALUES (NEW.caregiver_id, NEW.start_min / 1440, NEW.end_min - NEW.start_min)
+    ON CONFLICT (caregiver_id, day) DO UPDATE SET minutes = minutes + excluded.minutes;
+END;
+-- Longest shift ever stored, which bounds how far back an overlapping
+-- shift can start (see interval_index.py)
+CREATE TRIGGER IF NOT EXISTS shifts_longest_insert AFTER INSERT ON shifts
+WHEN NEW.end_min - NEW.start_min > (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'longest_shift') BEGIN
+    UPDATE meta SET value = NEW.end_min - NEW.start_min WHERE key = 'longest_shift';
+END;
+CREATE TRIGGER IF NOT EXISTS shifts_longest_update AFTER UPDATE ON shifts
+WHEN NEW.end_min - NEW.start_min > (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'longest_shift') BEGIN
+    UPDATE meta SET value = NEW.end_min - NEW.start_min WHERE key = 'longest_shift';
+END;
+-- Latest change per shift for delta sync (see shift_changes.py). A write's
+-- sequence number is the shifts version it is about to bump to (_mark runs
+-- last in the transaction). INSERT OR REPLACE fires the delete trigger
+-- first, so a tombstone from the same write means the shift was replaced
+-- and keeps its created number.
+CREATE TABLE IF NOT EXISTS shift_changes (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    created INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_shift_changes_seq ON shift_changes (seq);
+CREATE INDEX IF NOT EXISTS idx_shift_changes_tombstones ON shift_changes (deleted, seq);
+CREATE TRIGGER IF NOT EXISTS shifts_changes_delete AFTER DELETE ON shifts BEGIN
+    INSERT INTO shift_changes (id, seq, created, deleted)
+    VALUES (OLD.id, (SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) + 1 FROM meta WHERE key = 'version:shifts'), 0, 1)
+    ON CONFLICT (id) DO UPDATE SET seq = excluded.seq, deleted = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS shifts_changes_insert AFTER INSERT ON shifts BEGIN
+    INSERT INTO shift_changes (id, seq, created, deleted)
+    VALUES (NEW.id, (SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) + 1 FROM meta WHERE key = 'version:shifts'),
+            (SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) + 1 FROM meta WHERE key = 'version:shifts'), 0)
+    ON CONFLICT (id) DO UPDATE SET seq = excluded.seq, deleted = 0,
+        created = CASE WHEN deleted = 1 AND seq < excluded.seq THEN excluded.created ELSE created END;
+END;
+CREATE TRIGGER IF NOT EXISTS shifts_changes_update AFTER UPDATE ON shifts BEGIN
+    INSERT INTO shift_changes (id, seq, created, deleted)
+    VALUES (NEW.id, (SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) + 1 FROM meta WHERE key = 'version:shifts'), 0, 0)
+    ON CONFLICT (id) DO UPDATE SET seq = excluded.seq, deleted = 0;
+END;
+"""
+
+SHIFT_COLUMNS = 'id, caregiver_id, shift_type, starts_at, ends_at, start_min, end_min, caregiver_name, color'
+AUDIT_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _shift_row(shift):
+    return (str(shift['id']), str(shift['caregiver_id']), shift['shift_type'],
+            shift['start'], shift['end'], to_minutes(shift['start']), to_minutes(shift['end']),
+            shift.get('caregiver_name'), shift.get('color'))
+
+
+def _shift_dict(row):
+    shift = {
+        'id': row[0],
+        'caregiver_id': row[1],
+        'shift_type': row[2],
+        'start': row[3],
+        'end': row[4]
+    }
+    if row[7] is not None:
+        shift['caregiver_name'] = row[7]
+    if row[8] is not None:
+        shift['color'] = row[8]
+    return shift
+
+
+def _audit_dict(row):
+    return {
+        'id': str(row[0]),
+        'type': row[1],
+        'user': row[2],
+        'timestamp': row[3],
+        'details': json.loads(row[4]) if row[4] else {}
+    }
+
+
+class SqliteBackend:
+    """
+    Storage backend on a single SQLite database (WAL mode). Each write is
+    one BEGIN IMMEDIATE transaction and readers never block on writers;
+    locked() serializes read-modify-write sequences across workers.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.writer_lock = FileLock(path + '.writer.lock')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._build_rollups()
+
+    def _conn(self):
+        # One connection per thread, reopened after a fork (gunicorn --preload)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # INSERT OR REPLACE must fire the delete trigger for the row it replaces
+            conn.execute('PRAGMA recursive_triggers=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        # kind -> new change counter, set by _mark and published once committed
+        self._local.marked = {}
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        notifier.publish(self._local.marked)
+
+    def _build_rollups(self):
+        """Fill hours_daily and longest_shift from the shifts table once (databases created before they existed)."""
+        if not self._conn().execute("SELECT 1 FROM meta WHERE key = 'longest_shift'").fetchone():
+            with self._transaction() as conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) "
+                             "SELECT 'longest_shift', COALESCE(MAX(end_min - start_min), 0) FROM shifts")
+        if self._conn().execute("SELECT 1 FROM meta WHERE key = 'rollup:hours'").fetchone():
+            return
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM hours_daily')
+            conn.execute('INSERT INTO hours_daily (caregiver_id, day, minutes) '
+                         'SELECT caregiver_id, start_min / 1440, SUM(end_min - start_min) FROM shifts '
+                         'GROUP BY caregiver_id, start_min / 1440 HAVING SUM(end_min - start_min) != 0')
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup:hours', '1')")
+
+    def _mark(self, conn, kind):
+        """Record a write of this kind of data: set its initialized flag and bump its change counter."""
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '1')", (f'initialized:{kind}',))
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, '1') "
+                     "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1", (f'version:{kind}',))
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (f'modified:{kind}', repr(time.time())))
+        self._local.marked[kind] = conn.execute('SELECT CAST(value AS INTEGER) FROM meta WHERE key = ?',
+                                                (f'version:{kind}',)).fetchone()[0]
+
+    def _prune_shift_changes(self, conn):
+        """Drop tombstones older than shift_changes.CHANGE_RETENTION writes, before _mark bumps the version."""
+        conn.execute("DELETE FROM shift_changes WHERE deleted = 1 AND seq <= "
+                     "(SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'version:shifts') + 1 - ?",
+                     (CHANGE_RETENTION,))
+
+    def has(self, kind):
+        """True once data of this kind (e.g. 'caregivers') has been saved."""
+        row = self._conn().execute('SELECT 1 FROM meta WHERE key = ?', (f'initialized:{kind}',)).fetchone()
+        return row is not None
+
+    def data_version(self, *kinds):
+        """(change counters of the given kinds, latest modification time or None)."""
+        keys = [f'version:{kind}' for kind in kinds] + [f'modified:{kind}' for kind in kinds]
+        rows = dict(self._conn().execute(
+            f"SELECT key, value FROM meta WHERE key IN ({', '.join('?' * len(keys))})", keys).fetchall())
+        modified = [float(rows[f'modified:{kind}']) for kind in kinds if f'modified:{kind}' in rows]
+        return tuple(int(rows.get(f'version:{kind}', 0)) for kind in kinds), max(modified, default=None)
+
+    def locked(self):
+        """The writer lock, for callers that read, modify and write (see storage.JsonBackend.locked)."""
+        return self.writer_lock
+
+    def preload(self):
+        """Nothing to load: the indexes live in the database."""
+
+    def record_counts(self):
+        """{kind: number of records} for the data kinds, for the /metrics gauges."""
+        conn = self._conn()
+        return {kind: conn.execute(f'SELECT COUNT(*) FROM {kind}').fetchone()[0]
+                for kind in ('caregivers', 'shifts', 'templates', 'week_states', 'audit_events')}
+
+    # Caregivers
+
+    def load_caregivers(self):
+        rows = self._conn().execute('SELECT id, name, max_hours, color FROM caregivers ORDER BY id')
+        caregivers = []
+        for row in rows:
+            caregiver = {'id': row[0], 'name': row[1], 'max_hours': row[2]}
+            if row[3] is not None:
+                caregiver['color'] = row[3]
+            caregivers.append(caregiver)
+        return caregivers
+
+    def save_caregivers(self, caregivers):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM caregivers')
+            conn.executemany('INSERT INTO caregivers (id, name, max_hours, color) VALUES (?, ?, ?, ?)',
+                             [(c['id'], c['name'], c.get('max_hours'), c.get('color')) for c in caregivers])
+            self._mark(conn, 'caregivers')
+
+    # Templates
+
+    def load_templates(self):
+        rows = self._conn().execute('SELECT data FROM templates ORDER BY position')
+        return [json.loads(row[0]) for row in rows]
+
+    def save_templates(self, templates):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM templates')
+            conn.executemany('INSERT INTO templates (id, position, name, data) VALUES (?, ?, ?, ?)',
+                             [(str(t['id']), i, t['name'], json.dumps(t)) for i, t in enumerate(templates)])
+            self._mark(conn, 'templates')
+
+    # Week states
+
+    def load_week_states(self):
+        rows = self._conn().execute('SELECT week_start, state FROM week_states')
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    def save_week_states(self, states):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM week_states')
+            conn.executemany('INSERT INTO week_states (week_start, state) VALUES (?, ?)',
+                             [(k, json.dumps(v)) for k, v in states.items()])
+            self._mark(conn, 'week_states')
+
+    def get_week_state(self, week_start):
+        row = self._conn().execute('SELECT state FROM week_states WHERE week_start = ?', (week_start,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_week_state(self, week_start, state):
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO week_states (week_start, state) VALUES (?, ?)',
+                         (week_start, json.dumps(state)))
+            self._mark(conn, 'week_states')
+
+    def delete_week_state(self, week_start):
+        with self._transaction() as conn:
+            deleted = conn.execute('DELETE FROM week_states WHERE week_start = ?', (week_start,)).rowcount > 0
+            if deleted:
+                self._mark(conn, 'week_states')
+            return deleted
+
+    # Audit events
+
+    def load_audit_events(self):
+        rows = self._conn().execute('SELECT id, type, user, timestamp, details FROM audit_events ORDER BY id')
+        return [_audit_dict(row) for row in rows]
+
+    def save_audit_events(self, events):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM audit_events')
+            rows, seen = [], set()
+            for e in events:
+                # Legacy ids came from len(events) + 1 and may collide; renumber duplicates
+                event_id = int(e['id']) if str(e.get('id', '')).isdigit() and int(e['id']) not in seen else None
+                seen.add(event_id)
+                rows.append((event_id, e['type'], e.get('user'), e['timestamp'], json.dumps(e.get('details') or {})))
+            conn.executemany('INSERT INTO audit_events (id, type, user, timestamp, details) VALUES (?, ?, ?, ?, ?)', rows)
+            self._mark(conn, 'audit_events')
+
+    def append_audit_event(self, event_type, user, details):
+        timestamp = datetime.now().strftime(AUDIT_TIMESTAMP_FORMAT)
+        with self._transaction() as conn:
+            cursor = conn.execute('INSERT INTO audit_events (type, user, timestamp, details) VALUES (?, ?, ?, ?)',
+                                  (event_type, user, timestamp, json.dumps(details or {})))
+        return {
+            'id': str(cursor.lastrowid),
+            'type': event_type,
+            'user': user,
+            'timestamp': timestamp,
+            'details': details or {}
+        }
+
+    def query_audit_events(self, start=None, end=None, event_type=None):
+        """Events with start <= timestamp <= end (datetimes) and the given type, newest first."""
+        clauses, params = [], []
+        if event_type:
+            clauses.append('type = ?')
+            params.append(event_type)
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(start.strftime(AUDIT_TIMESTAMP_FORMAT))
+        if end:
+            clauses.append('timestamp <= ?')
+            params.append(end.strftime(AUDIT_TIMESTAMP_FORMAT))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._conn().execute(
+            f'SELECT id, type, user, timestamp, details FROM audit_events {where} ORDER BY timestamp DESC, id DESC',
+            params)
+        return [_audit_dict(row) for row in rows]
+
+    def query_audit_page(self, start=None, end=None, event_type=None, limit=100, before=None, after=None):
+        """One page of query_audit_events(); same contract as audit_log.AuditLog.query_page."""
+        clauses, params = [], []
+        if event_type:
+            clauses.append('type = ?')
+            params.append(event_type)
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(start.strftime(AUDIT_TIMESTAMP_FORMAT))
+        if end:
+            clauses.append('timestamp <= ?')
+            params.append(end.strftime(AUDIT_TIMESTAMP_FORMAT))
+        conn = self._conn()
+        for cursor, op in ((before, '<'), (after, '>')):
+            if cursor is None:
+                continue
+            row = conn.execute('SELECT timestamp, id FROM audit_events WHERE id = ?', (int(cursor),)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown audit cursor: {cursor}")
+            clauses.append(f'(timestamp, id) {op} (?, ?)')
+            params.extend(row)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        # Fetch one extra row to learn whether there is another page
+        order = 'ASC' if after is not None else 'DESC'
+        rows = conn.execute(
+            f'SELECT id, type, user, timestamp, details FROM audit_events {where} '
+            f'ORDER BY timestamp {order}, id {order} LIMIT ?', params + [limit + 1]).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            # Paging forward: the window starts at the cursor, so nothing older is in it
+            rows.reverse()
+            has_older = False
+        else:
+            has_older = has_more
+        page = [_audit_dict(row) for row in rows]
+        return {
+            'events': page,
+            'before': page[-1]['id'] if page and has_older else None,
+            'after': page[0]['id'] if page else (str(after) if after is not None else None)
+        }
+
+    # Shifts
+
+    def get_shift(self, shift_id):
+        row = self._conn().execute(f'SELECT {SHIFT_COLUMNS} FROM shifts WHERE id = ?', (str(shift_id),)).fetchone()
+        return _shift_dict(row) if row else None
+
+    def all_shifts(self):
+        rows = self._conn().execute(f'SELECT {SHIFT_COLUMNS} FROM shifts ORDER BY start_min, id')
+        return [_shift_dict(row) for row in rows]
+
+    def shift_times_in_range(self, start, end, caregiver_id=None):
+        """
+        (start_minutes, end_minutes, shift) for shifts starting within
+        [start, end], by start; only one caregiver's if caregiver_id is given.
+        """
+        if caregiver_id is None:
+            rows = self._conn().execute(
+                f'SELECT {SHIFT_COLUMNS} FROM shifts WHERE start_min BETWEEN ? AND ? ORDER BY start_min, id',
+                (ceil_minutes(start), floor_minutes(end)))
+        else:
+            rows = self._conn().execute(
+                f'SELECT {SHIFT_COLUMNS} FROM shifts WHERE caregiver_id = ? AND start_min BETWEEN ? AND ? '
+                'ORDER BY start_min, id',
+                (str(caregiver_id), ceil_minutes(start), floor_minutes(end)))
+        return [(row[5], row[6], _shift_dict(row)) for row in rows]
+
+    def shifts_in_range(self, start, end):
+        """Shifts starting within [start, end], ordered by start."""
+        return [shift for _, _, shift in self.shift_times_in_range(start, end)]
+
+    def shifts_page(self, start, end, limit, after=None):
+        """One page of shifts_in_range() (see storage.JsonBackend.shifts_page)."""
+        after_start, after_id = after if after is not None else (-1, '')
+        rows = self._conn().execute(
+            f'SELECT {SHIFT_COLUMNS} FROM shifts WHERE start_min BETWEEN ? AND ? '
+            'AND (start_min > ? OR (start_min = ? AND id > ?)) ORDER BY start_min, id LIMIT ?',
+            (ceil_minutes(start), floor_minutes(end), after_start, after_start, after_id, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        last = (rows[-1][5], rows[-1][0]) if more else None
+        return [_shift_dict(row) for row in rows], last
+
+    def shift_changes_since(self, since=None):
+        """Delta sync after sequence number since (see storage.JsonBackend.shift_changes_since)."""
+        conn = self._conn()
+        row = conn.execute("SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'version:shifts'").fetchone()
+        version = row[0] if row else 0
+        if since is None:
+            since = version
+        if not sync_floor(version) <= since <= version:
+            return None
+        # Capped at version: a write committed since it was read is left for the next sync
+        columns = ', '.join(f's.{c.strip()}' for c in SHIFT_COLUMNS.split(','))
+        rows = conn.execute(
+            f'SELECT c.id, c.seq, c.created, c.deleted, {columns} FROM shift_changes c '
+            'LEFT JOIN shifts s ON s.id = c.id WHERE c.seq > ? AND c.seq <= ? ORDER BY c.seq, c.id',
+            (since, version))
+        changes = []
+        for row in rows:
+            change = {'id': row[0], 'seq': row[1], 'created': row[2]}
+            if row[3]:
+                change['deleted'] = True
+            changes.append((change, _shift_dict(row[4:]) if row[4] is not None else None))
+        return classify(since, version, changes)
+
+    def shift_ids_for_caregiver(self, caregiver_id):
+        rows = self._conn().execute('SELECT id FROM shifts WHERE caregiver_id = ?', (str(caregiver_id),))
+        return [row[0] for row in rows]
+
+    def max_shift_id(self):
+        row = self._conn().execute("SELECT MAX(CAST(id AS INTEGER)) FROM shifts WHERE id GLOB '[0-9]*'").fetchone()
+        return row[0] or 0
+
+    def hours_by_week(self, first_week, last_week):
+        """{caregiver id: {week: minutes}} for weeks in [first_week, last_week] (see hours_rollup)."""
+        rows = self._conn().execute(
+            'SELECT caregiver_id, (day - 1) / 7 AS week, SUM(minutes) FROM hours_daily '
+            'WHERE day BETWEEN ? AND ? GROUP BY caregiver_id, week HAVING SUM(minutes) != 0',
+            (week_monday(first_week), week_monday(last_week) + 6))
+        result = {}
+        for caregiver_id, week, minutes in rows:
+            result.setdefault(caregiver_id, {})[week] = minutes
+        return result
+
+    def hours_by_day(self, first_day, last_day):
+        """{caregiver id: {day ordinal: minutes}} for days in [first_day, last_day]."""
+        rows = self._conn().execute(
+            'SELECT caregiver_id, day, minutes FROM hours_daily WHERE day BETWEEN ? AND ?', (first_day, last_day))
+        result = {}
+        for caregiver_id, day, minutes in rows:
+            result.setdefault(caregiver_id, {})[day] = minutes
+        return result
+
+    def week_minutes(self, pairs):
+        """{(caregiver id, week): minutes worked} for the given (caregiver id, week) pairs."""
+        conn = self._conn()
+        result = {}
+        for caregiver_id, week in pairs:
+            row = conn.execute('SELECT SUM(minutes) FROM hours_daily WHERE caregiver_id = ? AND day BETWEEN ? AND ?',
+                               (str(caregiver_id), week_monday(week), week_monday(week) + 6)).fetchone()
+            result[(caregiver_id, week)] = row[0] or 0
+        return result
+
+    def overlapping_shifts(self, caregiver_id, start, end):
+        """This caregiver's shifts overlapping [start, end) (ordinal minutes)."""
+        rows = self._conn().execute(
+            f"SELECT {SHIFT_COLUMNS} FROM shifts WHERE caregiver_id = ? "
+            "AND start_min > ? - (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'longest_shift') "
+            "AND start_min < ? AND end_min > ? ORDER BY start_min, id",
+            (str(caregiver_id), start, end, start))
+        return [_shift_dict(row) for row in rows]
+
+    def shift_conflicts(self, start, end):
+        """Overlapping (earlier, later) pairs of one caregiver's shifts, the later starting within [start, end]."""
+        columns = ', '.join(f'{prefix}.{c.strip()}' for prefix in ('a', 'b') for c in SHIFT_COLUMNS.split(','))
+        rows = self._conn().execute(
+            f"SELECT {columns} FROM shifts b JOIN shifts a ON a.caregiver_id = b.caregiver_id "
+            "AND a.start_min > b.start_min - (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'longest_shift') "
+            "AND (a.start_min < b.start_min OR (a.start_min = b.start_min AND a.id < b.id)) "
+            "AND a.end_min > b.start_min "
+            "WHERE b.start_min BETWEEN ? AND ? ORDER BY b.start_min, b.id, a.start_min, a.id",
+            (ceil_minutes(start), floor_minutes(end)))
+        width = len(SHIFT_COLUMNS.split(','))
+        return [(_shift_dict(row[:width]), _shift_dict(row[width:])) for row in rows]
+
+    def write_shifts(self, puts=(), deletes=()):
+        """Delete the given shift ids, then insert or replace the given shifts, in one transaction."""
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM shifts WHERE id = ?', [(str(k),) for k in deletes])
+            conn.executemany(f'INSERT OR REPLACE INTO shifts ({SHIFT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             [_shift_row(s) for s in puts])
+            self._prune_shift_changes(conn)
+            self._mark(conn, 'shifts')
+
+    def replace_shift_range(self, start, end, plan):
+        """
+        Swap the shifts starting within [start, end] in one transaction.
+        plan(existing, next_id) returns (puts, deletes); see JsonBackend.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f'SELECT {SHIFT_COLUMNS} FROM shifts WHERE start_min BETWEEN ? AND ? ORDER BY start_min, id',
+                (ceil_minutes(start), floor_minutes(end)))
+            existing = [_shift_dict(row) for row in rows]
+            row = conn.execute("SELECT MAX(CAST(id AS INTEGER)) FROM shifts WHERE id GLOB '[0-9]*'").fetchone()
+            puts, deletes = plan(existing, (row[0] or 0) + 1)
+            conn.executemany('DELETE FROM shifts WHERE id = ?', [(str(k),) for k in deletes])
+            conn.executemany(f'INSERT OR REPLACE INTO shifts ({SHIFT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             [_shift_row(s) for s in puts])
+            self._prune_shift_changes(conn)
+            self._mark(conn, 'shifts')
+        return puts, deletes
+
+    def replace_shifts(self, shifts):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM shifts')
+            conn.executemany(f'INSERT INTO shifts ({SHIFT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             [_shift_row(s) for s in shifts])
+            self._prune_shift_changes(conn)
+            self._mark(conn, 'shifts')
+
+    # Migration
+
+    def migrate_from(self, source):
+        """Copy every record from another backend (e.g. the JSON files) into this database."""
+        self.save_caregivers(source.load_caregivers())
+        self.save_templates(source.load_templates())
+        self.save_week_states(source.load_week_states())
+        self.save_audit_events(source.load_audit_events())
+        self.replace_shifts(source.all_shifts())
+        logger.info(f"Migrated {source.name} data into {self.path}")
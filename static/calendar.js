@@ -764,7 +764,7 @@ function saveShift() {
     const method = isUpdate ? 'PUT' : 'POST';
     
     // Send request
-    fetch(url, {
+    fetchConfirmingWarnings(url, {
         method: method,
         headers: {
             'Content-Type': 'application/json'
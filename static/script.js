@@ -79,4 +79,86 @@ document.addEventListener('DOMContentLoaded', function() {
 jQuery.expr[':'].contains = function(a, i, m) {
     return jQuery(a).text().toUpperCase()
         .indexOf(m[3].toUpperCase()) >= 0;
-}; 
\ No newline at end of file
+}; 
+// Call onChange({kind: version}) when shifts, templates or caregivers are
+// written by anyone, this tab included (pushed by /api/events). Bursts of
+// writes are coalesced into one call. After a reconnect, kinds written
+// while the stream was down are reported too.
+function subscribeToChanges(kinds, onChange) {
+    if (!window.EventSource) {
+        return null;
+    }
+    const source = new EventSource(`/api/events?kinds=${kinds.join(',')}`);
+    let known = null;
+    let pending = {};
+    let timer = null;
+
+    function schedule(changed) {
+        Object.assign(pending, changed);
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            const batch = pending;
+            pending = {};
+            onChange(batch);
+        }, 300);
+    }
+
+    source.addEventListener('versions', event => {
+        const versions = JSON.parse(event.data);
+        if (known) {
+            const missed = {};
+            for (const [kind, version] of Object.entries(versions)) {
+                if (known[kind] !== version) {
+                    missed[kind] = version;
+                }
+            }
+            if (Object.keys(missed).length) {
+                schedule(missed);
+            }
+        }
+        known = versions;
+    });
+    source.addEventListener('change', event => {
+        const changed = JSON.parse(event.data);
+        Object.assign(known, changed);
+        schedule(changed);
+    });
+    return source;
+}
+
+// Rebuild a template <select> from /api/templates, keeping its first
+// (placeholder) option and the current selection if it still exists.
+function refreshTemplateOptions(select) {
+    return fetch('/api/templates')
+        .then(response => response.json())
+        .then(templates => {
+            const selected = select.value;
+            select.length = 1;
+            templates.forEach(template => {
+                select.add(new Option(template.name, template.id));
+            });
+            select.value = templates.some(t => String(t.id) === selected) ? selected : '';
+        })
+        .catch(error => console.error('Error refreshing templates:', error));
+}
+
+// Send a shift write (a save, a week replace or a template apply). If the
+// server rejects it (409) for a double booking or for exceeding a
+// caregiver's max hours, ask before resending it with the matching
+// allow_overlap=1 / allow_overtime=1 flags. Declining rejects with the
+// server's message.
+function fetchConfirmingWarnings(url, options) {
+    return fetch(url, options).then(response => {
+        if (response.status !== 409) return response;
+        return response.json().then(data => {
+            if (!confirm(`${data.error}\n\nSave anyway?`)) {
+                throw new Error(data.error);
+            }
+            const flags = [];
+            if (data.conflicts && data.conflicts.length) flags.push('allow_overlap=1');
+            if (data.violations && data.violations.length) flags.push('allow_overtime=1');
+            const separator = url.includes('?') ? '&' : '?';
+            return fetch(`${url}${separator}${flags.join('&')}`, options);
+        });
+    });
+}
@@ -0,0 +1,719 @@
+"""
+Data access helpers for the JSON files in data/.
+
+Every data file is parsed once per process and kept in memory together with
+the stat stamp (inode, mtime, size) it was read at. A read only costs a
+stat() while nothing changes; when another worker rewrites the file the
+stamp no longer matches and the file is parsed again. Writes made through
+write_json() refresh the cached copy directly.
+
+Files are replaced atomically (temp file + rename), so a crash mid-write
+never leaves a truncated file behind, and readers never see a partial file:
+they take no locks and always parse a complete snapshot.
+
+Writers serialize on a FileLock (fcntl.flock on a lock file in the data
+directory), which covers every gunicorn worker as well as every thread.
+Routes that read, modify and write hold the backend's lock for the whole
+sequence (see JsonBackend.locked), so concurrent edits cannot lose updates.
+
+Collections that change one record at a time (shifts) use JournaledStore:
+single-record mutations are appended to a journal and folded into the
+snapshot file once the journal grows past a threshold.
+
+JsonBackend bundles all of this behind the storage backend interface shared
+with sqlite_backend.SqliteBackend; app.py picks one via STORAGE_BACKEND.
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import notifier
+from audit_log import AuditLog
+from hours_rollup import HoursRollup
+from interval_index import CaregiverIntervalIndex
+from shift_changes import ShiftChangeIndex, change_records, classify, sync_floor
+from shift_index import ShiftIndex, ceil_minutes, floor_minutes
+
+logger = logging.getLogger(__name__)
+
+# path -> (stamp, decoded value)
+_cache = {}
+_lock = threading.RLock()
+
+
+def file_stamp(path):
+    """Return an (inode, mtime_ns, size) tuple for path, or None if missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def clone(value):
+    """Copy decoded JSON data so callers can mutate it without touching the cache."""
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    return value
+
+
+def _load(path):
+    """Return the cached (stamp, value) entry for path, re-reading it if stale."""
+    stamp = file_stamp(path)
+    if stamp is None:
+        return None
+    entry = _cache.get(path)
+    if entry is not None and entry[0] == stamp:
+        return entry
+    with _lock:
+        with open(path, 'r') as f:
+            st = os.fstat(f.fileno())
+            value = json.load(f)
+        metrics.record_io(os.path.basename(path), read=st.st_size)
+        entry = ((st.st_ino, st.st_mtime_ns, st.st_size), value)
+        _cache[path] = entry
+        logger.debug(f"Parsed {path} into cache")
+        return entry
+
+
+def read_json(path, default=None):
+    """
+    Return a private copy of the decoded contents of path.
+    Returns default when the file does not exist.
+    """
+    entry = _load(path)
+    if entry is None:
+        return clone(default)
+    return clone(entry[1])
+
+
+def read_json_shared(path, default=None):
+    """
+    Return the cached decoded contents of path without copying.
+    Callers must treat the result as read-only.
+    """
+    entry = _load(path)
+    if entry is None:
+        return default
+    return entry[1]
+
+
+def atomic_write(path, text, durable=True):
+    """
+    Replace path with text via a temp file and rename; returns the new stamp.
+    durable=False skips the fsync for small files that can be rebuilt.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    stamp = file_stamp(path)
+    metrics.record_io(os.path.basename(path), written=stamp[2])
+    return stamp
+
+
+def encode_json(value, indent=None):
+    """JSON text for a data file: compact unless an indent is given."""
+    if indent is None:
+        return json.dumps(value, separators=(',', ':'))
+    return json.dumps(value, indent=indent)
+
+
+def write_json(path, value, indent=None, durable=True):
+    """Write value to path as JSON and refresh the cached copy."""
+    with _lock:
+        stamp = atomic_write(path, encode_json(value, indent), durable=durable)
+        _cache[path] = (stamp, clone(value))
+
+
+def invalidate():
+    """Drop every cached file, so the next reads parse them again (benchmarks time cold reads)."""
+    with _lock:
+        _cache.clear()
+
+
+class FileLock:
+    """
+    Exclusive lock shared by the threads of this process and by other
+    processes, via fcntl.flock on path. Re-entrant: a thread holding it can
+    enter it again, so locked methods can call each other.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            # Closing the file releases the flock
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+# Compact the journal into the snapshot once it holds this many mutations
+# or grows past this many bytes.
+JOURNAL_MAX_ENTRIES = 1000
+JOURNAL_MAX_BYTES = 1024 * 1024
+
+
+class JournaledStore:
+    """
+    A collection of JSON records keyed by id, persisted as a snapshot file
+    (a JSON list, the format the data files have always had) plus an
+    append-only journal of single-record mutations, one JSON object per line:
+
+        {"op": "put", "record": {...}}
+        {"op": "delete", "key": "42"}
+        {"op": "batch", "ops": [...]}
+
+    A mutation costs one O(1) append. A write touching several records is
+    journaled as one batch line, so other processes replaying the journal
+    apply it entirely or not at all. When the journal passes max_entries or
+    max_bytes it is compacted: the snapshot is rewritten atomically and the
+    journal removed. Loading reads the snapshot and replays the journal;
+    both operations are idempotent, so a crash between the snapshot rename
+    and the journal removal loses nothing.
+
+    When journal=False every mutation rewrites the snapshot instead.
+
+    Writes and compactions hold writer_lock (a FileLock, by default next to
+    the snapshot), so processes append and compact one at a time and
+    refresh before applying, never writing from a stale copy. Writes,
+    replays and reads all hold the in-process lock while they touch the
+    records or the views, which are changed in place: a reader in one
+    thread never sees a write half applied by another (see reading()).
+
+    Views (objects with reset(records), put(old, new) and delete(old)
+    methods) are kept in sync with the records as they change, including
+    changes appended by other processes, which are picked up by replaying
+    only the new tail of the journal.
+    """
+
+    def __init__(self, path, journal_path, key='id', journal=True,
+                 max_entries=JOURNAL_MAX_ENTRIES, max_bytes=JOURNAL_MAX_BYTES, writer_lock=None, indent=None):
+        self.path = path
+        self.indent = indent
+        self.journal_path = journal_path
+        self.key = key
+        self.journal = journal
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._records = {}
+        self._views = []
+        self._loaded = False
+        self._snapshot_stamp = None
+        self._journal_stamp = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+        # Always taken before _lock
+        self.writer_lock = writer_lock or FileLock(path + '.lock')
+
+    def add_view(self, view):
+        with self._lock:
+            self._views.append(view)
+            if self._loaded:
+                view.reset(self._records.values())
+
+    def refresh(self):
+        """Bring the in-memory records up to date with the files on disk."""
+        snapshot_stamp = file_stamp(self.path)
+        journal_stamp = file_stamp(self.journal_path)
+        if (self._loaded and snapshot_stamp == self._snapshot_stamp
+                and journal_stamp == self._journal_stamp):
+            return
+        with self._lock:
+            if (not self._loaded or snapshot_stamp != self._snapshot_stamp or journal_stamp is None
+                    or (self._journal_stamp is not None and journal_stamp[0] != self._journal_stamp[0])
+                    or journal_stamp[2] < self._journal_offset):
+                self._reload()
+            else:
+                self._replay_journal()
+
+    @contextmanager
+    def reading(self):
+        """
+        Bring the records up to date and hold the in-process lock, so the
+        views can be queried without a writer thread changing them midway.
+        """
+        with self._lock:
+            self.refresh()
+            yield
+
+    def records(self):
+        """Return a copy of the current id -> record mapping (the records are shared, read-only)."""
+        with self.reading():
+            return dict(self._records)
+
+    def get(self, key):
+        """Return the record with this key (shared, read-only), or None."""
+        with self.reading():
+            return self._records.get(str(key))
+
+    def write(self, puts=(), deletes=()):
+        """Delete the given keys, then insert or replace the given records."""
+        ops = [{'op': 'delete', 'key': str(k)} for k in deletes]
+        ops += [{'op': 'put', 'record': clone(r)} for r in puts]
+        if not ops:
+            return
+        with self.writer_lock, self._lock:
+            self.refresh()
+            for op in ops:
+                self._apply(op)
+            if not self.journal:
+                self._write_snapshot()
+                return
+            entry = ops[0] if len(ops) == 1 else {'op': 'batch', 'ops': ops}
+            data = (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+            fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+            metrics.record_io(os.path.basename(self.journal_path), written=len(data))
+            self._journal_entries += 1
+            # Nobody else can have appended since the refresh above
+            self._journal_offset = st.st_size
+            self._journal_stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if self._journal_entries >= self.max_entries or st.st_size >= self.max_bytes:
+                self.compact()
+
+    def replace_all(self, records):
+        """Replace every record and write a fresh snapshot."""
+        with self.writer_lock, self._lock:
+            self._records = {str(r[self.key]): clone(r) for r in records}
+            self._loaded = True
+            for view in self._views:
+                view.reset(self._records.values())
+            self._write_snapshot()
+
+    def compact(self):
+        """Fold the journal into the snapshot."""
+        with self.writer_lock, self._lock:
+            self.refresh()
+            self._write_snapshot()
+            logger.info(f"Compacted {self.journal_path} into {self.path}")
+
+    def _write_snapshot(self):
+        self._snapshot_stamp = atomic_write(self.path, encode_json(list(self._records.values()), self.indent))
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_stamp = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def _reload(self):
+        records = {}
+        stamp = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                st = os.fstat(f.fileno())
+                for record in json.load(f):
+                    records[str(record[self.key])] = record
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            metrics.record_io(os.path.basename(self.path), read=st.st_size)
+        self._records = records
+        self._snapshot_stamp = stamp
+        self._journal_stamp = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._replay_journal(notify=False)
+        self._loaded = True
+        for view in self._views:
+            view.reset(self._records.values())
+
+    def _replay_journal(self, notify=True):
+        """Apply journal lines appended since the last read."""
+        try:
+            f = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            self._journal_stamp = None
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            f.seek(self._journal_offset)
+            data = f.read()
+        metrics.record_io(os.path.basename(self.journal_path), read=len(data))
+        # Only consume complete lines; a torn final line is retried later
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                op = json.loads(line)
+            except ValueError:
+                logger.error(f"Skipping corrupt journal entry in {self.journal_path}: {line[:200]!r}")
+                continue
+            self._apply(op, notify=notify)
+            self._journal_entries += 1
+        self._journal_offset += end
+        self._journal_stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _apply(self, op, notify=True):
+        if op['op'] == 'put':
+            record = op['record']
+            key = str(record[self.key])
+            old = self._records.get(key)
+            self._records[key] = record
+            if notify:
+                for view in self._views:
+                    view.put(old, record)
+        elif op['op'] == 'delete':
+            old = self._records.pop(str(op['key']), None)
+            if old is not None and notify:
+                for view in self._views:
+                    view.delete(old)
+        elif op['op'] == 'batch':
+            for inner in op['ops']:
+                self._apply(inner, notify=notify)
+
+
+class DataVersions:
+    """
+    Change counters per kind of data ('shifts', 'caregivers', ...), kept in
+    a small JSON file shared by all workers:
+
+        {"shifts": {"version": 12, "modified": 1718000000.5}, ...}
+
+    Every save bumps the counter of the kind it wrote, after the data itself
+    is written, and publishes the new counters (see notifier.py). Reading
+    the counters costs a stat() while nothing changes, which is what lets
+    read APIs answer conditional requests without loading the data.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = FileLock(path + '.lock')
+
+    def get(self, kinds):
+        """Return (versions of the kinds, latest modified time or None)."""
+        data = read_json_shared(self.path, {})
+        entries = [data.get(kind, {}) for kind in kinds]
+        modified = [e['modified'] for e in entries if 'modified' in e]
+        return tuple(e.get('version', 0) for e in entries), max(modified, default=None)
+
+    def bump(self, *kinds):
+        with self._lock:
+            data = read_json(self.path, {})
+            now = time.time()
+            for kind in kinds:
+                entry = data.setdefault(kind, {})
+                entry['version'] = entry.get('version', 0) + 1
+                entry['modified'] = now
+            # Not fsynced: like the shift journal, the counters only need
+            # to survive a process crash, not a power loss
+            write_json(self.path, data, durable=False)
+            notifier.publish({kind: data[kind]['version'] for kind in kinds})
+
+
+class JsonBackend:
+    """
+    Storage backend on the JSON files in data/ (the default).
+
+    Shifts live in a JournaledStore with ShiftIndex, HoursRollup and
+    CaregiverIntervalIndex views for range queries, worked-hours totals and
+    overlap checks, and their change records (see shift_changes) in a
+    second JournaledStore; audit events in an append-only AuditLog;
+    everything else is a cached JSON file. Every write holds the writer lock, a
+    FileLock on writer.lock in the data directory.
+    """
+
+    name = 'json'
+
+    def __init__(self, caregivers_file, shifts_file, shifts_journal_file, templates_file,
+                 week_states_file, audit_log_dir, legacy_audit_events_file=None, journal=True,
+                 versions_file=None, indent=None, changes_file=None, changes_journal_file=None):
+        # Indent of the JSON data files; None writes them compactly
+        self.indent = indent
+        self.files = {
+            'caregivers': caregivers_file,
+            'shifts': shifts_file,
+            'templates': templates_file,
+            'week_states': week_states_file
+        }
+        self.writer_lock = FileLock(os.path.join(os.path.dirname(shifts_file), 'writer.lock'))
+        self.shifts = JournaledStore(shifts_file, shifts_journal_file, journal=journal, writer_lock=self.writer_lock,
+                                     indent=indent)
+        self.shift_index = ShiftIndex()
+        self.shifts.add_view(self.shift_index)
+        self.hours = HoursRollup()
+        self.shifts.add_view(self.hours)
+        self.intervals = CaregiverIntervalIndex()
+        self.shifts.add_view(self.intervals)
+        changes_file = changes_file or os.path.join(os.path.dirname(shifts_file), 'shift_changes.json')
+        self.changes = JournaledStore(changes_file, changes_journal_file or os.path.splitext(changes_file)[0] + '.journal',
+                                      journal=journal, writer_lock=self.writer_lock, indent=indent)
+        self.change_index = ShiftChangeIndex()
+        self.changes.add_view(self.change_index)
+        self.audit_log = AuditLog(audit_log_dir, legacy_file=legacy_audit_events_file)
+        self.versions = DataVersions(versions_file or os.path.join(os.path.dirname(shifts_file), 'versions.json'))
+
+    def has(self, kind):
+        """True if the data file for this kind (e.g. 'caregivers') exists."""
+        if kind == 'audit_events':
+            return self.audit_log.exists()
+        return os.path.exists(self.files[kind])
+
+    def data_version(self, *kinds):
+        """(change counters of the given kinds, latest modification time or None)."""
+        return self.versions.get(kinds)
+
+    def locked(self):
+        """
+        The writer lock, for callers that read, modify and write: holding it
+        keeps every other thread and worker from writing in between.
+        """
+        return self.writer_lock
+
+    def preload(self):
+        """Load the shift store and its views now rather than on the first request."""
+        self.shifts.refresh()
+
+    def record_counts(self):
+        """{kind: number of records} for the data kinds, for the /metrics gauges."""
+        return {
+            'caregivers': len(read_json_shared(self.files['caregivers'], [])),
+            'shifts': len(self.shifts.records()),
+            'templates': len(read_json_shared(self.files['templates'], [])),
+            'week_states': len(read_json_shared(self.files['week_states'], {})),
+            'audit_events': self.audit_log.count()
+        }
+
+    # Caregivers
+
+    def load_caregivers(self):
+        return read_json(self.files['caregivers'], [])
+
+    def save_caregivers(self, caregivers):
+        with self.writer_lock:
+            write_json(self.files['caregivers'], caregivers, self.indent)
+            self.versions.bump('caregivers')
+
+    # Templates
+
+    def load_templates(self):
+        return read_json(self.files['templates'], [])
+
+    def save_templates(self, templates):
+        with self.writer_lock:
+            write_json(self.files['templates'], templates, self.indent)
+            self.versions.bump('templates')
+
+    # Week states
+
+    def load_week_states(self):
+        return read_json(self.files['week_states'], {})
+
+    def save_week_states(self, states):
+        with self.writer_lock:
+            write_json(self.files['week_states'], states, self.indent)
+            self.versions.bump('week_states')
+
+    def get_week_state(self, week_start):
+        return clone(read_json_shared(self.files['week_states'], {}).get(week_start))
+
+    def set_week_state(self, week_start, state):
+        with self.writer_lock:
+            states = self.load_week_states()
+            states[week_start] = state
+            self.save_week_states(states)
+
+    def delete_week_state(self, week_start):
+        with self.writer_lock:
+            states = self.load_week_states()
+            if week_start not in states:
+                return False
+            del states[week_start]
+            self.save_week_states(states)
+            return True
+
+    # Audit events
+
+    def load_audit_events(self):
+        return [clone(e) for e in self.audit_log.read_all()]
+
+    def save_audit_events(self, events):
+        self.audit_log.replace_all(events)
+
+    def append_audit_event(self, event_type, user, details):
+        return self.audit_log.append(event_type, user, details)
+
+    def query_audit_events(self, start=None, end=None, event_type=None):
+        """Events with start <= timestamp <= end (datetimes) and the given type, newest first."""
+        return [clone(e) for e in self.audit_log.query(start, end, event_type)]
+
+    def query_audit_page(self, start=None, end=None, event_type=None, limit=100, before=None, after=None):
+        """One page of query_audit_events(); see AuditLog.query_page."""
+        page = self.audit_log.query_page(start, end, event_type, limit, before, after)
+        page['events'] = [clone(e) for e in page['events']]
+        return page
+
+    # Shifts
+
+    def get_shift(self, shift_id):
+        shift = self.shifts.get(shift_id)
+        return dict(shift) if shift is not None else None
+
+    def all_shifts(self):
+        return [dict(s) for s in self.shifts.records().values()]
+
+    def shift_times_in_range(self, start, end, caregiver_id=None):
+        """
+        (start_minutes, end_minutes, shift) for shifts starting within
+        [start, end], by start; only one caregiver's if caregiver_id is given.
+        """
+        with self.shifts.reading():
+            rows = self.shift_index.range_with_times(start, end)
+            if caregiver_id is not None:
+                rows = [row for row in rows if str(row[2]['caregiver_id']) == str(caregiver_id)]
+            return [(s, e, dict(shift)) for s, e, shift in rows]
+
+    def shifts_in_range(self, start, end):
+        """Shifts starting within [start, end], ordered by start."""
+        with self.shifts.reading():
+            return [dict(s) for s in self.shift_index.range(start, end)]
+
+    def shifts_page(self, start, end, limit, after=None):
+        """
+        One page of shifts_in_range(), ordered by (start, id): up to limit
+        shifts after the (start_minutes, id) key `after`. Returns (shifts,
+        key of the last shift, or None if no shifts follow).
+        """
+        with self.shifts.reading():
+            rows = self.shift_index.page(start, end, limit + 1, after)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        last = (rows[-1][0], str(rows[-1][1]['id'])) if more else None
+        return [dict(shift) for _, shift in rows], last
+
+    def shift_changes_since(self, since=None):
+        """
+        Delta sync: {version, inserted, updated, deleted} for the shift
+        writes after sequence number since (see shift_changes.classify), or
+        None if those changes are no longer known. Without since, only the
+        current version.
+        """
+        with self.changes.reading():
+            version = self.change_index.max_seq
+            if since is None:
+                since = version
+            if not sync_floor(version) <= since <= version:
+                return None
+            changes = self.change_index.since(since)
+        rows = []
+        for change in changes:
+            shift = self.shifts.get(change['id'])
+            rows.append((change, dict(shift) if shift is not None else None))
+        return classify(since, version, rows)
+
+    def shift_ids_for_caregiver(self, caregiver_id):
+        return [s['id'] for s in self.shifts.records().values() if str(s['caregiver_id']) == str(caregiver_id)]
+
+    def max_shift_id(self):
+        with self.shifts.reading():
+            return self.shift_index.max_id
+
+    def hours_by_week(self, first_week, last_week):
+        """{caregiver id: {week: minutes}} for weeks in [first_week, last_week] (see hours_rollup)."""
+        with self.shifts.reading():
+            return self.hours.by_week(first_week, last_week)
+
+    def hours_by_day(self, first_day, last_day):
+        """{caregiver id: {day ordinal: minutes}} for days in [first_day, last_day]."""
+        with self.shifts.reading():
+            return self.hours.by_day(first_day, last_day)
+
+    def week_minutes(self, pairs):
+        """{(caregiver id, week): minutes worked} for the given (caregiver id, week) pairs."""
+        with self.shifts.reading():
+            return {(cid, week): self.hours.week_minutes(cid, week) for cid, week in pairs}
+
+    def overlapping_shifts(self, caregiver_id, start, end):
+        """This caregiver's shifts overlapping [start, end) (ordinal minutes)."""
+        with self.shifts.reading():
+            return [dict(s) for s in self.intervals.overlapping(caregiver_id, start, end)]
+
+    def shift_conflicts(self, start, end):
+        """Overlapping (earlier, later) pairs of one caregiver's shifts, the later starting within [start, end]."""
+        with self.shifts.reading():
+            return [(dict(a), dict(b)) for a, b in self.intervals.conflicts(ceil_minutes(start), floor_minutes(end))]
+
+    def _write_shifts(self, puts, deletes, replace=False):
+        """
+        Write shifts and their change records, under the writer lock. The
+        change records follow the shifts, so a reader that sees a change
+        always finds the shift in the state it describes, or a later one.
+        """
+        self.shifts.refresh()
+        self.changes.refresh()
+        seq = self.change_index.max_seq + 1
+        changes = change_records(seq, puts, deletes, self.shifts.get, self.changes.get)
+        if replace:
+            self.shifts.replace_all(puts)
+        else:
+            self.shifts.write(puts=puts, deletes=deletes)
+        self.changes.write(puts=changes, deletes=self.change_index.expired(sync_floor(seq)))
+        self.versions.bump('shifts')
+
+    def write_shifts(self, puts=(), deletes=()):
+        """Delete the given shift ids, then insert or replace the given shifts."""
+        with self.writer_lock:
+            self._write_shifts(puts, deletes)
+
+    def replace_shift_range(self, start, end, plan):
+        """
+        Swap the shifts starting within [start, end] in one write.
+        plan(existing, next_id) gets the shifts currently in the range and the
+        next free numeric id and returns (puts, deletes); it runs under the
+        writer lock so the range cannot change in between. Returns (puts, deletes).
+        """
+        with self.writer_lock:
+            existing = self.shifts_in_range(start, end)
+            puts, deletes = plan(existing, self.shift_index.max_id + 1)
+            self._write_shifts(puts, deletes)
+        return puts, deletes
+
+    def replace_shifts(self, shifts):
+        with self.writer_lock:
+            keep = {str(s['id']) for s in shifts}
+            self._write_shifts(shifts, [k for k in self.shifts.records() if k not in keep], replace=True)
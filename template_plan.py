@@ -0,0 +1,117 @@
+"""
+Compiled weekly templates.
+
+A template is compiled once into an offset table: for every template
+shift, its start and end as minutes from the start of the week (day
+offset plus the shift definition's start/end minute). Applying the
+template to N weeks is then integer addition per shift per week, with no
+day-name normalisation or time parsing in the loop.
+
+Compiled tables are cached per template id and reused until the template
+is saved again (or its shifts differ from the ones that were compiled,
+which also covers saves made by other worker processes).
+"""
+from shift_index import MINUTES_PER_DAY, format_minutes
+
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _clock_minutes(value):
+    hour, minute = value.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def shift_offsets(shift_definitions):
+    """
+    {shift type: (start, end)} in minutes from the start of the shift's
+    day. Shifts whose end is not after their start cross midnight, so
+    their end is on the next day.
+    """
+    offsets = {}
+    for name, definition in shift_definitions.items():
+        start, end = _clock_minutes(definition['start']), _clock_minutes(definition['end'])
+        if end <= start:
+            end += MINUTES_PER_DAY
+        offsets[name] = (start, end)
+    return offsets
+
+
+class CompiledTemplate:
+    """Offset table of a template: (start offset, end offset, caregiver_id, shift_type) per shift."""
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: e[0])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def expand(self, week_start, num_weeks, first_id):
+        """
+        Shifts for num_weeks consecutive weeks starting at week_start
+        (ordinal minutes), with ids counting up from first_id.
+        """
+        shifts = []
+        times = {}
+        shift_id = first_id
+        for week in range(num_weeks):
+            base = week_start + week * MINUTES_PER_WEEK
+            for start_offset, end_offset, caregiver_id, shift_type in self.entries:
+                start, end = base + start_offset, base + end_offset
+                # Each distinct minute is formatted once per expansion
+                start_text = times.get(start)
+                if start_text is None:
+                    start_text = times[start] = format_minutes(start)
+                end_text = times.get(end)
+                if end_text is None:
+                    end_text = times[end] = format_minutes(end)
+                shifts.append({
+                    'id': str(shift_id),
+                    'caregiver_id': caregiver_id,
+                    'shift_type': shift_type,
+                    'start': start_text,
+                    'end': end_text
+                })
+                shift_id += 1
+        return shifts
+
+
+def compile_template(template, shift_definitions, normalize_day):
+    """
+    Build the offset table for a template. normalize_day maps a template
+    day value to 0 (Monday) - 6 (Sunday). Raises ValueError on bad data.
+    """
+    clock = shift_offsets(shift_definitions)
+    entries = []
+    for template_shift in template.get('shifts', []):
+        day = normalize_day(template_shift['day'])
+        if template_shift['shift_type'] not in clock:
+            raise ValueError(f"Invalid shift type: {template_shift['shift_type']}")
+        start, end = clock[template_shift['shift_type']]
+        offset = day * MINUTES_PER_DAY
+        entries.append((offset + start, offset + end, template_shift['caregiver_id'], template_shift['shift_type']))
+    return CompiledTemplate(entries)
+
+
+class TemplateCache:
+    """Compiled templates by template id."""
+
+    def __init__(self, shift_definitions, normalize_day):
+        self.shift_definitions = shift_definitions
+        self.normalize_day = normalize_day
+        # template id -> (shifts the table was compiled from, CompiledTemplate)
+        self._compiled = {}
+
+    def get(self, template):
+        key = str(template['id'])
+        cached = self._compiled.get(key)
+        if cached is not None and cached[0] == template.get('shifts', []):
+            return cached[1]
+        compiled = compile_template(template, self.shift_definitions, self.normalize_day)
+        self._compiled[key] = (template.get('shifts', []), compiled)
+        return compiled
+
+    def invalidate(self, template_id=None):
+        if template_id is None:
+            self._compiled.clear()
+        else:
+            self._compiled.pop(str(template_id), None)